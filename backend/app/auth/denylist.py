@@ -0,0 +1,57 @@
+"""
+In-memory denylist of revoked login sessions.
+
+Access tokens carry the id of their session (`sid`) and are checked without a
+database query, so revoking a session in the database alone would leave its
+access tokens working until they expire. Revoked session ids are kept here
+for ACCESS_TOKEN_EXPIRE_MINUTES, after which every access token issued for
+them has expired anyway, and published to the other workers. A restarted
+worker starts with an empty list.
+"""
+
+import time
+from typing import Dict, Optional
+
+from ..cluster import cluster_client
+from ..config import settings
+
+
+class SessionDenylist:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        # session id -> monotonic expiry, oldest first
+        self._revoked: Dict[int, float] = {}
+        self.revocations = 0
+
+    def revoke(self, session_id: int):
+        """Deny a session here and on the other workers"""
+        self.deny(session_id)
+        cluster_client.publish("session_revoked", {"session_id": session_id})
+
+    def deny(self, session_id: int):
+        """Deny a session on this worker"""
+        now = time.monotonic()
+        # Entries share one TTL, so insertion order is expiry order
+        while self._revoked:
+            oldest, expires_at = next(iter(self._revoked.items()))
+            if expires_at > now:
+                break
+            del self._revoked[oldest]
+        self._revoked.pop(session_id, None)
+        self._revoked[session_id] = now + self.ttl_seconds
+        self.revocations += 1
+
+    def is_revoked(self, session_id: Optional[int]) -> bool:
+        expires_at = self._revoked.get(session_id)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def get_stats(self) -> dict:
+        return {"revoked_sessions": len(self._revoked), "revocations": self.revocations}
+
+
+session_denylist = SessionDenylist(ttl_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+cluster_client.on(
+    "session_revoked",
+    lambda frame: session_denylist.deny(frame["data"]["session_id"]),
+)
@@ -8,8 +8,9 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from ..config import settings
-from ..database import get_db
+from ..database import get_db, get_read_db_for
 from ..models.user import User
+from .denylist import session_denylist
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -38,6 +39,17 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def decode_access_token(token: str) -> dict:
+    """
+    The claims of a valid access token. Raises jwt.JWTError when the token is
+    invalid or expired, or its session has been revoked.
+    """
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    if session_denylist.is_revoked(payload.get("sid")):
+        raise jwt.JWTError("Session revoked")
+    return payload
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
 ):
@@ -47,9 +59,7 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -66,3 +76,8 @@ def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+def get_read_db(current_user: User = Depends(get_current_user)):
+    """Read-only session for the current user (replica unless they just wrote)"""
+    yield from get_read_db_for(current_user.id)
@@ -1,8 +1,226 @@
-from authlib.integrations.starlette_client import OAuth
+"""
+Google OAuth client.
+
+authlib opens a new httpx client, and with it new connections, for every call
+to the provider, and loads the discovery document and JWKS on first use and
+keeps them forever. Here every call goes through one pooled transport with
+keepalive and timeouts (`oauth_http`), and both documents come from
+`provider_documents`, a TTL cache that is filled at startup and refreshed in
+the background, so a login never waits for them.
+
+GOOGLE_DISCOVERY_URL can point at another OpenID provider, such as the stub
+in benchmarks/oauth_stub.py for offline testing.
+
+authlib keeps the state and nonce of a login in the session between the
+redirect to the provider and the callback. OAuthSessionMiddleware provides
+that session on those two routes only, so no other request pays for it.
+"""
+
+import asyncio
 import secrets
 import string
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+from authlib.integrations.starlette_client import OAuth, StarletteOAuth2App
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from ..config import settings
+from ..logger import init_logger
+
+logger = init_logger(__name__)
+
+
+class OAuthHTTP:
+    """
+    The connection pool and shared client for calls to OAuth providers,
+    created on first use and closed by the app lifespan.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+
+    @staticmethod
+    def timeout() -> httpx.Timeout:
+        return httpx.Timeout(
+            settings.OAUTH_HTTP_TIMEOUT_SECONDS,
+            connect=min(5.0, settings.OAUTH_HTTP_TIMEOUT_SECONDS),
+        )
+
+    @property
+    def transport(self) -> httpx.AsyncHTTPTransport:
+        if self._transport is None:
+            self._transport = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=settings.OAUTH_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OAUTH_HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.OAUTH_HTTP_KEEPALIVE_SECONDS,
+                ),
+                # Retries failed connection attempts only, never sent requests
+                retries=1,
+            )
+        return self._transport
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(transport=self.transport, timeout=self.timeout())
+        return self._client
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+        elif self._transport is not None:
+            await self._transport.aclose()
+        self._client = self._transport = None
+
+
+class _BorrowedTransport(httpx.AsyncBaseTransport):
+    """
+    Lends the shared pool to the clients authlib creates per call; closing
+    one of them leaves the pool open.
+    """
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await oauth_http.transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+
+class ProviderDocuments:
+    """
+    JSON documents of OAuth providers (discovery metadata, JWKS) by URL, kept
+    for `ttl_seconds`.
+
+    An expired document is still returned while a background refresh replaces
+    it, and kept when the refresh fails, so only the very first fetch of a
+    URL is waited on. Concurrent fetches of one URL share a single request.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        # url -> (monotonic expiry, document)
+        self._documents: Dict[str, Tuple[float, dict]] = {}
+        self._fetches: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    async def get(self, url: str, force: bool = False) -> dict:
+        """The document at `url`; with `force`, freshly fetched"""
+        cached = self._documents.get(url)
+        if cached is not None and not force:
+            expires_at, document = cached
+            if time.monotonic() < expires_at:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._fetch(url)
+            return document
+        return await asyncio.shield(self._fetch(url))
+
+    def _fetch(self, url: str) -> asyncio.Task:
+        task = self._fetches.get(url)
+        if task is None:
+            task = asyncio.create_task(self._load(url))
+            self._fetches[url] = task
+            task.add_done_callback(lambda _: self._fetches.pop(url, None))
+        return task
+
+    async def _load(self, url: str) -> dict:
+        self.fetches += 1
+        try:
+            response = await oauth_http.client.get(url)
+            response.raise_for_status()
+            document = response.json()
+        except Exception as e:
+            self.fetch_errors += 1
+            logger.warning("Fetching %s failed: %s", url, e)
+            cached = self._documents.get(url)
+            if cached is None:
+                raise
+            return cached[1]
+        self._documents[url] = (time.monotonic() + self.ttl_seconds, document)
+        return document
+
+    async def prefetch(self, metadata_url: str):
+        """Load a discovery document and the JWKS it names, logging failures"""
+        try:
+            metadata = await self.get(metadata_url)
+            if metadata.get("jwks_uri"):
+                await self.get(metadata["jwks_uri"])
+        except Exception as e:
+            logger.warning("Could not prefetch OAuth provider documents: %s", e)
+
+    def get_stats(self) -> dict:
+        return {
+            "documents": len(self._documents),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+        }
+
+
+class PooledOAuth2App(StarletteOAuth2App):
+    """
+    authlib's Starlette OAuth 2 app, with provider calls on the shared pool
+    and provider documents from `provider_documents`.
+    """
+
+    def _get_oauth_client(self, **metadata):
+        metadata.update(transport=_BorrowedTransport(), timeout=OAuthHTTP.timeout())
+        return super()._get_oauth_client(**metadata)
+
+    async def load_server_metadata(self):
+        if not self._server_metadata_url:
+            return self.server_metadata
+        document = await provider_documents.get(self._server_metadata_url)
+        return {**self.server_metadata, **document}
+
+    async def fetch_jwk_set(self, force=False):
+        # authlib forces a refetch when an ID token does not verify with the
+        # cached keys, which is how key rotation is picked up
+        metadata = await self.load_server_metadata()
+        if not metadata.get("jwks_uri"):
+            raise RuntimeError('Missing "jwks_uri" in metadata')
+        return await provider_documents.get(metadata["jwks_uri"], force=force)
+
+
+class OAuthSessionMiddleware:
+    """
+    Starlette's SessionMiddleware, applied only to the OAuth login and
+    callback routes. The cookie is scoped to /auth and expires after
+    OAUTH_STATE_MAX_AGE_SECONDS, so browsers do not send it with API calls or
+    WebSocket upgrades either.
+    """
+
+    paths = ("/auth/login/", "/auth/google/callback")
+
+    def __init__(self, app: ASGIApp, secret_key: str):
+        self.app = app
+        self.session_app = SessionMiddleware(
+            app,
+            secret_key=secret_key,
+            session_cookie="oauth_state",
+            max_age=settings.OAUTH_STATE_MAX_AGE_SECONDS,
+            path="/auth",
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["path"].startswith(self.paths):
+            await self.session_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+oauth_http = OAuthHTTP()
+provider_documents = ProviderDocuments(settings.OAUTH_METADATA_TTL_SECONDS)
 
 oauth = OAuth()
 
@@ -11,8 +229,9 @@ oauth.register(
     name="google",
     client_id=settings.GOOGLE_CLIENT_ID,
     client_secret=settings.GOOGLE_CLIENT_SECRET,
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
+    server_metadata_url=settings.GOOGLE_DISCOVERY_URL,
     client_kwargs={"scope": "openid email profile"},
+    client_cls=PooledOAuth2App,
 )
 
 
@@ -0,0 +1,164 @@
+"""
+Login sessions with rotating refresh tokens.
+
+Every login starts a session: a row in refresh_tokens and a refresh token
+"<session id>.<secret>" for the client, of which only the SHA-256 of the
+secret is stored. Access tokens name their session in the `sid` claim.
+
+POST /auth/refresh trades a refresh token for a new access token and a new
+refresh token, replacing the stored hash, so each refresh token works once.
+The replaced token of a live session showing up again means it was copied,
+so the session is revoked for both holders. Two refreshes racing with the
+same token look the same way; clients refresh one at a time. Any other
+unknown secret is only rejected: session ids appear in access tokens, so
+revoking on a guessed secret would let anyone log a user out.
+
+Logins that end in a redirect (Google) hand the browser a one-time login
+code instead of tokens, as URLs end up in histories and logs: the refresh
+token of a session that expires within OAUTH_LOGIN_CODE_SECONDS unless it
+is refreshed, which is how the frontend redeems it.
+"""
+
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.refresh_token import RefreshToken
+from ..models.user import User
+from .denylist import session_denylist
+from .jwt import create_access_token
+
+
+class InvalidRefreshToken(Exception):
+    pass
+
+
+class RefreshTokenReused(InvalidRefreshToken):
+    """A replaced refresh token was presented; its session is now revoked"""
+
+
+def _new_secret() -> Tuple[str, bytes]:
+    secret = secrets.token_urlsafe(32)
+    return secret, hashlib.sha256(secret.encode()).digest()
+
+
+def _parse(refresh_token: str) -> Tuple[int, bytes]:
+    session_id, _, secret = refresh_token.partition(".")
+    if not session_id.isdigit() or not secret:
+        raise InvalidRefreshToken()
+    return int(session_id), hashlib.sha256(secret.encode()).digest()
+
+
+def _expiry(lifetime: Optional[timedelta] = None) -> datetime:
+    if lifetime is None:
+        lifetime = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    return datetime.now(timezone.utc) + lifetime
+
+
+def _tokens(user_id: int, username: str, session_id: int, secret: str) -> dict:
+    access_token = create_access_token(
+        data={"sub": username, "uid": user_id, "sid": session_id},
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": f"{session_id}.{secret}",
+        "token_type": "bearer",
+        "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+def _insert_session(db: Session, user: User, expires_at: datetime) -> Tuple[int, str]:
+    session_id = secrets.randbits(63)
+    secret, token_hash = _new_secret()
+    # Sessions that ran out without a logout are dropped on the user's next login
+    db.execute(
+        delete(RefreshToken).where(
+            RefreshToken.user_id == user.id, RefreshToken.expires_at <= func.now()
+        )
+    )
+    db.execute(
+        insert(RefreshToken).values(
+            id=session_id, user_id=user.id, token_hash=token_hash, expires_at=expires_at
+        )
+    )
+    db.commit()
+    return session_id, secret
+
+
+def start_session(db: Session, user: User) -> dict:
+    """Start a session for a user who just logged in; returns both tokens"""
+    session_id, secret = _insert_session(db, user, _expiry())
+    return _tokens(user.id, user.username, session_id, secret)
+
+
+def start_login_code(db: Session, user: User) -> str:
+    """Start a session for a user who just logged in; returns its one-time login code"""
+    session_id, secret = _insert_session(
+        db, user, _expiry(timedelta(seconds=settings.OAUTH_LOGIN_CODE_SECONDS))
+    )
+    return f"{session_id}.{secret}"
+
+
+def refresh_session(db: Session, refresh_token: str) -> dict:
+    """
+    Rotate a session's refresh token and issue a new access token, in one
+    statement. Raises InvalidRefreshToken, or RefreshTokenReused after
+    revoking the session when the token it replaced last is presented.
+    """
+    session_id, token_hash = _parse(refresh_token)
+    secret, new_hash = _new_secret()
+    row = db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.id == session_id,
+            RefreshToken.token_hash == token_hash,
+            RefreshToken.expires_at > func.now(),
+            User.id == RefreshToken.user_id,
+            User.is_active.is_(True),
+        )
+        .values(
+            previous_hash=RefreshToken.token_hash, token_hash=new_hash, expires_at=_expiry()
+        )
+        .returning(User.id, User.username)
+    ).first()
+    db.commit()
+    if row is not None:
+        return _tokens(row.id, row.username, session_id, secret)
+
+    previous_hash = db.execute(
+        select(RefreshToken.previous_hash).where(
+            RefreshToken.id == session_id, RefreshToken.expires_at > func.now()
+        )
+    ).scalar()
+    if previous_hash is not None and hmac.compare_digest(previous_hash, token_hash):
+        revoke_session(db, session_id)
+        raise RefreshTokenReused()
+    raise InvalidRefreshToken()
+
+
+def revoke_session(db: Session, session_id: int):
+    """End a session: its refresh token stops working, its access tokens too"""
+    db.execute(delete(RefreshToken).where(RefreshToken.id == session_id))
+    db.commit()
+    session_denylist.revoke(session_id)
+
+
+def end_session(db: Session, refresh_token: str):
+    """Log out the session of a current refresh token"""
+    session_id, token_hash = _parse(refresh_token)
+    ended = db.execute(
+        delete(RefreshToken)
+        .where(RefreshToken.id == session_id, RefreshToken.token_hash == token_hash)
+        .returning(RefreshToken.id)
+    ).first()
+    db.commit()
+    if ended is None:
+        raise InvalidRefreshToken()
+    session_denylist.revoke(session_id)
@@ -0,0 +1,226 @@
+"""
+Worker side of the local IPC channel used in multi-worker mode.
+
+`python -m app.serve` runs a hub in the launcher process, listening on a Unix
+socket, and each worker keeps one connection to it. Frames are JSON lines:
+
+* ``status``: a user came online or went offline on this worker. The hub keeps
+  the user -> workers map and broadcasts a ``status`` frame to every worker
+  (including the sender) when the user's cluster-wide state changes.
+* ``deliver``: send a WebSocket frame to a user connected to another worker.
+* ``deliver_many``: send one pre-encoded frame to many users (group fan-out).
+  The hub splits the user list by worker, so each worker gets one frame.
+* ``publish``: fan a ``topic``/``data`` event out to every other worker, e.g.
+  to keep per-process caches in step.
+
+Writes never wait for the peer. Instead the unsent bytes per connection are
+bounded by CLUSTER_MAX_BUFFER_BYTES: the hub disconnects a worker that falls
+that far behind, and a worker reconnects when the hub does. Frames in flight
+are lost, and the worker re-announces its users and gets a fresh snapshot.
+
+With a single process (plain ``uvicorn app.main:app``) the client is never
+started and every call here is a cheap no-op.
+"""
+
+import asyncio
+import inspect
+import json
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from .config import settings
+from .logger import init_logger
+
+logger = init_logger(__name__)
+
+# Upper bound for one frame; message content can be large
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+RECONNECT_DELAY_SECONDS = 1.0
+# Coroutine handlers running at once before the read loop waits for one
+MAX_PENDING_HANDLERS = 10000
+
+
+def encode_frame(frame: dict) -> bytes:
+    return json.dumps(frame, separators=(",", ":"), default=str).encode() + b"\n"
+
+
+class ClusterClient:
+    """
+    Connection from one worker to the cluster hub.
+
+    Must be used from the event loop thread. Sends are buffered writes on the
+    Unix socket and never wait; if the hub is unreachable they are dropped.
+    When more than `max_buffer_bytes` are waiting for the hub the connection
+    is dropped too. The client reconnects in the background, re-announcing
+    its users.
+
+    Coroutine handlers run as tasks, started in frame order, so a slow one
+    (say a WebSocket send to a slow client) does not hold up the frames
+    behind it.
+    """
+
+    def __init__(self, max_buffer_bytes: int = settings.CLUSTER_MAX_BUFFER_BYTES):
+        self.max_buffer_bytes = max_buffer_bytes
+        self.worker_id: Optional[str] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        # {op or publish topic: [handler]}; handlers may be coroutines
+        self.handlers: Dict[str, List[Callable[[dict], Any]]] = {}
+        # Users connected to this worker, and to any worker as reported by the hub
+        self.local_users: Set[int] = set()
+        self.online_users: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._handler_tasks: Set[asyncio.Task] = set()
+
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.writer is not None
+
+    def on(self, op: str, handler: Callable[[dict], Any]):
+        """Register a handler for hub frames of an op, or for a publish topic"""
+        self.handlers.setdefault(op, []).append(handler)
+
+    async def start(self, path: str, worker_id: str):
+        self.worker_id = worker_id
+        connected = asyncio.Event()
+        self._task = asyncio.create_task(self._run(path, connected))
+        # Serve only once the hub knows about us (or after a short grace period)
+        try:
+            await asyncio.wait_for(connected.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("Cluster hub at %s not reachable yet", path)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    async def _run(self, path: str, connected: asyncio.Event):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(path, limit=MAX_FRAME_BYTES)
+            except OSError as e:
+                logger.warning("Cannot connect to cluster hub: %s", e)
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+                continue
+
+            self.writer = writer
+            self._send({"op": "hello", "worker": self.worker_id, "users": list(self.local_users)})
+            connected.set()
+            logger.info("Worker %s joined the cluster", self.worker_id)
+            try:
+                while line := await reader.readline():
+                    self.frames_received += 1
+                    await self._dispatch(json.loads(line))
+            except (OSError, ValueError) as e:
+                logger.warning("Lost connection to cluster hub: %s", e)
+            finally:
+                self.writer = None
+                writer.close()
+                # Remote state is unknown until the next snapshot
+                self.online_users = set(self.local_users)
+
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    async def _dispatch(self, frame: dict):
+        op = frame["op"]
+        if op == "snapshot":
+            self.online_users = set(frame["online"]) | self.local_users
+            return
+        if op == "status":
+            if frame["online"]:
+                self.online_users.add(frame["user_id"])
+            else:
+                self.online_users.discard(frame["user_id"])
+
+        key = frame["topic"] if op == "publish" else op
+        for handler in self.handlers.get(key, ()):
+            try:
+                result = handler(frame)
+            except Exception as e:
+                logger.error("Cluster handler for %s failed: %s", key, e)
+                continue
+            if inspect.isawaitable(result):
+                if len(self._handler_tasks) >= MAX_PENDING_HANDLERS:
+                    await asyncio.wait(self._handler_tasks, return_when=asyncio.FIRST_COMPLETED)
+                task = asyncio.ensure_future(result)
+                self._handler_tasks.add(task)
+                task.add_done_callback(partial(self._handler_done, key))
+
+    def _handler_done(self, key: str, task: asyncio.Task):
+        self._handler_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Cluster handler for %s failed: %s", key, task.exception())
+
+    def _send(self, frame: dict) -> bool:
+        if self.writer is None:
+            return False
+        if self.writer.transport.get_write_buffer_size() > self.max_buffer_bytes:
+            # The hub is not keeping up. Reconnecting re-announces our users,
+            # so status stays right even though this frame is lost
+            logger.warning("Cluster hub is %s bytes behind, reconnecting", self.max_buffer_bytes)
+            self.writer.transport.abort()
+            self.writer = None
+            self.frames_dropped += 1
+            return False
+        self.writer.write(encode_frame(frame))
+        self.frames_sent += 1
+        return True
+
+    def set_local_status(self, user_id: int, online: bool) -> bool:
+        """
+        Record a local connect/disconnect and report it to the hub.
+        Returns False when not clustered, in which case the caller should
+        notify its own listeners.
+        """
+        if online:
+            self.local_users.add(user_id)
+        else:
+            self.local_users.discard(user_id)
+        return self._send({"op": "status", "user_id": user_id, "online": online})
+
+    def deliver(self, user_id: int, message: dict) -> bool:
+        """Forward a frame to a user connected to another worker"""
+        if user_id not in self.online_users or user_id in self.local_users:
+            return False
+        return self._send({"op": "deliver", "user_id": user_id, "message": message})
+
+    def deliver_many(self, user_ids: Iterable[int], text: str) -> bool:
+        """Forward an encoded frame to whichever of the users are on other workers"""
+        remote = [
+            user_id
+            for user_id in user_ids
+            if user_id in self.online_users and user_id not in self.local_users
+        ]
+        if not remote:
+            return False
+        return self._send({"op": "deliver_many", "user_ids": remote, "text": text})
+
+    def publish(self, topic: str, data: dict) -> bool:
+        """Send an event to every other worker"""
+        return self._send({"op": "publish", "topic": topic, "data": data})
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "worker_id": self.worker_id,
+            "local_users": len(self.local_users),
+            "online_users": len(self.online_users),
+            "frames_sent": self.frames_sent,
+            "frames_received": self.frames_received,
+            "frames_dropped": self.frames_dropped,
+            "pending_handlers": len(self._handler_tasks),
+            "reconnects": self.reconnects,
+        }
+
+
+# Global cluster client, started by the app lifespan when CLUSTER_SOCKET_PATH is set
+cluster_client = ClusterClient()
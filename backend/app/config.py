@@ -13,9 +13,80 @@ class Settings:
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "postgres")
     DB_NAME: str = os.getenv("DB_NAME", "chatapp")
 
+    # Optional read replicas (comma-separated SQLAlchemy URLs). Reads stay on the
+    # primary for REPLICA_STICKY_SECONDS after a user writes, and a replica that
+    # fails is skipped for REPLICA_RETRY_SECONDS.
+    DB_REPLICA_URLS: list[str] = [
+        url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()
+    ]
+    REPLICA_STICKY_SECONDS: float = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+    REPLICA_RETRY_SECONDS: float = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+    REPLICA_MAX_TRACKED_USERS: int = int(os.getenv("REPLICA_MAX_TRACKED_USERS", "100000"))
+
+    # direct_messages partitioning and archival
+    PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS: float = float(
+        os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "21600")
+    )
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "archive")
+
+    # Recent message cache: newest messages kept per conversation, and the total
+    # memory budget across conversations
+    MESSAGE_CACHE_SIZE: int = int(os.getenv("MESSAGE_CACHE_SIZE", "50"))
+    MESSAGE_CACHE_MAX_BYTES: int = int(
+        os.getenv("MESSAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+    )
+
+    # Message size policy: content over MESSAGE_MAX_BYTES (UTF-8) is rejected, and
+    # direct messages over MESSAGE_INLINE_MAX_BYTES are stored compressed in
+    # message_bodies with only the first MESSAGE_PREVIEW_CHARS characters inline
+    MESSAGE_MAX_BYTES: int = int(os.getenv("MESSAGE_MAX_BYTES", str(256 * 1024)))
+    MESSAGE_INLINE_MAX_BYTES: int = int(os.getenv("MESSAGE_INLINE_MAX_BYTES", "4096"))
+    MESSAGE_PREVIEW_CHARS: int = int(os.getenv("MESSAGE_PREVIEW_CHARS", "500"))
+
+    # Attachments: ATTACHMENT_STORE is "local" (files under ATTACHMENT_DIR) or
+    # "module:Class" for another AttachmentStore. With ATTACHMENT_ACCEL_REDIRECT_PREFIX
+    # set, downloads are handed to a fronting nginx via X-Accel-Redirect
+    # (<prefix><store path>), which serves them with sendfile.
+    ATTACHMENT_STORE: str = os.getenv("ATTACHMENT_STORE", "local")
+    ATTACHMENT_DIR: str = os.getenv("ATTACHMENT_DIR", "attachments")
+    ATTACHMENT_MAX_BYTES: int = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+    ATTACHMENT_ACCEL_REDIRECT_PREFIX: str = os.getenv("ATTACHMENT_ACCEL_REDIRECT_PREFIX", "")
+
+    # Delta sync (GET /sync): most changed messages returned per call
+    SYNC_MAX_MESSAGES: int = int(os.getenv("SYNC_MAX_MESSAGES", "500"))
+
+    # Group channels: member lists cached per worker (number of groups)
+    GROUP_MEMBER_CACHE_SIZE: int = int(os.getenv("GROUP_MEMBER_CACHE_SIZE", "10000"))
+
+    # Database profiling
+    SLOW_QUERY_THRESHOLD_MS: float = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+    # Warn when one request runs the same statement this many times (likely N+1)
+    REPEATED_QUERY_THRESHOLD: int = int(os.getenv("REPEATED_QUERY_THRESHOLD", "10"))
+    # Debug only: add X-DB-Query-Count / X-DB-Query-Time-Ms response headers
+    DB_PROFILE_HEADERS: bool = os.getenv("DB_PROFILE_HEADERS", "false").lower() == "true"
+
+    # Multi-worker mode (python -m app.serve). The launcher sets the hub socket
+    # path and worker id for its workers; leave them unset for a single process.
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    CLUSTER_SOCKET_PATH: str = os.getenv("CLUSTER_SOCKET_PATH", "")
+    CLUSTER_WORKER_ID: str = os.getenv("CLUSTER_WORKER_ID", str(os.getpid()))
+    # Unsent bytes allowed per hub connection: the hub disconnects a worker that
+    # falls this far behind, and a worker drops frames while the hub does
+    CLUSTER_MAX_BUFFER_BYTES: int = int(os.getenv("CLUSTER_MAX_BUFFER_BYTES", str(64 * 1024 * 1024)))
+
+    # Logging: LOG_FORMAT is "json" or "text"; LOG_LEVELS and LOG_SAMPLE_RATES take
+    # comma-separated "logger=value" pairs, e.g. "app.routers.websocket_manager=0.1"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    # A login session (and its refresh token) ends after this long without a refresh
+    REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
     # OAuth2 settings for Google
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "")
@@ -23,9 +94,45 @@ class Settings:
     GOOGLE_REDIRECT_URI: str = os.getenv(
         "GOOGLE_REDIRECT_URI", "http://localhost:8000/auth/google/callback"
     )
+    GOOGLE_DISCOVERY_URL: str = os.getenv(
+        "GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration"
+    )
+    # Pooled client for calls to the OAuth provider, and how long its discovery
+    # document and JWKS are cached (they are prefetched at startup)
+    OAUTH_HTTP_TIMEOUT_SECONDS: float = float(os.getenv("OAUTH_HTTP_TIMEOUT_SECONDS", "10"))
+    OAUTH_HTTP_MAX_CONNECTIONS: int = int(os.getenv("OAUTH_HTTP_MAX_CONNECTIONS", "20"))
+    OAUTH_HTTP_KEEPALIVE_SECONDS: float = float(os.getenv("OAUTH_HTTP_KEEPALIVE_SECONDS", "60"))
+    OAUTH_METADATA_TTL_SECONDS: float = float(os.getenv("OAUTH_METADATA_TTL_SECONDS", "3600"))
+    # Lifetime of the cookie holding a login's OAuth state between the redirect
+    # to the provider and the callback
+    OAUTH_STATE_MAX_AGE_SECONDS: int = int(os.getenv("OAUTH_STATE_MAX_AGE_SECONDS", "600"))
+    # Lifetime of the one-time code the callback hands the frontend for its tokens
+    OAUTH_LOGIN_CODE_SECONDS: int = int(os.getenv("OAUTH_LOGIN_CODE_SECONDS", "60"))
 
     FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
+    # WebSocket heartbeat settings
+    WS_PING_INTERVAL_SECONDS: float = float(os.getenv("WS_PING_INTERVAL_SECONDS", "25"))
+    WS_PING_TIMEOUT_SECONDS: float = float(os.getenv("WS_PING_TIMEOUT_SECONDS", "20"))
+
+    # Minimum interval between ephemeral events (e.g. typing) per sender/receiver pair
+    TYPING_DEBOUNCE_SECONDS: float = float(os.getenv("TYPING_DEBOUNCE_SECONDS", "2"))
+
+    # Presence subscriptions
+    PRESENCE_BATCH_INTERVAL_SECONDS: float = float(
+        os.getenv("PRESENCE_BATCH_INTERVAL_SECONDS", "1")
+    )
+    PRESENCE_MAX_SUBSCRIPTIONS: int = int(os.getenv("PRESENCE_MAX_SUBSCRIPTIONS", "500"))
+
+    # Message send rate limiting (per user, token bucket)
+    RATE_LIMIT_MESSAGES_PER_SECOND: float = float(
+        os.getenv("RATE_LIMIT_MESSAGES_PER_SECOND", "5")
+    )
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", "20"))
+    RATE_LIMIT_MAX_TRACKED_USERS: int = int(
+        os.getenv("RATE_LIMIT_MAX_TRACKED_USERS", "100000")
+    )
+
     # Gemini API Configuration
     GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -1,8 +1,14 @@
+import itertools
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
+from typing import Dict, List, Optional
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from .config import settings
 from .logger import init_logger
@@ -13,8 +19,18 @@ SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.DB_USER}:{settings.DB_PASSWOR
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
+# Shares the pool with `engine`, for single-statement writes that need no
+# explicit transaction (saves the BEGIN/COMMIT round-trips)
+autocommit_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# pool_pre_ping turns a dead replica connection into an OperationalError at
+# checkout, before any statement of the request has run
+replica_engines = [
+    create_engine(url, pool_pre_ping=True) for url in settings.DB_REPLICA_URLS
+]
+
 Base = declarative_base()
 
 
@@ -27,6 +43,138 @@ def get_db():
         db.close()
 
 
+class ReadRouter:
+    """
+    Picks the engine for read-only sessions.
+
+    Replicas are used round-robin, except for users who wrote within the last
+    `sticky_seconds` (so they always see their own writes despite replication
+    lag) and for replicas that recently failed, which are skipped for
+    `retry_seconds`. With no healthy replica, reads go to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: List[Engine],
+        sticky_seconds: float,
+        retry_seconds: float,
+        max_tracked_users: int,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.max_tracked_users = max_tracked_users
+        # user_id -> monotonic deadline, oldest write first
+        self.recent_writes: "OrderedDict[int, float]" = OrderedDict()
+        self.unhealthy_until: Dict[Engine, float] = {}
+        self._next = itertools.cycle(replicas)
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0
+
+    def record_write(self, *user_ids: int):
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        deadline = now + self.sticky_seconds
+        for user_id in user_ids:
+            self.recent_writes[user_id] = deadline
+            self.recent_writes.move_to_end(user_id)
+        # Deadlines grow with insertion order, so expired entries are at the front
+        while self.recent_writes:
+            user_id, oldest = next(iter(self.recent_writes.items()))
+            if oldest > now and len(self.recent_writes) <= self.max_tracked_users:
+                break
+            self.recent_writes.popitem(last=False)
+
+    def is_sticky(self, user_id: Optional[int]) -> bool:
+        deadline = self.recent_writes.get(user_id)
+        return deadline is not None and deadline > time.monotonic()
+
+    def choose(self, user_id: Optional[int]) -> Optional[Engine]:
+        """Return a healthy replica for this user, or None for the primary"""
+        if not self.replicas or self.is_sticky(user_id):
+            return None
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            replica = next(self._next)
+            if self.unhealthy_until.get(replica, 0) <= now:
+                return replica
+        return None
+
+    def mark_unhealthy(self, replica: Engine, error: Exception):
+        if replica is self.primary:
+            return
+        logger.warning(
+            "Replica %s unavailable, using the primary for %ss: %s",
+            replica.url.render_as_string(hide_password=True),
+            self.retry_seconds,
+            error,
+        )
+        self.unhealthy_until[replica] = time.monotonic() + self.retry_seconds
+
+    def open_session(self, user_id: Optional[int]) -> Session:
+        replica = self.choose(user_id)
+        if replica is not None:
+            db = SessionLocal(bind=replica)
+            try:
+                db.connection()
+                self.replica_reads += 1
+                return db
+            except OperationalError as e:
+                db.close()
+                self.mark_unhealthy(replica, e)
+                self.fallbacks += 1
+        self.primary_reads += 1
+        return SessionLocal()
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.replicas),
+            "healthy_replicas": sum(
+                1 for r in self.replicas if self.unhealthy_until.get(r, 0) <= now
+            ),
+            "sticky_users": len(self.recent_writes),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks,
+        }
+
+
+read_router = ReadRouter(
+    engine,
+    replica_engines,
+    sticky_seconds=settings.REPLICA_STICKY_SECONDS,
+    retry_seconds=settings.REPLICA_RETRY_SECONDS,
+    max_tracked_users=settings.REPLICA_MAX_TRACKED_USERS,
+)
+
+
+def get_read_db_for(user_id: Optional[int]):
+    """
+    Read-only session for `user_id`, on a replica when one can serve it.
+
+    Only for endpoints that do not write; see `auth.jwt.get_read_db` for the
+    dependency bound to the current user.
+
+    A replica that fails the connection check is replaced by the primary
+    before the session is handed out. One that fails mid-request is marked
+    unhealthy so later requests skip it, but the error still fails the
+    current request; the read is not retried on the primary.
+    """
+    db = read_router.open_session(user_id)
+    try:
+        yield db
+    except OperationalError as e:
+        read_router.mark_unhealthy(db.get_bind(), e)
+        raise
+    finally:
+        db.close()
+
+
 # Context manager for manual database operations
 @contextmanager
 def get_db_context():
@@ -39,7 +187,7 @@ def get_db_context():
         yield db
         db.commit()
     except Exception as e:
-        logger.error(f"Database transaction failed: {str(e)}")
+        logger.error("Database transaction failed: %s", e)
         db.rollback()
         raise
     finally:
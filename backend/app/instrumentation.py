@@ -0,0 +1,183 @@
+import re
+import time
+from collections import Counter as StatementCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+from .logger import init_logger
+from .metrics import (
+    CallbackGauge,
+    current_handler,
+    db_query_duration,
+    http_request_duration,
+    registry,
+)
+
+logger = init_logger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class QueryProfile:
+    """Database statements executed on behalf of one request or WebSocket frame"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total_time = 0.0
+        self.statements: StatementCounter = StatementCounter()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total_time += elapsed
+        self.statements[statement] += 1
+
+    def repeated_statements(self, threshold: int):
+        """Statements run at least `threshold` times, the usual N+1 signature"""
+        return [(stmt, n) for stmt, n in self.statements.items() if n >= threshold]
+
+
+_query_profile: ContextVar[Optional[QueryProfile]] = ContextVar("query_profile", default=None)
+
+
+@contextmanager
+def profile_queries(name: str = "adhoc") -> Iterator[QueryProfile]:
+    """
+    Attribute all statements executed in this context to a QueryProfile.
+    Also usable in tests, e.g. to assert a page is served with a fixed number of queries.
+    """
+    profile = QueryProfile(name)
+    token = _query_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _query_profile.reset(token)
+        for statement, count in profile.repeated_statements(settings.REPEATED_QUERY_THRESHOLD):
+            logger.warning(
+                "Possible N+1 in %s: statement ran %s times: %s",
+                name,
+                count,
+                _compact(statement),
+            )
+
+
+def _compact(statement: str, limit: int = 500) -> str:
+    return _WHITESPACE_RE.sub(" ", statement).strip()[:limit]
+
+
+def parameters_shape(parameters):
+    """Describe bound parameters by name and type only, never by value"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"{len(parameters)} x {parameters_shape(parameters[0])}"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request latency per route template and
+    profiling the database statements each request runs.
+
+    The route is resolved up front so that the handler name is already set in
+    `current_handler` when dependencies and the endpoint run their queries.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _resolve_route(self, scope: Scope):
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._resolve_route(scope)
+        route_path = getattr(route, "path", "unmatched")
+        handler = getattr(route, "name", "unmatched")
+        token = current_handler.set(handler)
+        status_code = 500
+        started = time.perf_counter()
+
+        with profile_queries(handler) as profile:
+
+            async def send_wrapper(message: Message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    if settings.DB_PROFILE_HEADERS:
+                        message.setdefault("headers", [])
+                        message["headers"] = [
+                            *message["headers"],
+                            (b"x-db-query-count", str(profile.count).encode()),
+                            (b"x-db-query-time-ms", f"{profile.total_time * 1000:.2f}".encode()),
+                        ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                http_request_duration.labels(scope["method"], route_path, status_code).observe(
+                    time.perf_counter() - started
+                )
+                current_handler.reset(token)
+
+
+def instrument_engine(engine: Engine, pool_gauges: bool = True):
+    """
+    Time every statement per handler, attribute it to the current QueryProfile,
+    log slow statements, and (for the primary) expose connection pool gauges.
+    """
+    slow_threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        handler = current_handler.get()
+        db_query_duration.labels(handler).observe(elapsed)
+
+        profile = _query_profile.get()
+        if profile is not None:
+            profile.record(statement, elapsed)
+
+        if elapsed >= slow_threshold:
+            logger.warning(
+                "Slow query (%.1f ms) in %s: %s params=%s",
+                elapsed * 1000,
+                handler,
+                _compact(statement),
+                parameters_shape(parameters),
+            )
+
+    if not pool_gauges:
+        return
+
+    pool = engine.pool
+    registry.register(
+        CallbackGauge("db_pool_size", "Configured connection pool size", pool.size)
+    )
+    registry.register(
+        CallbackGauge("db_pool_checked_out", "Connections currently in use", pool.checkedout)
+    )
+    registry.register(
+        CallbackGauge("db_pool_overflow", "Connections opened beyond the pool size", pool.overflow)
+    )
@@ -1,19 +1,161 @@
+"""Process-wide logging setup.
+
+Every logger under ``app`` shares one ``QueueHandler``: records are put on an
+in-memory queue by the caller and a ``QueueListener`` thread does the
+formatting and the stderr writes, so logging never blocks the event loop.
+Messages should use lazy ``%``-style arguments (``logger.info("x %s", x)``);
+they are only rendered on the listener thread, and not at all when the record
+is filtered out by level or sampling.
+
+Configuration (see ``Settings``):
+
+* ``LOG_FORMAT``: ``json`` (one object per line) or ``text``.
+* ``LOG_LEVEL``: level for the ``app`` loggers; ``LOG_LEVELS`` overrides it per
+  module, e.g. ``app.routers.websocket_manager=WARNING``.
+* ``LOG_SAMPLE_RATES``: keep only a fraction of INFO-and-below records for
+  noisy modules, e.g. ``app.routers.websocket_manager=0.1``. Warnings and
+  errors are never sampled.
+"""
+
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
 import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
 
+from .config import settings
 
-def init_logger(name):
-    console_formatter = logging.Formatter(
-        "[%(asctime)s] [%(name)s] [%(levelname)s] - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
+ROOT_LOGGER = "app"
+
+# Attributes every LogRecord has; anything else was passed via ``extra=``.
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drops a share of low-severity records from the configured loggers.
+
+    The longest matching logger prefix wins, so ``app.routers=0.5`` can be
+    refined by ``app.routers.websocket_manager=0.1``.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: Dict[str, float] = {}
+
+    def rate_for(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            best = -1
+            for prefix, value in self.rates.items():
+                matches = name == prefix or name.startswith(prefix + ".")
+                if matches and len(prefix) > best:
+                    rate, best = value, len(prefix)
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the message on the calling thread; keep the
+    # record as-is so the listener thread does the work. Arguments are passed
+    # along unrendered, so they must not be mutated after the log call.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    pairs = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+def configure_logging():
+    """Install the queue handler and start the listener (idempotent)."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    if settings.LOG_FORMAT.lower() == "text":
+        formatter = logging.Formatter(
+            "[%(asctime)s] [%(name)s] [%(levelname)s] - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+    else:
+        formatter = JSONFormatter()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    queue_handler = _queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+    sample_rates = _parse_pairs(settings.LOG_SAMPLE_RATES)
+    rates = {name: float(rate) for name, rate in sample_rates.items()}
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    app_logger = logging.getLogger(ROOT_LOGGER)
+    app_logger.setLevel(settings.LOG_LEVEL.upper())
+    app_logger.addHandler(queue_handler)
+    app_logger.propagate = False
+    for name, level in _parse_pairs(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(
+        queue_handler.queue, stream_handler, respect_handler_level=True
     )
+    _listener.start()
+    atexit.register(shutdown_logging)
 
-    console_handler = logging.StreamHandler(sys.stderr)
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(console_formatter)
 
-    logger = logging.getLogger(name)
-    logger.addHandler(console_handler)
-    logger.setLevel(logging.INFO)
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
+
+def init_logger(name):
+    configure_logging()
+    logger = logging.getLogger(name)
+    if name != ROOT_LOGGER and not name.startswith(ROOT_LOGGER + "."):
+        # Scripts run as __main__ still go through the shared pipeline
+        logger.setLevel(settings.LOG_LEVEL.upper())
+        if _queue_handler not in logger.handlers:
+            logger.addHandler(_queue_handler)
+        logger.propagate = False
     return logger
@@ -1,18 +1,65 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.sessions import SessionMiddleware
 
+from .auth.oauth import OAuthSessionMiddleware, oauth_http, provider_documents
+from .cluster import cluster_client
 from .config import settings
-from .database import Base, engine
+from .database import engine, replica_engines
+from .instrumentation import MetricsMiddleware, instrument_engine
 from .logger import init_logger
-from .routers import auth, direct_message, health, users, websocket_routes, ai_summarizer
+from .routers import (
+    ai_summarizer,
+    attachments,
+    auth,
+    direct_message,
+    groups,
+    health,
+    sync,
+    users,
+    websocket_routes,
+)
+from .routers.presence_manager import presence_service
+from .routers.websocket_manager import connection_manager
+from .services.partitions import run_partition_maintenance
 
 logger = init_logger(__name__)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+instrument_engine(engine)
+for replica in replica_engines:
+    instrument_engine(replica, pool_gauges=False)
+
+# The schema is managed by `python -m app.migrations upgrade`; importing the app
+# runs no DDL and opens no database connection
+
 
-app = FastAPI(title="FastAPI Chat")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Join the other workers when launched by `python -m app.serve`
+    if settings.CLUSTER_SOCKET_PATH:
+        await cluster_client.start(settings.CLUSTER_SOCKET_PATH, settings.CLUSTER_WORKER_ID)
+
+    # Start background tasks
+    tasks = [
+        asyncio.create_task(connection_manager.run_heartbeat()),
+        asyncio.create_task(presence_service.run()),
+        asyncio.create_task(run_partition_maintenance()),
+    ]
+    # Load the provider documents before the first login needs them
+    if settings.GOOGLE_CLIENT_ID:
+        tasks.append(
+            asyncio.create_task(provider_documents.prefetch(settings.GOOGLE_DISCOVERY_URL))
+        )
+    yield
+    for task in tasks:
+        task.cancel()
+    await cluster_client.stop()
+    await oauth_http.stop()
+
+
+app = FastAPI(title="FastAPI Chat", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,8 +69,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add SessionMiddleware for OAuth flows
-app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
+# Session (for the OAuth state) on the OAuth login routes only
+app.add_middleware(OAuthSessionMiddleware, secret_key=settings.SECRET_KEY)
+
+# Outermost, so the latency covers the whole middleware stack
+app.add_middleware(MetricsMiddleware)
 
 # Mount routers
 app.include_router(health.router, tags=["health"])
@@ -35,6 +85,9 @@ app.include_router(
 app.include_router(
     websocket_routes.router, prefix="/direct-messages", tags=["websockets"]
 )
+app.include_router(groups.router, prefix="/groups", tags=["groups"])
+app.include_router(attachments.router, prefix="/attachments", tags=["attachments"])
+app.include_router(sync.router, prefix="/sync", tags=["sync"])
 app.include_router(ai_summarizer.router, prefix="/ai", tags=["ai"])
 
 
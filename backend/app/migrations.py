@@ -0,0 +1,330 @@
+"""
+Schema migrations, run as an explicit deployment step instead of at app import.
+
+Usage:
+    python -m app.migrations upgrade
+    python -m app.migrations status
+
+Applied versions are recorded in the schema_migrations table. `upgrade` holds a
+Postgres advisory lock for its whole transaction, so several workers or
+containers running it at once apply each migration exactly once. Every upgrade
+also creates the direct_messages partitions for the upcoming months.
+
+To add a migration, write a function taking a Connection and append it to
+MIGRATIONS with the next version number. Write its DDL out as SQL rather than
+creating tables from the models: a model describes the latest schema, so an
+older migration built from it would pick up columns and foreign keys that
+only later migrations add, and fail on a fresh database.
+"""
+
+import argparse
+from dataclasses import dataclass
+from typing import Callable, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from .database import engine
+from .logger import init_logger
+from .models.direct_message import CHANGE_XID
+from .services.message_content import offload_large_messages
+from .services.partitions import SCHEMA_LOCK_ID, ensure_upcoming_partitions
+
+logger = init_logger(__name__)
+
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def execute_all(conn: Connection, *statements: str):
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+def initial_schema(conn: Connection):
+    # IF NOT EXISTS makes this a no-op on databases created by the old create_all
+    execute_all(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            email VARCHAR,
+            username VARCHAR,
+            hashed_password VARCHAR,
+            is_active BOOLEAN,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            auth_provider VARCHAR,
+            provider_user_id VARCHAR,
+            provider_access_token VARCHAR,
+            avatar_url VARCHAR,
+            full_name VARCHAR,
+            bio VARCHAR
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)",
+        "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+        # The partition key has to be part of the primary key
+        """
+        CREATE TABLE IF NOT EXISTS direct_messages (
+            id SERIAL NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            is_read BOOLEAN,
+            sender_id INTEGER REFERENCES users (id),
+            receiver_id INTEGER REFERENCES users (id),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_direct_messages_id ON direct_messages (id)",
+        "CREATE INDEX IF NOT EXISTS ix_direct_messages_sender_receiver_created "
+        "ON direct_messages (sender_id, receiver_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_direct_messages_receiver_created "
+        "ON direct_messages (receiver_id, created_at)",
+    )
+
+
+def group_channels(conn: Connection):
+    execute_all(
+        conn,
+        """
+        CREATE TABLE groups (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            created_by INTEGER REFERENCES users (id),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+        """,
+        "CREATE INDEX ix_groups_id ON groups (id)",
+        """
+        CREATE TABLE group_members (
+            group_id INTEGER NOT NULL REFERENCES groups (id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            joined_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            last_read_message_id INTEGER DEFAULT '0' NOT NULL,
+            PRIMARY KEY (group_id, user_id)
+        )
+        """,
+        "CREATE INDEX ix_group_members_user ON group_members (user_id)",
+        """
+        CREATE TABLE group_messages (
+            id SERIAL PRIMARY KEY,
+            group_id INTEGER NOT NULL REFERENCES groups (id) ON DELETE CASCADE,
+            sender_id INTEGER REFERENCES users (id),
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+        """,
+        "CREATE INDEX ix_group_messages_group_id ON group_messages (group_id, id)",
+    )
+
+
+def read_cursors(conn: Connection):
+    execute_all(
+        conn,
+        """
+        CREATE TABLE read_cursors (
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            peer_id INTEGER NOT NULL REFERENCES users (id),
+            last_read_message_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, peer_id)
+        )
+        """,
+        "CREATE INDEX ix_read_cursors_peer ON read_cursors (peer_id)",
+        # Builds the index on every partition
+        "CREATE INDEX IF NOT EXISTS ix_direct_messages_receiver_sender_id "
+        "ON direct_messages (receiver_id, sender_id, id)",
+    )
+
+    # Every conversation gets a cursor (new ones get theirs with their first
+    # message); with the old flags it covers everything up to the newest read
+    # message, so older messages still flagged unread count as read from now on
+    has_flags = conn.execute(
+        text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'direct_messages' AND column_name = 'is_read'"
+        )
+    ).scalar()
+    last_read = "COALESCE(MAX(id) FILTER (WHERE is_read), 0)" if has_flags else "0"
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO read_cursors (user_id, peer_id, last_read_message_id)
+            SELECT receiver_id, sender_id, {last_read}
+            FROM direct_messages
+            WHERE receiver_id IS NOT NULL AND sender_id IS NOT NULL
+            GROUP BY receiver_id, sender_id
+            """
+        )
+    )
+    if has_flags:
+        conn.execute(text("ALTER TABLE direct_messages DROP COLUMN is_read"))
+
+
+def message_bodies(conn: Connection):
+    conn.execute(
+        text(
+            "CREATE TABLE message_bodies (message_id INTEGER PRIMARY KEY, data BYTEA NOT NULL)"
+        )
+    )
+    # Bodies are compressed already; store them out of line without pglz
+    conn.execute(text("ALTER TABLE message_bodies ALTER COLUMN data SET STORAGE EXTERNAL"))
+    conn.execute(
+        text("ALTER TABLE direct_messages ADD COLUMN IF NOT EXISTS content_bytes INTEGER")
+    )
+    offload_large_messages(conn)
+
+
+def attachments(conn: Connection):
+    execute_all(
+        conn,
+        """
+        CREATE TABLE attachments (
+            id SERIAL PRIMARY KEY,
+            uploader_id INTEGER NOT NULL REFERENCES users (id),
+            sha256 VARCHAR(64) NOT NULL,
+            size BIGINT NOT NULL,
+            filename VARCHAR(255) NOT NULL,
+            content_type VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+        """,
+        "CREATE INDEX ix_attachments_id ON attachments (id)",
+        "CREATE INDEX ix_attachments_sha256 ON attachments (sha256)",
+        "CREATE INDEX ix_attachments_uploader ON attachments (uploader_id)",
+        "ALTER TABLE direct_messages ADD COLUMN IF NOT EXISTS attachment_id INTEGER "
+        "REFERENCES attachments (id)",
+        "CREATE INDEX IF NOT EXISTS ix_direct_messages_attachment "
+        "ON direct_messages (attachment_id) WHERE attachment_id IS NOT NULL",
+    )
+
+
+def change_tracking(conn: Connection):
+    # Added without a default and given one afterwards: a volatile default in
+    # ADD COLUMN would rewrite every partition. Existing rows keep NULL, which
+    # the partial indexes leave out; they predate every sync token anyway.
+    for table in ("direct_messages", "read_cursors"):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS change_xid BIGINT"))
+        conn.execute(
+            text(f"ALTER TABLE {table} ALTER COLUMN change_xid SET DEFAULT ({CHANGE_XID})")
+        )
+    execute_all(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_direct_messages_receiver_change "
+        "ON direct_messages (receiver_id, change_xid) WHERE change_xid IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_direct_messages_sender_change "
+        "ON direct_messages (sender_id, change_xid) WHERE change_xid IS NOT NULL",
+    )
+
+
+def refresh_tokens(conn: Connection):
+    execute_all(
+        conn,
+        """
+        CREATE TABLE refresh_tokens (
+            id BIGINT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            token_hash BYTEA NOT NULL,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+        )
+        """,
+        "CREATE INDEX ix_refresh_tokens_user ON refresh_tokens (user_id)",
+    )
+
+
+def previous_refresh_tokens(conn: Connection):
+    conn.execute(text("ALTER TABLE refresh_tokens ADD COLUMN IF NOT EXISTS previous_hash BYTEA"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "users and partitioned direct_messages", initial_schema),
+    Migration(2, "group channels with per-member read cursors", group_channels),
+    Migration(3, "read_cursors replacing direct_messages.is_read", read_cursors),
+    Migration(4, "message_bodies for large direct message content", message_bodies),
+    Migration(5, "attachments referenced by direct messages", attachments),
+    Migration(6, "change_xid tracking for delta sync", change_tracking),
+    Migration(7, "refresh_tokens for login sessions", refresh_tokens),
+    Migration(8, "refresh_tokens.previous_hash for reuse detection", previous_refresh_tokens),
+]
+
+
+def _ensure_migrations_table(conn: Connection):
+    conn.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """
+        )
+    )
+
+
+def applied_versions(conn: Connection) -> List[int]:
+    exists = conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar()
+    if not exists:
+        return []
+    rows = conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))
+    return list(rows.scalars())
+
+
+def upgrade(bind: Engine = engine) -> List[int]:
+    """Apply pending migrations and create upcoming partitions, returning the new versions"""
+    applied = []
+    with bind.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+        _ensure_migrations_table(conn)
+        done = set(applied_versions(conn))
+
+        for migration in MIGRATIONS:
+            if migration.version in done:
+                continue
+            logger.info("Applying migration %s: %s", migration.version, migration.description)
+            migration.apply(conn)
+            conn.execute(
+                text(
+                    "INSERT INTO schema_migrations (version, description) "
+                    "VALUES (:version, :description)"
+                ),
+                {"version": migration.version, "description": migration.description},
+            )
+            applied.append(migration.version)
+
+        ensure_upcoming_partitions(conn)
+
+    if not applied:
+        logger.info("Schema is up to date")
+    return applied
+
+
+def pending(bind: Engine = engine) -> List[Migration]:
+    with bind.connect() as conn:
+        done = set(applied_versions(conn))
+    return [migration for migration in MIGRATIONS if migration.version not in done]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the database schema")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("upgrade", help="Apply pending migrations")
+    subparsers.add_parser("status", help="List pending migrations")
+
+    args = parser.parse_args()
+    if args.command == "upgrade":
+        upgrade()
+    elif args.command == "status":
+        waiting = pending()
+        for migration in waiting:
+            print(f"pending {migration.version}: {migration.description}")
+        if not waiting:
+            print("up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy.sql import func
+
+from ..database import Base
+
+
+class Attachment(Base):
+    """
+    An uploaded file. The bytes live in the attachment store under their
+    SHA-256, so identical uploads share one stored object; each upload still
+    gets its own row with its own name and uploader.
+    """
+
+    __tablename__ = "attachments"
+    __table_args__ = (
+        Index("ix_attachments_sha256", "sha256"),
+        Index("ix_attachments_uploader", "uploader_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    uploader_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(255), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
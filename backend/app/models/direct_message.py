@@ -1,18 +1,72 @@
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, Text
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    Text,
+    text,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
+# Id of the writing transaction. Rows carry it in `change_xid`, so the rows
+# written since a sync token (a snapshot's xmin) can be found by index; see
+# services/sync.py. Rows from before change tracking have NULL.
+CHANGE_XID = "pg_current_xact_id()::text::bigint"
+
 
 class DirectMessage(Base):
     __tablename__ = "direct_messages"
+    __table_args__ = (
+        Index(
+            "ix_direct_messages_sender_receiver_created",
+            "sender_id",
+            "receiver_id",
+            "created_at",
+        ),
+        Index("ix_direct_messages_receiver_created", "receiver_id", "created_at"),
+        # Unread counts are range counts past each read cursor
+        Index("ix_direct_messages_receiver_sender_id", "receiver_id", "sender_id", "id"),
+        # Attachment access checks look up the messages referencing an attachment
+        Index(
+            "ix_direct_messages_attachment",
+            "attachment_id",
+            postgresql_where=text("attachment_id IS NOT NULL"),
+        ),
+        # Delta sync finds the messages written since a token, from either side
+        Index(
+            "ix_direct_messages_receiver_change",
+            "receiver_id",
+            "change_xid",
+            postgresql_where=text("change_xid IS NOT NULL"),
+        ),
+        Index(
+            "ix_direct_messages_sender_change",
+            "sender_id",
+            "change_xid",
+            postgresql_where=text("change_xid IS NOT NULL"),
+        ),
+        # Monthly range partitions are managed by services/partitions.py
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    # The partition key has to be part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    is_read = Column(Boolean, default=False)
+    # Set only when the full content is in message_bodies; `content` is then a
+    # preview and this is the size of the full content in UTF-8 bytes
+    content_bytes = Column(Integer, nullable=True)
+    created_at = Column(
+        DateTime(timezone=True), primary_key=True, server_default=func.now()
+    )
     sender_id = Column(Integer, ForeignKey("users.id"))
     receiver_id = Column(Integer, ForeignKey("users.id"))
+    attachment_id = Column(Integer, ForeignKey("attachments.id"), nullable=True)
+    change_xid = Column(BigInteger, server_default=text(CHANGE_XID))
 
     # Relationships
     sender = relationship(
@@ -21,3 +75,35 @@ class DirectMessage(Base):
     receiver = relationship(
         "User", foreign_keys=[receiver_id], back_populates="received_messages"
     )
+
+
+class ReadCursor(Base):
+    """
+    How far a user has read a conversation: every message from `peer_id` to
+    `user_id` with an id up to `last_read_message_id` is read. Read receipts
+    move the cursor instead of updating message rows.
+    """
+
+    __tablename__ = "read_cursors"
+    __table_args__ = (Index("ix_read_cursors_peer", "peer_id"),)
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    peer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    last_read_message_id = Column(Integer, nullable=False)
+    # Set on every move. Not indexed, so moving a cursor stays a HOT update;
+    # sync reads a user's cursors through the keys and filters on it
+    change_xid = Column(BigInteger, server_default=text(CHANGE_XID))
+
+
+class MessageBody(Base):
+    """
+    zlib-compressed full content of a direct message too large to store inline.
+    Keeping it out of direct_messages keeps history pages and the recent message
+    cache small; the content is fetched on demand.
+    """
+
+    __tablename__ = "message_bodies"
+
+    # No foreign key: the direct_messages key also includes created_at
+    message_id = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(LargeBinary, nullable=False)
@@ -0,0 +1,23 @@
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, LargeBinary
+
+from ..database import Base
+
+
+class RefreshToken(Base):
+    """
+    One login session and its current refresh token, stored as the SHA-256 of
+    the token's secret, with the hash of the token it replaced. Refreshing
+    replaces the hashes in place, so a session is one row however often it is
+    renewed, and updates never touch an index.
+    """
+
+    __tablename__ = "refresh_tokens"
+    __table_args__ = (Index("ix_refresh_tokens_user", "user_id"),)
+
+    # The session id: random, and part of the token handed to the client
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    token_hash = Column(LargeBinary(32), nullable=False)
+    # The token before the last refresh; presenting it again means it was copied
+    previous_hash = Column(LargeBinary(32))
+    expires_at = Column(DateTime(timezone=True), nullable=False)
@@ -4,12 +4,11 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from ..auth.jwt import get_current_active_user
-from ..database import get_db
+from ..auth.jwt import get_current_active_user, get_read_db
 from ..logger import init_logger
-from ..models.direct_message import DirectMessage
 from ..models.user import User
 from ..services.ai_summarizer import ai_chat_summarizer
+from ..services.direct_message import full_contents, latest_messages
 
 logger = init_logger(__name__)
 router = APIRouter()
@@ -40,7 +39,7 @@ class SummarizeResponse(BaseModel):
 @router.post("/summarize", response_model=SummarizeResponse)
 async def summarize_conversation(
     request: SummarizeRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -52,14 +51,6 @@ async def summarize_conversation(
     Returns a summary of the conversation including key topics and important points.
     """
     try:
-        # Validate that the other user exists
-        other_user = db.query(User).filter(User.id == request.other_user_id).first()
-        if not other_user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"User with id {request.other_user_id} not found",
-            )
-
         # Prevent users from summarizing conversations with themselves
         if current_user.id == request.other_user_id:
             raise HTTPException(
@@ -67,38 +58,33 @@ async def summarize_conversation(
                 detail="Cannot summarize conversation with yourself",
             )
 
-        # Fetch the most recent messages between the two users
-        messages = (
-            db.query(DirectMessage)
-            .filter(
-                (
-                    (DirectMessage.sender_id == current_user.id)
-                    & (DirectMessage.receiver_id == request.other_user_id)
-                )
-                | (
-                    (DirectMessage.sender_id == request.other_user_id)
-                    & (DirectMessage.receiver_id == current_user.id)
-                )
-            )
-            .order_by(DirectMessage.created_at.desc())
-            .limit(request.message_count)
-            .all()
+        # Most recent messages in chronological order, usually from the cache
+        messages, participants = latest_messages(
+            db, current_user.id, request.other_user_id, request.message_count
         )
 
+        # Validate that the other user exists
+        other_user = participants.get(request.other_user_id)
+        if not other_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"User with id {request.other_user_id} not found",
+            )
+
         if not messages:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No messages found between these users",
             )
 
-        # Reverse the messages to get chronological order for summarization
-        messages.reverse()
+        # Listings carry previews of large messages; summarize their full text
+        messages = full_contents(db, messages)
 
         # Convert messages to the format expected by the AI summarizer
         formatted_messages = []
         for msg in messages:
             # Determine sender info
-            if msg.sender_id == current_user.id:
+            if msg["sender_id"] == current_user.id:
                 sender_info = {
                     "full_name": current_user.full_name,
                     "username": current_user.username,
@@ -111,13 +97,13 @@ async def summarize_conversation(
 
             formatted_messages.append(
                 {
-                    "id": msg.id,
-                    "content": msg.content,
-                    "created_at": msg.created_at.isoformat()
-                    if msg.created_at
+                    "id": msg["id"],
+                    "content": msg["content"],
+                    "created_at": msg["created_at"].isoformat()
+                    if msg["created_at"]
                     else None,
-                    "sender_id": msg.sender_id,
-                    "receiver_id": msg.receiver_id,
+                    "sender_id": msg["sender_id"],
+                    "receiver_id": msg["receiver_id"],
                     "sender": sender_info,
                 }
             )
@@ -132,8 +118,10 @@ async def summarize_conversation(
 
         if summary_result["success"]:
             logger.info(
-                f"Successfully generated summary for conversation between "
-                f"user {current_user.id} and user {request.other_user_id}"
+                "Successfully generated summary for conversation between "
+                "user %s and user %s",
+                current_user.id,
+                request.other_user_id,
             )
 
             return SummarizeResponse(
@@ -145,7 +133,7 @@ async def summarize_conversation(
                 model_used=summary_result["model_used"],
             )
         else:
-            logger.error(f"Failed to generate summary: {summary_result['error']}")
+            logger.error("Failed to generate summary: %s", summary_result["error"])
 
             return SummarizeResponse(
                 success=False,
@@ -157,7 +145,7 @@ async def summarize_conversation(
                 error=summary_result["error"],
             )
     except Exception as e:
-        logger.error(f"Unexpected error in summarize_conversation: {str(e)}")
+        logger.error("Unexpected error in summarize_conversation: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred while generating the summary",
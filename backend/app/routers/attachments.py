@@ -0,0 +1,119 @@
+import os
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session
+
+from ..auth.jwt import get_current_user, get_read_db
+from ..config import settings
+from ..database import get_db
+from ..models.attachment import Attachment
+from ..models.user import User
+from ..schemas.attachment import AttachmentResponse
+from ..services.attachments import (
+    InvalidUpload,
+    UploadTooLarge,
+    accessible_attachment,
+    attachment_store,
+    iter_object,
+    receive_upload,
+    store_attachment,
+)
+
+router = APIRouter()
+
+
+class AttachmentFileResponse(FileResponse):
+    # Larger reads than the 64 KiB default mean fewer thread hand-offs per file
+    chunk_size = 1024 * 1024
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def require_attachment(db: Session, user_id: int, attachment_id: int) -> Attachment:
+    attachment = accessible_attachment(db, user_id, attachment_id)
+    if attachment is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Attachment with id {attachment_id} not found",
+        )
+    return attachment
+
+
+@router.post("/", response_model=AttachmentResponse, status_code=status.HTTP_201_CREATED)
+async def upload_attachment(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Upload a file as the `file` field of a multipart/form-data body.
+
+    The body is streamed to disk and hashed as it arrives, and files already
+    stored with the same SHA-256 are not stored again. Send the returned id
+    as `attachment_id` with a direct message to share the file.
+    """
+    try:
+        received = await receive_upload(
+            request.headers.get("content-type"), request.stream(), settings.ATTACHMENT_MAX_BYTES
+        )
+    except InvalidUpload as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Attachments are limited to {settings.ATTACHMENT_MAX_BYTES} bytes",
+        )
+    return store_attachment(db, current_user.id, received)
+
+
+@router.get("/{attachment_id}", response_model=AttachmentResponse)
+async def get_attachment(
+    attachment_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Get an attachment's metadata; available to its uploader and recipients"""
+    return require_attachment(db, current_user.id, attachment_id)
+
+
+@router.api_route("/{attachment_id}/content", methods=["GET", "HEAD"])
+async def download_attachment(
+    attachment_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Download an attachment. Range requests are supported, and the ETag is the
+    content hash.
+
+    With ATTACHMENT_ACCEL_REDIRECT_PREFIX set the response is only headers and
+    a fronting nginx sends the file itself with sendfile, ranges included.
+    """
+    attachment = require_attachment(db, current_user.id, attachment_id)
+    headers = {
+        "Content-Disposition": content_disposition(attachment.filename),
+        "ETag": f'"{attachment.sha256}"',
+        # Stored objects never change
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    path = attachment_store.local_path(attachment.sha256)
+    if path is None:
+        return StreamingResponse(
+            iter_object(attachment.sha256),
+            media_type=attachment.content_type,
+            headers={**headers, "Content-Length": str(attachment.size)},
+        )
+    if settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX:
+        relative = os.path.relpath(path, settings.ATTACHMENT_DIR)
+        headers["X-Accel-Redirect"] = settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX + relative
+        return Response(media_type=attachment.content_type, headers=headers)
+    return AttachmentFileResponse(path, media_type=attachment.content_type, headers=headers)
@@ -1,16 +1,18 @@
-from datetime import timedelta
+from urllib.parse import urlencode
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
 from ..auth import jwt, utils
 from ..auth import oauth as oauth_module
+from ..auth import sessions
 from ..config import settings
 from ..database import get_db
 from ..logger import init_logger
-from ..schemas.user import UserCreate
+from ..metrics import token_renewals
+from ..schemas.user import RefreshRequest, Token, UserCreate
 
 logger = init_logger(__name__)
 router = APIRouter()
@@ -23,19 +25,15 @@ async def login_for_access_token(
 ):
     user = utils.authenticate_user(db, form_data.username, form_data.password)
     if not user:
-        logger.warning(f"Failed login attempt for username: {form_data.username}")
+        logger.warning("Failed login attempt for username: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    logger.info(f"Successful login for user: {user.username}")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = jwt.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    logger.info("Successful login for user: %s", user.username)
+    return sessions.start_session(db, user)
 
 
 @router.post("/register", response_model=dict)
@@ -43,13 +41,15 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
     # Check if user already exists
     db_user_by_email = utils.get_user_by_email(db, user_data.email)
     if db_user_by_email:
-        logger.warning(f"Registration failed - email already exists: {user_data.email}")
+        logger.warning(
+            "Registration failed - email already exists: %s", user_data.email
+        )
         raise HTTPException(status_code=400, detail="Email already registered")
 
     db_user_by_username = utils.get_user_by_username(db, user_data.username)
     if db_user_by_username:
         logger.warning(
-            f"Registration failed - username already taken: {user_data.username}"
+            "Registration failed - username already taken: %s", user_data.username
         )
         raise HTTPException(status_code=400, detail="Username already taken")
 
@@ -62,15 +62,45 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
         "auth_provider": "local",
     }
     user = utils.create_user(db, new_user_data)
-    logger.info(f"New user registered: {user.username}")
+    logger.info("New user registered: %s", user.username)
+
+    return sessions.start_session(db, user)
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Trade a refresh token, or the one-time code of a Google login, for a new
+    access token and a new refresh token. Each refresh token works once;
+    presenting the one a refresh replaced ends its session.
+    """
+    try:
+        tokens = sessions.refresh_session(db, request.refresh_token)
+    except sessions.RefreshTokenReused:
+        token_renewals.labels("refresh", "reused").inc()
+        logger.warning("Reused refresh token; revoked its session")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
+        )
+    except sessions.InvalidRefreshToken:
+        token_renewals.labels("refresh", "invalid").inc()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
+        )
+    token_renewals.labels("refresh", "renewed").inc()
+    return tokens
 
-    # Create access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = jwt.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
 
-    return {"access_token": access_token, "token_type": "bearer"}
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: RefreshRequest, db: Session = Depends(get_db)):
+    """End the session of a refresh token, including its access tokens and sockets"""
+    try:
+        sessions.end_session(db, request.refresh_token)
+    except sessions.InvalidRefreshToken:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
+        )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 # Google OAuth routes
@@ -108,7 +138,7 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
                 user_by_email.full_name = user_info.get("name")
                 db.commit()
                 user = user_by_email
-                logger.info(f"Linked existing account with Google OAuth: {user.email}")
+                logger.info("Linked existing account with Google OAuth: %s", user.email)
             else:
                 # Create new user
                 username = oauth_module.generate_username(prefix="google")
@@ -122,31 +152,26 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
                     "full_name": user_info.get("name"),
                 }
                 user = utils.create_user(db, user_data)
-                logger.info(f"New user created via Google OAuth: {user.email}")
-
-        logger.info(f"Google OAuth successful for user: {user.email}")
+                logger.info("New user created via Google OAuth: %s", user.email)
 
-        # Create access token
-        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = jwt.create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
-        )
+        logger.info("Google OAuth successful for user: %s", user.email)
 
-        # Redirect to the frontend with the token
+        # Redirect to the frontend with a one-time code, which it trades for
+        # the tokens with POST /auth/refresh
+        code = sessions.start_login_code(db, user)
         frontend_url = settings.FRONTEND_URL
-        response = RedirectResponse(
-            url=f"{frontend_url}/auth/success?token={access_token}"
-        )
+        query = urlencode({"code": code})
+        response = RedirectResponse(url=f"{frontend_url}/auth/success?{query}")
         return response
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Google OAuth callback failed: {str(e)}")
+        logger.error("Google OAuth callback failed: %s", e)
         raise HTTPException(status_code=400, detail="OAuth authentication failed")
 
 
 # Success page after OAuth authentication
 @router.get("/success")
-async def auth_success(token: str):
-    return {"access_token": token, "token_type": "bearer"}
+async def auth_success(code: str):
+    return {"code": code, "detail": "POST it to /auth/refresh as refresh_token for the tokens"}
@@ -1,15 +1,47 @@
-from typing import List, Optional
+import csv
+import io
+import json
+import math
+from datetime import datetime
+from typing import Iterator, List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import text
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select, text
 from sqlalchemy.orm import Session
 
-from ..auth.jwt import get_current_user
+from ..auth.jwt import get_current_user, get_read_db
 from ..database import get_db
+from ..metrics import chat_messages
 from ..models.direct_message import DirectMessage
 from ..models.user import User
-from ..schemas.direct_message import DirectMessageCreate, DirectMessageResponse
+from ..schemas.direct_message import (
+    DirectMessageContentResponse,
+    DirectMessageCreate,
+    DirectMessageListResponse,
+    DirectMessageResponse,
+)
 from ..schemas.user import UserResponse
+from ..services.direct_message import (
+    EXPORT_COLUMNS,
+    MESSAGE_COLUMNS,
+    add_read_flags,
+    conversation_filter,
+    full_content,
+    insert_direct_message,
+    iter_conversation_batches,
+    find_message,
+    latest_messages,
+    mark_read_up_to,
+    message_payload,
+    read_cursors,
+    unread_count,
+)
+from ..services.attachments import attachments_by_id, owns_attachment
+from ..services.message_content import exceeds_size_limit, size_limit_error
+from ..services.partitions import partition_id_ranges
+from ..services.rate_limiter import message_rate_limiter
+from .presence_manager import presence_service
 from .websocket_manager import connection_manager
 
 router = APIRouter()
@@ -20,36 +52,54 @@ router = APIRouter()
 )
 async def create_direct_message(
     message: DirectMessageCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
 ):
-    """Create a new direct message"""
-    # Check if receiver exists
-    receiver = db.query(User).filter(User.id == message.receiver_id).first()
-    if not receiver:
+    """
+    Create a new direct message.
+
+    The message is stored with a single INSERT ... SELECT ... RETURNING, and the
+    WebSocket notification is sent after the response has gone out. Content
+    over MESSAGE_MAX_BYTES is rejected; large content is stored out of line and
+    the response and notification carry a preview (`truncated` is true).
+    """
+    if exceeds_size_limit(message.content):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User with id {message.receiver_id} not found",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=size_limit_error(),
         )
 
-    # Create new message
-    db_message = DirectMessage(
-        content=message.content,
+    retry_after = message_rate_limiter.try_acquire(current_user.id)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    db_message = insert_direct_message(
         sender_id=current_user.id,
         receiver_id=message.receiver_id,
+        content=message.content,
+        attachment_id=message.attachment_id,
     )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    if db_message is None:
+        if message.attachment_id is not None and not owns_attachment(
+            current_user.id, message.attachment_id
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Attachment with id {message.attachment_id} not found",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with id {message.receiver_id} not found",
+        )
+    chat_messages.labels("rest").inc()
 
     # Prepare message data for WebSocket notification
     message_data = {
-        "id": db_message.id,
-        "content": db_message.content,
-        "created_at": db_message.created_at.isoformat(),
-        "is_read": db_message.is_read,
-        "sender_id": db_message.sender_id,
-        "receiver_id": db_message.receiver_id,
+        **message_payload(db_message),
         "sender": {
             "id": current_user.id,
             "username": current_user.username,
@@ -57,8 +107,9 @@ async def create_direct_message(
         },
     }
 
-    # Notify the receiver through WebSocket if they're connected
-    await connection_manager.send_personal_message(
+    # Notify the receiver through WebSocket after the response is sent
+    background_tasks.add_task(
+        connection_manager.send_personal_message,
         message={"type": "new_message", "data": message_data},
         user_id=message.receiver_id,
     )
@@ -66,44 +117,117 @@ async def create_direct_message(
     return db_message
 
 
-@router.get("/", response_model=List[DirectMessageResponse])
+@router.get("/", response_model=DirectMessageListResponse)
 async def get_user_messages(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
     other_user_id: Optional[int] = None,
     limit: int = 50,
     skip: int = 0,
+    latest: bool = False,
 ):
     """
-    Get messages for the current user, optionally filtered by conversation with another user
+    Get messages for the current user, optionally filtered by conversation with another user.
+
+    Participants are returned once in the `users` map instead of being embedded
+    in every message, and are loaded with a single query for the whole page.
+    Attachments referenced by the page are returned the same way.
+
+    With `latest=true` and `other_user_id`, the newest `limit` messages of the
+    conversation are returned (still oldest first), usually straight from the
+    recent message cache.
     """
+    if latest and other_user_id:
+        messages, users = latest_messages(db, current_user.id, other_user_id, limit)
+        return {
+            "users": users,
+            "messages": messages,
+            "attachments": attachments_by_id(db, messages),
+        }
+
+    query = select(*(getattr(DirectMessage, column) for column in MESSAGE_COLUMNS))
     if other_user_id:
         # Get conversation between current user and specific other user
-        query = db.query(DirectMessage).filter(
-            (
-                (DirectMessage.sender_id == current_user.id)
-                & (DirectMessage.receiver_id == other_user_id)
-            )
-            | (
-                (DirectMessage.sender_id == other_user_id)
-                & (DirectMessage.receiver_id == current_user.id)
-            )
-        )
+        query = query.where(conversation_filter(current_user.id, other_user_id))
     else:
         # Get all messages for current user
-        query = db.query(DirectMessage).filter(
-            (DirectMessage.sender_id == current_user.id)
-            | (DirectMessage.receiver_id == current_user.id)
+        query = query.where(
+            or_(
+                DirectMessage.sender_id == current_user.id,
+                DirectMessage.receiver_id == current_user.id,
+            )
         )
 
     # Order by creation date, newest last
-    messages = query.order_by(DirectMessage.created_at).offset(skip).limit(limit).all()
-    return messages
+    rows = db.execute(query.order_by(DirectMessage.created_at).offset(skip).limit(limit))
+    messages = [dict(row) for row in rows.mappings()]
+    add_read_flags(messages, read_cursors(db, current_user.id, other_user_id))
+
+    # Load every participant of the page in one query
+    user_ids = {m["sender_id"] for m in messages} | {m["receiver_id"] for m in messages}
+    users = db.query(User).filter(User.id.in_(user_ids)).all() if user_ids else []
+
+    return {
+        "users": {user.id: user for user in users},
+        "messages": messages,
+        "attachments": attachments_by_id(db, messages),
+    }
+
+
+def _ndjson_chunks(batches) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(
+            json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n"
+            for row in batch
+        )
+
+
+def _csv_chunks(batches) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty conversation
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@router.get("/export")
+async def export_conversation(
+    other_user_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Stream the full history of a conversation as NDJSON or CSV.
+
+    Rows are read through a server-side cursor and written out batch by batch,
+    so memory use stays constant regardless of the conversation size.
+    """
+    batches = iter_conversation_batches(current_user.id, other_user_id, since, until)
+
+    if format == "csv":
+        chunks, media_type = _csv_chunks(batches), "text/csv"
+    else:
+        chunks, media_type = _ndjson_chunks(batches), "application/x-ndjson"
+
+    filename = f"conversation_{current_user.id}_{other_user_id}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.get("/conversations", response_model=List[UserResponse])
 async def get_user_conversations(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """
@@ -135,14 +259,45 @@ async def get_user_conversations(
     return users
 
 
+@router.get("/{message_id}/content", response_model=DirectMessageContentResponse)
+async def get_message_content(
+    message_id: int,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Get the full content of a message, for messages listed with `truncated`
+    set. Works for any message the current user sent or received.
+    """
+    content = full_content(db, current_user.id, message_id)
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Message with id {message_id} not found",
+        )
+    # Messages are never edited
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return {"id": message_id, "content": content}
+
+
 @router.put("/{message_id}/read")
 async def mark_message_as_read(
     message_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Mark a message as read"""
-    message = db.query(DirectMessage).filter(DirectMessage.id == message_id).first()
+    """
+    Mark a message, and every earlier message from the same sender, as read.
+
+    Moves the current user's read cursor for the sender in one statement; the
+    message itself is only looked up when that did not move the cursor, to
+    tell an already read message from a missing or foreign one.
+    """
+    if mark_read_up_to(current_user.id, message_id) is not None:
+        return {"status": "success"}
+
+    message = find_message(db, message_id)
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -156,9 +311,9 @@ async def mark_message_as_read(
             detail="You can only mark messages addressed to you as read",
         )
 
-    # Mark as read
-    message.is_read = True
-    db.commit()
+    # Found outside its id range bound, which the cursor update used as well
+    if not partition_id_ranges.covers(message.id, message.created_at):
+        mark_read_up_to(current_user.id, message_id, bounded=False)
 
     return {"status": "success"}
 
@@ -169,13 +324,7 @@ async def get_unread_count(
     current_user: User = Depends(get_current_user),
 ):
     """Get count of unread messages"""
-    count = (
-        db.query(DirectMessage)
-        .filter(DirectMessage.receiver_id == current_user.id, not DirectMessage.is_read)
-        .count()
-    )
-
-    return {"unread_count": count}
+    return {"unread_count": unread_count(db, current_user.id)}
 
 
 @router.get("/online-users")
@@ -187,6 +336,21 @@ async def get_online_users(
     return {"online_users": connected_users}
 
 
+@router.get("/user-status")
+async def check_users_online_status(
+    user_ids: List[int] = Query(...),
+    current_user: User = Depends(get_current_user),
+):
+    """Check the online status of several users in one call"""
+    if len(user_ids) > presence_service.max_subscriptions:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {presence_service.max_subscriptions} user ids per request",
+        )
+
+    return {"statuses": presence_service.get_status(user_ids)}
+
+
 @router.get("/user-status/{user_id}")
 async def check_user_online_status(
     user_id: int,
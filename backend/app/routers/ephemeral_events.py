@@ -0,0 +1,75 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+from ..config import settings
+from ..logger import init_logger
+from .websocket_manager import ConnectionManager, connection_manager
+
+logger = init_logger(__name__)
+
+
+class EphemeralEventDispatcher:
+    """
+    Routes ephemeral events (typing indicators and similar) directly through the
+    ConnectionManager without any database write.
+
+    Events are debounced per (sender, receiver, event type): the first event is
+    delivered immediately and opens a window. Events arriving inside the window
+    are coalesced, and only the latest one is delivered when the window closes.
+    """
+
+    def __init__(self, manager: ConnectionManager, debounce_seconds: float):
+        self.manager = manager
+        self.debounce_seconds = debounce_seconds
+        # Open windows: {(sender_id, receiver_id, event_type): pending frame or None}
+        self.windows: Dict[Tuple[int, int, str], Optional[dict]] = {}
+
+        self.delivered = 0
+        self.coalesced = 0
+
+    async def publish(self, sender_id: int, receiver_id: int, event_type: str, data: dict):
+        """Publish an ephemeral event from sender to receiver"""
+        # Nobody to tell, so don't open a window either
+        if not self.manager.is_user_connected(receiver_id):
+            return
+
+        key = (sender_id, receiver_id, event_type)
+        frame = {"type": event_type, "data": {"sender_id": sender_id, **data}}
+
+        if key in self.windows:
+            if self.windows[key] is not None:
+                self.coalesced += 1
+            self.windows[key] = frame
+            return
+
+        await self._deliver(key, frame)
+
+    async def _deliver(self, key: Tuple[int, int, str], frame: dict):
+        """Deliver a frame and open a debounce window for its key"""
+        self.windows[key] = None
+        asyncio.get_running_loop().call_later(
+            self.debounce_seconds, self._close_window, key
+        )
+        # Counts frames handed to the hub for another worker too
+        if await self.manager.send_personal_message(frame, user_id=key[1]):
+            self.delivered += 1
+
+    def _close_window(self, key: Tuple[int, int, str]):
+        """Flush the latest coalesced frame, if any, when a window closes"""
+        frame = self.windows.pop(key, None)
+        if frame is not None:
+            asyncio.create_task(self._deliver(key, frame))
+
+    def get_stats(self) -> dict:
+        """Get dispatcher counters"""
+        return {
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "open_windows": len(self.windows),
+        }
+
+
+# Global ephemeral event dispatcher instance
+ephemeral_dispatcher = EphemeralEventDispatcher(
+    connection_manager, debounce_seconds=settings.TYPING_DEBOUNCE_SECONDS
+)
@@ -0,0 +1,208 @@
+import math
+from typing import FrozenSet, List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from ..auth.jwt import get_current_user, get_read_db
+from ..database import get_db
+from ..metrics import group_messages
+from ..models.group import Group
+from ..models.user import User
+from ..schemas.group import (
+    GroupCreate,
+    GroupMemberAdd,
+    GroupMessageCreate,
+    GroupMessageListResponse,
+    GroupMessageResponse,
+    GroupReadCursor,
+    GroupResponse,
+    GroupSummaryResponse,
+)
+from ..schemas.user import UserResponse
+from ..services.groups import (
+    add_group_member,
+    create_group,
+    group_history,
+    group_members,
+    group_message_payload,
+    insert_group_message,
+    list_user_groups,
+    mark_group_read,
+    remove_group_member,
+)
+from ..services.message_content import exceeds_size_limit, size_limit_error
+from ..services.rate_limiter import message_rate_limiter
+from .websocket_manager import connection_manager
+
+router = APIRouter()
+
+
+def require_membership(group_id: int, user_id: int) -> FrozenSet[int]:
+    """Return the group's members, or 404 if the user is not one of them"""
+    members = group_members(group_id)
+    if user_id not in members:
+        # Same answer for groups that do not exist, so ids cannot be probed
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Group with id {group_id} not found",
+        )
+    return members
+
+
+async def fan_out_group_message(message: dict, members: FrozenSet[int]) -> int:
+    """Push a stored group message to every online member except its sender"""
+    return await connection_manager.send_to_users(
+        {"type": "group_message", "data": group_message_payload(message)},
+        (user_id for user_id in members if user_id != message["sender_id"]),
+    )
+
+
+@router.post("/", response_model=GroupResponse, status_code=status.HTTP_201_CREATED)
+async def create_new_group(
+    group: GroupCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Create a group; the creator is always a member"""
+    return create_group(db, current_user.id, group.name, group.member_ids)
+
+
+@router.get("/", response_model=List[GroupSummaryResponse])
+async def get_user_groups(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """List the current user's groups with their unread counts"""
+    return list_user_groups(db, current_user.id)
+
+
+@router.get("/{group_id}/members", response_model=List[UserResponse])
+async def get_group_members(
+    group_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    members = require_membership(group_id, current_user.id)
+    return db.query(User).filter(User.id.in_(members)).order_by(User.id).all()
+
+
+@router.post("/{group_id}/members", status_code=status.HTTP_201_CREATED)
+async def add_member(
+    group_id: int,
+    member: GroupMemberAdd,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Add a user to a group the current user belongs to"""
+    require_membership(group_id, current_user.id)
+    if not add_group_member(db, group_id, member.user_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"User with id {member.user_id} does not exist or is already a member",
+        )
+    return {"status": "success"}
+
+
+@router.delete("/{group_id}/members/{user_id}")
+async def remove_member(
+    group_id: int,
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Leave a group, or remove a member from a group you created"""
+    require_membership(group_id, current_user.id)
+    if user_id != current_user.id:
+        group = db.get(Group, group_id)
+        # The member cache can outlive a deleted group
+        if group is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Group with id {group_id} not found",
+            )
+        if group.created_by != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only the group creator can remove other members",
+            )
+    if not remove_group_member(db, group_id, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with id {user_id} is not a member",
+        )
+    return {"status": "success"}
+
+
+@router.post(
+    "/{group_id}/messages",
+    response_model=GroupMessageResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def send_group_message(
+    group_id: int,
+    message: GroupMessageCreate,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Send a message to a group.
+
+    The message is stored once and pushed to the online members with a single
+    pre-encoded frame after the response is sent. With the member list cached,
+    the whole send is one INSERT.
+    """
+    if exceeds_size_limit(message.content):
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=size_limit_error(),
+        )
+
+    retry_after = message_rate_limiter.try_acquire(current_user.id)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    members = require_membership(group_id, current_user.id)
+    db_message = insert_group_message(group_id, current_user.id, message.content)
+    group_messages.labels("rest").inc()
+    background_tasks.add_task(fan_out_group_message, db_message, members)
+    return db_message
+
+
+@router.get("/{group_id}/messages", response_model=GroupMessageListResponse)
+async def get_group_messages(
+    group_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+):
+    """
+    Get a page of group history, oldest first.
+
+    Returns the newest `limit` messages, or the ones before `before_id` to page
+    backwards. Senders are returned once in the `users` map.
+    """
+    require_membership(group_id, current_user.id)
+    messages = group_history(db, group_id, limit, before_id)
+
+    sender_ids = {m["sender_id"] for m in messages}
+    users = db.query(User).filter(User.id.in_(sender_ids)).all() if sender_ids else []
+    return {"users": {user.id: user for user in users}, "messages": messages}
+
+
+@router.put("/{group_id}/read")
+async def mark_group_as_read(
+    group_id: int,
+    cursor: GroupReadCursor,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Mark every message of the group up to `message_id` as read"""
+    require_membership(group_id, current_user.id)
+    mark_group_read(db, group_id, current_user.id, cursor.message_id)
+    return {"status": "success"}
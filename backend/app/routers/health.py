@@ -1,10 +1,22 @@
 from datetime import datetime
 
 from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from ..database import get_db
+from ..auth.denylist import session_denylist
+from ..auth.oauth import provider_documents
+from ..cluster import cluster_client
+from ..database import get_db, read_router
+from ..metrics import registry
+from ..services.groups import group_member_cache
+from ..services.message_cache import recent_message_cache
+from ..services.partitions import partition_id_ranges
+from ..services.rate_limiter import message_rate_limiter
+from .ephemeral_events import ephemeral_dispatcher
+from .presence_manager import presence_service
+from .websocket_manager import connection_manager
 
 router = APIRouter()
 
@@ -26,3 +38,29 @@ async def health_check(db: Session = Depends(get_db)):
             "timestamp": datetime.utcnow().isoformat(),
             "database": "disconnected",
         }
+
+
+@router.get("/health/stats")
+async def runtime_stats():
+    """Runtime counters for the WebSocket layer, rate limiter and read routing"""
+    return {
+        "websockets": connection_manager.get_stats(),
+        "rate_limiter": message_rate_limiter.get_stats(),
+        "ephemeral_events": ephemeral_dispatcher.get_stats(),
+        "presence": presence_service.get_stats(),
+        "read_replicas": read_router.get_stats(),
+        "message_cache": recent_message_cache.get_stats(),
+        "group_member_cache": group_member_cache.get_stats(),
+        "cluster": cluster_client.get_stats(),
+        "oauth_documents": provider_documents.get_stats(),
+        "session_denylist": session_denylist.get_stats(),
+        "partition_id_ranges": partition_id_ranges.get_stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the in-process metrics"""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
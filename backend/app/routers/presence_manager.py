@@ -0,0 +1,112 @@
+import asyncio
+from typing import Dict, Iterable, Set
+
+from ..config import settings
+from ..logger import init_logger
+from .websocket_manager import ConnectionManager, connection_manager
+
+logger = init_logger(__name__)
+
+
+class PresenceService:
+    """
+    Presence subscriptions on top of the ConnectionManager.
+
+    A connected client subscribes to the users it cares about (its conversation
+    peers) and receives batched online/offline deltas for just those users, so
+    presence traffic scales with contacts instead of with total online users.
+    """
+
+    def __init__(self, manager: ConnectionManager, batch_interval: float, max_subscriptions: int):
+        self.manager = manager
+        self.batch_interval = batch_interval
+        self.max_subscriptions = max_subscriptions
+
+        # {watcher_id: {target_id}} and the reverse index {target_id: {watcher_id}}
+        self.subscriptions: Dict[int, Set[int]] = {}
+        self.watchers: Dict[int, Set[int]] = {}
+        # Deltas waiting for the next flush: {watcher_id: {target_id: is_online}}
+        self.pending: Dict[int, Dict[int, bool]] = {}
+
+        manager.status_listeners.append(self.on_status_change)
+        # Subscriptions belong to the socket on this worker; with several
+        # workers the user can stay online elsewhere after it closes
+        manager.disconnect_listeners.append(self.unsubscribe)
+
+    def get_status(self, user_ids: Iterable[int]) -> Dict[int, bool]:
+        """Get online status for a list of users"""
+        return {user_id: self.manager.is_user_connected(user_id) for user_id in user_ids}
+
+    def subscribe(self, watcher_id: int, user_ids: Iterable[int]) -> dict:
+        """
+        Replace a watcher's subscriptions and return a snapshot of the
+        current state of the subscribed users.
+        """
+        self.unsubscribe(watcher_id)
+
+        targets = set(list(user_ids)[: self.max_subscriptions])
+        targets.discard(watcher_id)
+        self.subscriptions[watcher_id] = targets
+        for target_id in targets:
+            self.watchers.setdefault(target_id, set()).add(watcher_id)
+
+        statuses = self.get_status(targets)
+        return {
+            "online": [user_id for user_id, online in statuses.items() if online],
+            "offline": [user_id for user_id, online in statuses.items() if not online],
+        }
+
+    def unsubscribe(self, watcher_id: int):
+        """Drop all subscriptions of a watcher"""
+        self.pending.pop(watcher_id, None)
+        for target_id in self.subscriptions.pop(watcher_id, ()):
+            watchers = self.watchers.get(target_id)
+            if watchers:
+                watchers.discard(watcher_id)
+                if not watchers:
+                    del self.watchers[target_id]
+
+    def on_status_change(self, user_id: int, is_online: bool):
+        """ConnectionManager listener: queue a delta for everyone watching the user"""
+        for watcher_id in self.watchers.get(user_id, ()):
+            self.pending.setdefault(watcher_id, {})[user_id] = is_online
+
+    async def flush(self):
+        """Send one batched presence frame to every watcher with pending deltas"""
+        pending, self.pending = self.pending, {}
+        for watcher_id, changes in pending.items():
+            await self.manager.send_personal_message(
+                {
+                    "type": "presence",
+                    "data": {
+                        "online": [uid for uid, online in changes.items() if online],
+                        "offline": [uid for uid, online in changes.items() if not online],
+                    },
+                },
+                user_id=watcher_id,
+            )
+
+    async def run(self):
+        """Background loop flushing batched presence deltas"""
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Presence flush failed: %s", e)
+
+    def get_stats(self) -> dict:
+        """Get subscription counters"""
+        return {
+            "watchers": len(self.subscriptions),
+            "watched_users": len(self.watchers),
+            "pending_deltas": sum(len(changes) for changes in self.pending.values()),
+        }
+
+
+# Global presence service instance
+presence_service = PresenceService(
+    connection_manager,
+    batch_interval=settings.PRESENCE_BATCH_INTERVAL_SECONDS,
+    max_subscriptions=settings.PRESENCE_MAX_SUBSCRIPTIONS,
+)
@@ -0,0 +1,40 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from ..auth.jwt import get_current_user, get_read_db
+from ..config import settings
+from ..metrics import sync_requests
+from ..models.user import User
+from ..schemas.sync import SyncResponse
+from ..services.sync import InvalidSyncToken, parse_token, sync
+
+router = APIRouter()
+
+
+# No trailing slash: a redirect would cost reconnecting clients a round-trip
+@router.get("", response_model=SyncResponse)
+async def sync_state(
+    since: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Get everything that changed for the current user since `since`, the token
+    returned by the previous sync, in one call.
+
+    Without `since` the response is a full snapshot of the conversation list
+    (`full` is true). With it, the response holds the direct messages stored
+    since then and the conversations with new messages or moved read
+    cursors, each with its last message, unread count and read cursors.
+    Changes may repeat across syncs; apply them by id.
+    """
+    try:
+        since_token = parse_token(since) if since is not None else None
+    except InvalidSyncToken:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync token"
+        )
+    sync_requests.labels("full" if since_token is None else "delta").inc()
+    return sync(db, current_user.id, since_token, settings.SYNC_MAX_MESSAGES)
@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
-from ..auth.jwt import get_current_active_user
+from ..auth.jwt import get_current_active_user, get_read_db
 from ..database import get_db
 from ..models.user import User
 from ..schemas.user import UserSearchResponse
@@ -47,7 +47,7 @@ async def get_user(
 async def search_users(
     query: str = Query(None, min_length=1, max_length=100),
     limit: int = Query(10, ge=1, le=50),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
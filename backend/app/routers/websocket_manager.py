@@ -1,47 +1,195 @@
-from typing import Dict, Optional
+import asyncio
+import json
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from fastapi import WebSocket, status
-from jose import jwt
 
+from ..auth.denylist import session_denylist
+from ..auth.jwt import decode_access_token
+from ..cluster import ClusterClient, cluster_client
 from ..config import settings
 from ..database import get_new_db_session
 from ..logger import init_logger
+from ..metrics import CallbackGauge, registry, websocket_send_duration, websocket_send_queue_depth
 from ..models.user import User
 
 logger = init_logger(__name__)
 
 
+def encode_message(message: dict) -> str:
+    # Same encoding as WebSocket.send_json
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
 class ConnectionManager:
-    def __init__(self):
+    def __init__(
+        self,
+        ping_interval: float = settings.WS_PING_INTERVAL_SECONDS,
+        ping_timeout: float = settings.WS_PING_TIMEOUT_SECONDS,
+    ):
         # Dictionary to store active connections: {user_id: WebSocket}
         self.active_connections: Dict[int, WebSocket] = {}
+        # Monotonic time of the last frame received from each user
+        self.last_seen: Dict[int, float] = {}
+        # Credentials of each connection: {user_id: (session id, token expiry as a
+        # Unix time)}, renewed by reauth frames
+        self.credentials: Dict[int, Tuple[Optional[int], Optional[float]]] = {}
+
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.reaped_connections = 0
+        self.expired_connections = 0
+
+        # Callbacks invoked with (user_id, is_online) when a user comes or goes
+        self.status_listeners: List[Callable[[int, bool], None]] = []
+        # Callbacks invoked with user_id when the user's socket on this worker
+        # closes, whether or not they are still connected to another worker
+        self.disconnect_listeners: List[Callable[[int], None]] = []
+
+        # Set in multi-worker mode; see attach_cluster
+        self.cluster: Optional[ClusterClient] = None
+
+    def attach_cluster(self, cluster: ClusterClient):
+        """
+        Route frames for users connected to other workers through the cluster
+        hub. Once the cluster is connected, status listeners fire from the hub's
+        cluster-wide status frames rather than from local connects/disconnects.
+        """
+        self.cluster = cluster
+        cluster.on("deliver", self._on_cluster_deliver)
+        cluster.on("deliver_many", self._on_cluster_deliver_many)
+        cluster.on("status", self._on_cluster_status)
+
+    async def _on_cluster_deliver(self, frame: dict):
+        # Never forwarded again, so a stale user map cannot bounce frames around
+        await self.send_local_message(frame["message"], frame["user_id"])
+
+    async def _on_cluster_deliver_many(self, frame: dict):
+        await self._send_text_to_local_users(frame["text"], frame["user_ids"])
+
+    def _on_cluster_status(self, frame: dict):
+        self._notify_status(frame["user_id"], frame["online"])
+
+    def _set_status(self, user_id: int, is_online: bool):
+        if self.cluster is None or not self.cluster.set_local_status(user_id, is_online):
+            self._notify_status(user_id, is_online)
+
+    def _notify_status(self, user_id: int, is_online: bool):
+        for listener in self.status_listeners:
+            try:
+                listener(user_id, is_online)
+            except Exception as e:
+                logger.error("Status listener failed for user %s: %s", user_id, e)
 
-    async def connect(self, user_id: int, websocket: WebSocket):
-        """Register a new WebSocket connection for a user"""
+    async def connect(self, user_id: int, websocket: WebSocket, claims: Optional[dict] = None):
+        """Register a new WebSocket connection for a user, authenticated by a token's claims"""
         await websocket.accept()
+        was_online = user_id in self.active_connections
         self.active_connections[user_id] = websocket
-        logger.info(f"WebSocket connected for user: {user_id}")
+        self.last_seen[user_id] = time.monotonic()
+        if claims is not None:
+            self.renew(user_id, claims)
+        logger.info("WebSocket connected for user: %s", user_id)
+
+        if not was_online:
+            self._set_status(user_id, True)
+
+    def disconnect(self, user_id: int, websocket: Optional[WebSocket] = None):
+        """
+        Remove a WebSocket connection for a user.
+        If a websocket is given, only remove it if it is still the registered one,
+        so a stale socket cannot deregister a newer connection.
+        """
+        if user_id not in self.active_connections:
+            return
+        if websocket is not None and self.active_connections[user_id] is not websocket:
+            return
+
+        del self.active_connections[user_id]
+        self.last_seen.pop(user_id, None)
+        self.credentials.pop(user_id, None)
+        logger.info("WebSocket disconnected for user: %s", user_id)
+        for listener in self.disconnect_listeners:
+            try:
+                listener(user_id)
+            except Exception as e:
+                logger.error("Disconnect listener failed for user %s: %s", user_id, e)
+        self._set_status(user_id, False)
+
+    def touch(self, user_id: int):
+        """Record that a frame was received from a user"""
+        if user_id in self.active_connections:
+            self.last_seen[user_id] = time.monotonic()
+
+    def renew(self, user_id: int, claims: dict):
+        """Record the credentials a connection holds from now on"""
+        if user_id in self.active_connections:
+            self.credentials[user_id] = (claims.get("sid"), claims.get("exp"))
+
+    async def send_personal_message(self, message: dict, user_id: int) -> Optional[str]:
+        """
+        Send a message to a specific user if they are connected to any worker.
+
+        Returns "delivered" when it was written to the user's socket here,
+        "sent" when it was handed to the cluster hub for another worker (which
+        does not confirm delivery), and None when the user is not connected.
+        """
+        if user_id in self.active_connections:
+            if await self.send_local_message(message, user_id):
+                return "delivered"
+            return None
+        if self.cluster is not None and self.cluster.deliver(user_id, message):
+            return "sent"
+        return None
 
-    def disconnect(self, user_id: int):
-        """Remove a WebSocket connection for a user"""
+    async def send_local_message(self, message: dict, user_id: int):
+        """Send a message to a user connected to this worker"""
         if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            logger.info(f"WebSocket disconnected for user: {user_id}")
+            return await self.send_local_text(encode_message(message), user_id)
+        return False
 
-    async def send_personal_message(self, message: dict, user_id: int):
-        """Send a message to a specific user if they are connected"""
+    async def send_local_text(self, text: str, user_id: int):
+        """Send an already encoded frame to a user connected to this worker"""
         if user_id in self.active_connections:
+            websocket_send_queue_depth.inc()
+            started = time.perf_counter()
             try:
-                await self.active_connections[user_id].send_json(message)
+                await self.active_connections[user_id].send_text(text)
                 return True
             except Exception:
                 # Connection might be broken but not properly closed
                 self.disconnect(user_id)
                 return False
+            finally:
+                websocket_send_duration.observe(time.perf_counter() - started)
+                websocket_send_queue_depth.dec()
         return False
 
+    async def send_to_users(self, message: dict, user_ids: Iterable[int]) -> int:
+        """
+        Send one frame to many users, e.g. the online members of a group.
+
+        The frame is encoded once and the same text is written to every local
+        socket concurrently; users on other workers get it through a single
+        cluster frame. Returns the number of local deliveries.
+        """
+        text = encode_message(message)
+        local, remote = [], []
+        for user_id in user_ids:
+            (local if user_id in self.active_connections else remote).append(user_id)
+        if remote and self.cluster is not None:
+            self.cluster.deliver_many(remote, text)
+        return await self._send_text_to_local_users(text, local)
+
+    async def _send_text_to_local_users(self, text: str, user_ids: Iterable[int]) -> int:
+        results = await asyncio.gather(
+            *(self.send_local_text(text, user_id) for user_id in user_ids)
+        )
+        return sum(results)
+
     async def broadcast(self, message: dict, exclude_user_id: Optional[int] = None):
-        """Send a message to all connected users except the excluded one"""
+        """Send a message to all users connected to this worker except the excluded one"""
         disconnected_users = []
 
         for user_id, connection in self.active_connections.items():
@@ -59,26 +207,105 @@ class ConnectionManager:
 
     def get_connected_users(self) -> list[int]:
         """Get list of currently connected user IDs"""
+        if self.cluster is not None and self.cluster.enabled:
+            return list(self.cluster.online_users | self.active_connections.keys())
         return list(self.active_connections.keys())
 
     def is_user_connected(self, user_id: int) -> bool:
         """Check if a specific user is currently connected"""
-        return user_id in self.active_connections
+        if user_id in self.active_connections:
+            return True
+        return self.cluster is not None and user_id in self.cluster.online_users
+
+    async def _reap(self, user_id: int, websocket: WebSocket):
+        """Close and deregister a connection that stopped answering pings"""
+        self.disconnect(user_id, websocket)
+        self.reaped_connections += 1
+        try:
+            await websocket.close(code=status.WS_1001_GOING_AWAY)
+        except Exception:
+            # The transport is usually already gone
+            pass
+        logger.info("Reaped idle WebSocket for user: %s", user_id)
+
+    async def _expire(self, user_id: int, websocket: WebSocket):
+        """Close a connection whose token expired or whose session was revoked"""
+        self.disconnect(user_id, websocket)
+        self.expired_connections += 1
+        try:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        except Exception:
+            pass
+        logger.info("Closed WebSocket with expired credentials for user: %s", user_id)
+
+    async def ping_and_reap(self):
+        """
+        Ping every connection and reap the ones that have not sent any frame
+        (including a pong) within ping_interval + ping_timeout.
+
+        Connections are also closed once their token has expired or their
+        session has been revoked. Those whose token expires before the next
+        round get a `reauth_required` frame, to answer with a `reauth` frame.
+        """
+        now = time.monotonic()
+        wall_now = time.time()
+        deadline = self.ping_interval + self.ping_timeout
+
+        for user_id, websocket in list(self.active_connections.items()):
+            idle = now - self.last_seen.get(user_id, now)
+            if idle > deadline:
+                await self._reap(user_id, websocket)
+                continue
+
+            session_id, expires_at = self.credentials.get(user_id, (None, None))
+            if session_denylist.is_revoked(session_id) or (
+                expires_at is not None and expires_at <= wall_now
+            ):
+                await self._expire(user_id, websocket)
+                continue
+
+            try:
+                if expires_at is not None and expires_at - wall_now <= deadline:
+                    await websocket.send_json({"type": "reauth_required", "expires_at": expires_at})
+                await websocket.send_json({"type": "ping"})
+            except Exception:
+                await self._reap(user_id, websocket)
+
+    async def run_heartbeat(self):
+        """Background loop driving server-side pings and the idle reaper"""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                await self.ping_and_reap()
+            except Exception as e:
+                logger.error("WebSocket heartbeat failed: %s", e)
+
+    def get_stats(self) -> dict:
+        """Get connection and idle-time counters"""
+        now = time.monotonic()
+        idle_times = [now - seen for seen in self.last_seen.values()]
+        return {
+            "active_connections": len(self.active_connections),
+            "reaped_connections": self.reaped_connections,
+            "expired_connections": self.expired_connections,
+            "max_idle_seconds": round(max(idle_times), 3) if idle_times else 0.0,
+            "avg_idle_seconds": round(sum(idle_times) / len(idle_times), 3)
+            if idle_times
+            else 0.0,
+        }
 
 
 async def authenticate_websocket_user(
     websocket: WebSocket, token: str
-) -> Optional[User]:
+) -> Optional[Tuple[User, dict]]:
     """
-    Authenticate WebSocket connection using token.
+    Authenticate WebSocket connection using token, returning the user and the
+    token's claims.
     This function creates its own database session to avoid connection pool issues.
     """
     db = None
     try:
-        # Use the JWT decoding logic from jwt.py
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             logger.warning("WebSocket authentication failed: No username in token")
@@ -91,13 +318,13 @@ async def authenticate_websocket_user(
         # Get user from database
         user = db.query(User).filter(User.username == username).first()
         if user is None or not user.is_active:
-            logger.warning(f"WebSocket authentication failed: Invalid user {username}")
+            logger.warning("WebSocket authentication failed: Invalid user %s", username)
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return None
 
-        return user
+        return user, payload
     except Exception as e:
-        logger.warning(f"WebSocket authentication failed: {str(e)}")
+        logger.warning("WebSocket authentication failed: %s", e)
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return None
     finally:
@@ -108,3 +335,12 @@ async def authenticate_websocket_user(
 
 # Global connection manager instance
 connection_manager = ConnectionManager()
+connection_manager.attach_cluster(cluster_client)
+
+registry.register(
+    CallbackGauge(
+        "websocket_connections",
+        "Connected WebSocket clients",
+        lambda: len(connection_manager.active_connections),
+    )
+)
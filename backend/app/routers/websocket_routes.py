@@ -1,16 +1,202 @@
-from datetime import datetime
-
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from jose import JWTError
 
-from ..database import get_db_context
+from ..auth.jwt import decode_access_token
+from ..instrumentation import profile_queries
 from ..logger import init_logger
-from ..models.direct_message import DirectMessage
+from ..metrics import chat_messages, current_handler, group_messages, token_renewals
+from ..services.attachments import owns_attachment
+from ..services.direct_message import insert_direct_message, message_payload
+from ..services.groups import group_members, group_message_payload, insert_group_message
+from ..services.message_content import exceeds_size_limit, size_limit_error
+from ..services.rate_limiter import message_rate_limiter
+from .ephemeral_events import ephemeral_dispatcher
+from .groups import fan_out_group_message
+from .presence_manager import presence_service
 from .websocket_manager import authenticate_websocket_user, connection_manager
 
 logger = init_logger(__name__)
 router = APIRouter()
 
 
+async def handle_chat_message(websocket: WebSocket, user_id: int, data: dict):
+    """Persist a chat message and deliver it to the receiver"""
+    # Validate the message structure
+    if "receiver_id" not in data or not isinstance(data.get("content"), str):
+        await websocket.send_json({"error": "Invalid message format"})
+        return
+
+    receiver_id = int(data["receiver_id"])
+    content = data["content"]
+    attachment_id = data.get("attachment_id")
+    if attachment_id is not None:
+        attachment_id = int(attachment_id)
+    if exceeds_size_limit(content):
+        await websocket.send_json({"error": size_limit_error()})
+        return
+
+    # Throttle before touching the database
+    retry_after = message_rate_limiter.try_acquire(user_id)
+    if retry_after:
+        await websocket.send_json(
+            {
+                "type": "rate_limited",
+                "error": "Rate limit exceeded",
+                "retry_after": round(retry_after, 3),
+            }
+        )
+        return
+
+    try:
+        db_message = insert_direct_message(
+            sender_id=user_id,
+            receiver_id=receiver_id,
+            content=content,
+            attachment_id=attachment_id,
+        )
+    except Exception as db_error:
+        logger.error(
+            "Failed to save WebSocket message from user %s: %s", user_id, db_error
+        )
+        await websocket.send_json({"error": "Failed to save message"})
+        return
+
+    if db_message is None:
+        if attachment_id is not None and not owns_attachment(user_id, attachment_id):
+            await websocket.send_json({"error": f"Attachment with id {attachment_id} not found"})
+        else:
+            await websocket.send_json({"error": f"User with id {receiver_id} not found"})
+        return
+
+    chat_messages.labels("websocket").inc()
+
+    # Prepare message data to send
+    message_data = message_payload(db_message)
+
+    # Send to the receiver if they are connected
+    delivery = await connection_manager.send_personal_message(
+        message={"type": "new_message", "data": message_data},
+        user_id=receiver_id,
+    )
+
+    # Send confirmation back to the sender
+    await websocket.send_json(
+        {
+            "type": "message_status",
+            "data": {
+                "status": delivery or "sent",
+                "message": message_data,
+            },
+        }
+    )
+
+
+async def handle_group_message(websocket: WebSocket, user_id: int, data: dict):
+    """Persist a group message once and fan it out to the online members"""
+    if "group_id" not in data or not isinstance(data.get("content"), str):
+        await websocket.send_json({"error": "Invalid group_message format"})
+        return
+
+    group_id = int(data["group_id"])
+    if exceeds_size_limit(data["content"]):
+        await websocket.send_json({"error": size_limit_error()})
+        return
+
+    retry_after = message_rate_limiter.try_acquire(user_id)
+    if retry_after:
+        await websocket.send_json(
+            {
+                "type": "rate_limited",
+                "error": "Rate limit exceeded",
+                "retry_after": round(retry_after, 3),
+            }
+        )
+        return
+
+    members = group_members(group_id)
+    if user_id not in members:
+        await websocket.send_json({"error": f"Group with id {group_id} not found"})
+        return
+
+    try:
+        db_message = insert_group_message(group_id, user_id, data["content"])
+    except Exception as db_error:
+        logger.error(
+            "Failed to save group message from user %s: %s", user_id, db_error
+        )
+        await websocket.send_json({"error": "Failed to save message"})
+        return
+
+    group_messages.labels("websocket").inc()
+    await fan_out_group_message(db_message, members)
+
+    await websocket.send_json(
+        {
+            "type": "group_message_status",
+            "data": {"status": "sent", "message": group_message_payload(db_message)},
+        }
+    )
+
+
+async def handle_typing(websocket: WebSocket, user_id: int, data: dict):
+    """Forward a typing indicator without touching the database"""
+    if "receiver_id" not in data:
+        await websocket.send_json({"error": "Invalid typing format"})
+        return
+
+    await ephemeral_dispatcher.publish(
+        sender_id=user_id,
+        receiver_id=int(data["receiver_id"]),
+        event_type="typing",
+        data={"is_typing": bool(data.get("is_typing", True))},
+    )
+
+
+async def handle_presence_subscribe(websocket: WebSocket, user_id: int, data: dict):
+    """Subscribe to presence updates for a list of users"""
+    user_ids = data.get("user_ids")
+    if not isinstance(user_ids, list):
+        await websocket.send_json({"error": "Invalid presence_subscribe format"})
+        return
+
+    snapshot = presence_service.subscribe(user_id, (int(uid) for uid in user_ids))
+    await websocket.send_json({"type": "presence", "data": snapshot})
+
+
+async def handle_reauth(websocket: WebSocket, user_id: int, data: dict):
+    """Renew the connection's credentials with a fresh access token, without a query"""
+    token = data.get("token")
+    if not isinstance(token, str):
+        await websocket.send_json({"error": "Invalid reauth format"})
+        return
+
+    try:
+        claims = decode_access_token(token)
+    except JWTError:
+        claims = None
+    # Only tokens that name their user by id (those from /auth/refresh) can be
+    # matched to the connection without loading the user
+    if claims is None or claims.get("uid") != user_id:
+        token_renewals.labels("websocket", "invalid").inc()
+        await websocket.send_json({"type": "reauth_failed", "error": "Invalid token"})
+        return
+
+    connection_manager.renew(user_id, claims)
+    token_renewals.labels("websocket", "renewed").inc()
+    await websocket.send_json({"type": "reauth_ok", "expires_at": claims.get("exp")})
+
+
+# Frame dispatch table: {frame type: handler}.
+# Frames without a type are treated as chat messages for older clients.
+FRAME_HANDLERS = {
+    "message": handle_chat_message,
+    "group_message": handle_group_message,
+    "typing": handle_typing,
+    "presence_subscribe": handle_presence_subscribe,
+    "reauth": handle_reauth,
+}
+
+
 @router.websocket("/ws/")
 async def websocket_endpoint(websocket: WebSocket, token: str):
     """
@@ -18,80 +204,56 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
 
     Query parameters:
     - token: JWT authentication token
+
+    Client frames are dispatched on their `type` field:
+    - message: {receiver_id, content, attachment_id?}, persisted and delivered;
+      large content is delivered as a preview with `truncated` set
+    - group_message: {group_id, content}, stored once and fanned out to members
+    - typing: {receiver_id, is_typing}, ephemeral and debounced per pair
+    - presence_subscribe: {user_ids}, batched online/offline deltas for those users
+    - reauth: {token}, a new access token (from /auth/refresh) for this
+      connection, answered with reauth_ok or reauth_failed
+    - pong: heartbeat reply
+
+    The connection is closed (1008) once its token has expired or its session
+    has been revoked. Shortly before expiry the server sends `reauth_required`.
     """
     # Authenticate the connection
-    user = await authenticate_websocket_user(websocket, token)
-    if not user:
+    authenticated = await authenticate_websocket_user(websocket, token)
+    if not authenticated:
         return
 
+    user, claims = authenticated
     user_id = user.id
 
     # Connect using the connection manager
-    await connection_manager.connect(user_id, websocket)
+    await connection_manager.connect(user_id, websocket, claims)
 
     try:
         while True:
             # Wait for messages from the client
             data = await websocket.receive_json()
+            connection_manager.touch(user_id)
+
+            frame_type = data.get("type", "message")
+
+            # Heartbeat replies only refresh the idle timer
+            if frame_type == "pong":
+                continue
 
-            # Validate the message structure
-            if "receiver_id" not in data or "content" not in data:
-                await websocket.send_json({"error": "Invalid message format"})
+            handler = FRAME_HANDLERS.get(frame_type)
+            if handler is None:
+                await websocket.send_json({"error": f"Unknown frame type: {frame_type}"})
                 continue
 
-            receiver_id = int(data["receiver_id"])
-            content = data["content"]
-
-            # Use context manager for database operations
-            try:
-                with get_db_context() as db:
-                    # Create and save the message to the database
-                    db_message = DirectMessage(
-                        content=content,
-                        sender_id=user_id,
-                        receiver_id=receiver_id,
-                        created_at=datetime.now(),
-                    )
-                    db.add(db_message)
-                    db.flush()  # Flush to get the ID without committing
-
-                    # Prepare message data to send
-                    message_data = {
-                        "id": db_message.id,
-                        "content": db_message.content,
-                        "created_at": db_message.created_at.isoformat(),
-                        "is_read": db_message.is_read,
-                        "sender_id": db_message.sender_id,
-                        "receiver_id": db_message.receiver_id,
-                    }
-
-                    # Send to the receiver if they are connected
-                    was_delivered = await connection_manager.send_personal_message(
-                        message={"type": "new_message", "data": message_data},
-                        user_id=receiver_id,
-                    )
-
-                    # Send confirmation back to the sender
-                    await websocket.send_json(
-                        {
-                            "type": "message_status",
-                            "data": {
-                                "status": "delivered" if was_delivered else "sent",
-                                "message": message_data,
-                            },
-                        }
-                    )
-
-            except Exception as db_error:
-                logger.error(
-                    f"Failed to save WebSocket message from user {user_id}: {str(db_error)}"
-                )
-                await websocket.send_json({"error": "Failed to save message"})
+            current_handler.set(f"ws:{frame_type}")
+            with profile_queries(f"ws:{frame_type}"):
+                await handler(websocket, user_id, data)
 
     except WebSocketDisconnect:
         # Remove the connection when client disconnects
-        connection_manager.disconnect(user_id)
+        connection_manager.disconnect(user_id, websocket)
     except Exception as e:
-        logger.error(f"WebSocket error for user {user_id}: {str(e)}")
-        connection_manager.disconnect(user_id)
+        logger.error("WebSocket error for user %s: %s", user_id, e)
+        connection_manager.disconnect(user_id, websocket)
         await websocket.close()
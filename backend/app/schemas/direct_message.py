@@ -1,7 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
+from .attachment import AttachmentResponse
 from .user import UserResponse
 
 
@@ -11,6 +12,8 @@ class DirectMessageBase(BaseModel):
 
 class DirectMessageCreate(DirectMessageBase):
     receiver_id: int
+    # An attachment uploaded by the sender through POST /attachments/
+    attachment_id: Optional[int] = None
 
 
 class DirectMessageResponse(DirectMessageBase):
@@ -19,14 +22,33 @@ class DirectMessageResponse(DirectMessageBase):
     receiver_id: int
     created_at: datetime
     is_read: bool
+    # Size of the full content when `content` is only a preview of it; the full
+    # content is at GET /direct-messages/{id}/content
+    content_bytes: Optional[int] = None
+    attachment_id: Optional[int] = None
 
-    # Include sender and receiver data in responses
-    sender: Optional[UserResponse] = None
-    receiver: Optional[UserResponse] = None
+    @computed_field
+    @property
+    def truncated(self) -> bool:
+        return self.content_bytes is not None
 
     class Config:
         from_attributes = True
 
 
+class DirectMessageContentResponse(BaseModel):
+    id: int
+    content: str
+
+
+class DirectMessageListResponse(BaseModel):
+    # Each participant appears once, keyed by id; messages reference them
+    # through sender_id/receiver_id
+    users: Dict[int, UserResponse]
+    messages: List[DirectMessageResponse]
+    # Attachments referenced by the messages, keyed by id
+    attachments: Dict[int, AttachmentResponse] = {}
+
+
 class UnreadCountResponse(BaseModel):
     unread_count: int
@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Dict, List
+
+from pydantic import BaseModel, Field
+
+from .user import UserResponse
+
+
+class GroupCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    member_ids: List[int] = []
+
+
+class GroupResponse(BaseModel):
+    id: int
+    name: str
+    created_by: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class GroupSummaryResponse(GroupResponse):
+    member_count: int
+    unread_count: int
+
+
+class GroupMemberAdd(BaseModel):
+    user_id: int
+
+
+class GroupMessageCreate(BaseModel):
+    content: str
+
+
+class GroupMessageResponse(BaseModel):
+    id: int
+    group_id: int
+    sender_id: int
+    content: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class GroupMessageListResponse(BaseModel):
+    # Senders appear once, keyed by id
+    users: Dict[int, UserResponse]
+    messages: List[GroupMessageResponse]
+
+
+class GroupReadCursor(BaseModel):
+    message_id: int
@@ -0,0 +1,36 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from .attachment import AttachmentResponse
+from .direct_message import DirectMessageResponse
+from .user import UserResponse
+
+
+class ConversationSummary(BaseModel):
+    user_id: int
+    last_message: Optional[DirectMessageResponse] = None
+    unread_count: int
+    # Read cursors: how far the current user has read the peer's messages, and
+    # how far the peer has read the current user's
+    last_read_message_id: int
+    peer_last_read_message_id: int
+
+
+class SyncResponse(BaseModel):
+    # Pass as `since` on the next sync
+    token: str
+    # True when this is a full snapshot (no `since`) rather than a delta
+    full: bool
+    # Changed conversations, newest last message first
+    conversations: List[ConversationSummary]
+    # Messages stored since the token, oldest first
+    messages: List[DirectMessageResponse]
+    # More messages changed than were returned; older ones are fetched per
+    # conversation from GET /direct-messages/
+    has_more_messages: bool
+    # Total over all conversations, in full snapshots only; apply the
+    # per-conversation counts of a delta instead
+    unread_count: Optional[int] = None
+    users: Dict[int, UserResponse]
+    attachments: Dict[int, AttachmentResponse] = {}
@@ -0,0 +1,376 @@
+"""
+Bulk data generator/importer for load testing, using PostgreSQL COPY.
+
+Usage:
+    python -m app.seed generate --users 10000 --conversations 50000 --messages 1000000
+    python -m app.seed import --users-file users.ndjson --messages-file messages.ndjson
+
+Rows are produced by generators and streamed straight into COPY ... FROM STDIN,
+so memory stays flat no matter how many rows are loaded.
+"""
+
+import argparse
+import bisect
+import csv
+import io
+import itertools
+import json
+import random
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import text
+
+from .database import engine
+from .logger import init_logger
+from .services.message_content import offload_large_messages
+from .services.partitions import add_months, ensure_partitions, month_start
+
+logger = init_logger(__name__)
+
+USER_COLUMNS = ["email", "username", "full_name", "auth_provider", "is_active"]
+MESSAGE_COLUMNS = ["content", "created_at", "sender_id", "receiver_id"]
+
+WORDS = (
+    "the be to of and a in that have it for not on with he as you do at this but "
+    "his by from they we say her she or an will my one all would there their what "
+    "so up out if about who get which go me when make can like time no just him know "
+    "take people into year your good some could them see other than then now look "
+    "only come its over think also back after use two how our work first well way even "
+    "new want because any these give day most us meeting deploy lunch tomorrow ok thanks"
+).split()
+
+
+class IteratorFile(io.TextIOBase):
+    """Read-only file object over an iterator of strings, for copy_expert"""
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def csv_chunks(rows: Iterable[Sequence], chunk_rows: int = 10000) -> Iterator[str]:
+    """Encode rows as CSV text in chunks of `chunk_rows` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            return
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def copy_rows(table: str, columns: List[str], rows: Iterable[Sequence]) -> int:
+    """Stream rows into a table with COPY FROM STDIN and return the row count"""
+    counted = _Counter(rows)
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                IteratorFile(csv_chunks(counted)),
+            )
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+    return counted.count
+
+
+class _Counter:
+    """Pass-through iterator that counts the rows it yields"""
+
+    def __init__(self, rows: Iterable):
+        self.rows = iter(rows)
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+def zipf_cum_weights(n: int, skew: float) -> List[float]:
+    """Cumulative Zipf weights for ranks 1..n (skew 0 means uniform)"""
+    return list(itertools.accumulate(1.0 / (rank**skew) for rank in range(1, n + 1)))
+
+
+def weighted_index(rng: random.Random, cum_weights: List[float]) -> int:
+    return bisect.bisect_left(cum_weights, rng.random() * cum_weights[-1])
+
+
+def fetch_user_ids(username_prefix: str) -> List[int]:
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM users WHERE username LIKE %s ORDER BY id",
+                (username_prefix + "%",),
+            )
+            return [row[0] for row in cursor.fetchall()]
+    finally:
+        raw_conn.close()
+
+
+def ensure_message_partitions(start: datetime, end: datetime):
+    """Create partitions for the months covered by [start, end]"""
+    with engine.begin() as conn:
+        ensure_partitions(conn, month_start(start.date()), add_months(month_start(end.date()), 1))
+
+
+def max_message_id() -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM direct_messages")).scalar()
+
+
+def set_read_cursors(after_id: int, read_ratio: float = 0.0):
+    """
+    Create the read cursors of every conversation direction loaded after
+    `after_id`, covering the oldest `read_ratio` of its messages.
+    """
+    last_read = "percentile_disc(:ratio) WITHIN GROUP (ORDER BY id)" if read_ratio > 0 else "0"
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO read_cursors (user_id, peer_id, last_read_message_id)
+                SELECT receiver_id, sender_id, {last_read}
+                FROM direct_messages
+                WHERE id > :after_id
+                GROUP BY receiver_id, sender_id
+                ON CONFLICT (user_id, peer_id) DO UPDATE
+                SET last_read_message_id = GREATEST(
+                    read_cursors.last_read_message_id, EXCLUDED.last_read_message_id
+                )
+                """
+            ),
+            {"ratio": min(read_ratio, 1.0), "after_id": after_id},
+        )
+
+
+def generate_users(run_id: str, count: int) -> Iterator[Tuple]:
+    for i in range(count):
+        username = f"seed_{run_id}_{i}"
+        yield (f"{username}@example.com", username, f"Seed User {i}", "seed", True)
+
+
+def generate_conversations(
+    rng: random.Random, user_ids: List[int], count: int, skew: float
+) -> List[Tuple[int, int]]:
+    """Pick distinct user pairs, favouring popular users according to `skew`"""
+    user_weights = zipf_cum_weights(len(user_ids), skew)
+    max_pairs = len(user_ids) * (len(user_ids) - 1) // 2
+    pairs = set()
+    while len(pairs) < min(count, max_pairs):
+        a = user_ids[weighted_index(rng, user_weights)]
+        b = user_ids[weighted_index(rng, user_weights)]
+        if a != b:
+            pairs.add((min(a, b), max(a, b)))
+    return list(pairs)
+
+
+def generate_messages(
+    rng: random.Random,
+    conversations: List[Tuple[int, int]],
+    count: int,
+    skew: float,
+    min_length: int,
+    max_length: int,
+    start: datetime,
+    end: datetime,
+) -> Iterator[Tuple]:
+    """Generate messages spread over conversations with a Zipf-skewed activity level"""
+    conversation_weights = zipf_cum_weights(len(conversations), skew)
+    # Slicing a random corpus is much faster than building every sentence
+    corpus = " ".join(rng.choice(WORDS) for _ in range(max(max_length, 1000) * 20))
+    span = (end - start).total_seconds()
+    # Log-normal lengths: mostly short chat lines with a long tail
+    median_length = max(min_length, min(max_length, 40))
+
+    for _ in range(count):
+        a, b = conversations[weighted_index(rng, conversation_weights)]
+        sender, receiver = (a, b) if rng.random() < 0.5 else (b, a)
+        length = int(rng.lognormvariate(0, 0.9) * median_length)
+        length = max(min_length, min(max_length, length))
+        offset = rng.randrange(0, len(corpus) - length)
+        created_at = start + timedelta(seconds=rng.random() * span)
+        yield (
+            corpus[offset : offset + length].strip() or "hi",
+            created_at.isoformat(),
+            sender,
+            receiver,
+        )
+
+
+def run_generate(args):
+    rng = random.Random(args.seed)
+    run_id = secrets.token_hex(3)
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=args.days)
+
+    started = time.perf_counter()
+    copy_rows("users", USER_COLUMNS, generate_users(run_id, args.users))
+    user_ids = fetch_user_ids(f"seed_{run_id}_")
+    logger.info("Inserted %s users (run %s)", len(user_ids), run_id)
+
+    conversations = generate_conversations(rng, user_ids, args.conversations, args.skew)
+    logger.info("Generated %s conversations", len(conversations))
+
+    ensure_message_partitions(start, end)
+    first_id = max_message_id()
+    message_started = time.perf_counter()
+    inserted = copy_rows(
+        "direct_messages",
+        MESSAGE_COLUMNS,
+        generate_messages(
+            rng,
+            conversations,
+            args.messages,
+            args.skew,
+            args.min_length,
+            args.max_length,
+            start,
+            end,
+        ),
+    )
+    elapsed = time.perf_counter() - message_started
+    logger.info(
+        "Inserted %s messages in %.1fs (%.0f rows/min)",
+        inserted,
+        elapsed,
+        inserted / max(elapsed, 1e-9) * 60,
+    )
+    set_read_cursors(first_id, args.read_ratio)
+
+    analyze()
+    logger.info("Seed run %s finished in %.1fs", run_id, time.perf_counter() - started)
+
+
+def read_ndjson(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def run_import(args):
+    if args.users_file:
+        count = copy_rows(
+            "users",
+            USER_COLUMNS,
+            (
+                (
+                    user["email"],
+                    user["username"],
+                    user.get("full_name"),
+                    user.get("auth_provider", "import"),
+                    user.get("is_active", True),
+                )
+                for user in read_ndjson(args.users_file)
+            ),
+        )
+        logger.info("Imported %s users", count)
+
+    if args.messages_file:
+        # One pass to find the time range so the partitions exist before COPY
+        oldest = newest = None
+        for message in read_ndjson(args.messages_file):
+            created_at = datetime.fromisoformat(message["created_at"])
+            if oldest is None or created_at < oldest:
+                oldest = created_at
+            if newest is None or created_at > newest:
+                newest = created_at
+        if oldest is not None:
+            ensure_message_partitions(oldest, newest)
+
+        first_id = max_message_id()
+        count = copy_rows(
+            "direct_messages",
+            MESSAGE_COLUMNS,
+            (
+                (
+                    message["content"],
+                    message["created_at"],
+                    message["sender_id"],
+                    message["receiver_id"],
+                )
+                for message in read_ndjson(args.messages_file)
+            ),
+        )
+        # Read state is not part of the export; imported messages start unread
+        set_read_cursors(first_id)
+        # COPY bypasses insert_direct_message, so large content is moved here
+        with engine.begin() as conn:
+            offload_large_messages(conn, after_id=first_id)
+        logger.info("Imported %s messages", count)
+
+    analyze()
+
+
+def analyze():
+    raw_conn = engine.raw_connection()
+    try:
+        raw_conn.autocommit = True
+        with raw_conn.cursor() as cursor:
+            cursor.execute("ANALYZE users")
+            cursor.execute("ANALYZE direct_messages")
+            cursor.execute("ANALYZE read_cursors")
+    finally:
+        raw_conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load users and messages with COPY")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="Generate synthetic data")
+    generate_parser.add_argument("--users", type=int, default=1000)
+    generate_parser.add_argument("--conversations", type=int, default=5000)
+    generate_parser.add_argument("--messages", type=int, default=100000)
+    generate_parser.add_argument(
+        "--skew", type=float, default=1.1, help="Zipf exponent for user/conversation activity"
+    )
+    generate_parser.add_argument("--min-length", type=int, default=1)
+    generate_parser.add_argument("--max-length", type=int, default=500)
+    generate_parser.add_argument("--days", type=int, default=90, help="History span in days")
+    generate_parser.add_argument(
+        "--read-ratio", type=float, default=0.9, help="Share of each conversation marked read"
+    )
+    generate_parser.add_argument("--seed", type=int, default=None, help="Random seed")
+
+    import_parser = subparsers.add_parser(
+        "import", help="Import NDJSON users and messages (e.g. from /direct-messages/export)"
+    )
+    import_parser.add_argument("--users-file")
+    import_parser.add_argument("--messages-file")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        run_generate(args)
+    elif args.command == "import":
+        run_import(args)
+
+
+if __name__ == "__main__":
+    main()
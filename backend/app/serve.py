@@ -0,0 +1,232 @@
+"""
+Multi-worker launcher.
+
+Usage:
+    python -m app.serve --workers 4 --host 0.0.0.0 --port 8000
+
+Binds the listening socket once and spawns N uvicorn workers that share it.
+The launcher process itself runs the cluster hub: a Unix socket server the
+workers connect to (see app.cluster) for cross-worker WebSocket delivery,
+presence and cache events, so no external broker is needed. Workers that die
+are restarted.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+from typing import Dict, Optional, Set
+
+import uvicorn
+
+from .cluster import MAX_FRAME_BYTES, encode_frame
+from .config import settings
+from .logger import init_logger
+
+logger = init_logger(__name__)
+
+multiprocessing.allow_connection_pickling()
+spawn = multiprocessing.get_context("spawn")
+
+
+class ClusterHub:
+    """
+    Routes frames between workers and tracks which worker holds which user.
+
+    Writes to a worker never wait, so one slow worker cannot stall the others;
+    a worker with more than `max_buffer_bytes` unsent is disconnected instead.
+    """
+
+    def __init__(self, max_buffer_bytes: int = settings.CLUSTER_MAX_BUFFER_BYTES):
+        self.max_buffer_bytes = max_buffer_bytes
+        self.workers: Dict[str, asyncio.StreamWriter] = {}
+        # {user_id: {worker_id}}
+        self.user_workers: Dict[int, Set[str]] = {}
+        self.frames_routed = 0
+        self.lagging_disconnects = 0
+
+    def _write(self, worker_id: str, data: bytes):
+        writer = self.workers[worker_id]
+        transport = writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > self.max_buffer_bytes:
+            # Its connection handler drops the worker once the socket is closed
+            logger.warning(
+                "Worker %s is %s bytes behind, disconnecting it", worker_id, self.max_buffer_bytes
+            )
+            self.lagging_disconnects += 1
+            transport.abort()
+            return
+        writer.write(data)
+
+    def _broadcast(self, data: bytes, exclude: Optional[str] = None):
+        for worker_id in self.workers:
+            if worker_id != exclude:
+                self._write(worker_id, data)
+
+    def set_status(self, worker_id: str, user_id: int, online: bool):
+        workers = self.user_workers.get(user_id)
+        if online:
+            if workers:
+                workers.add(worker_id)
+                return
+            self.user_workers[user_id] = {worker_id}
+        else:
+            if not workers or worker_id not in workers:
+                return
+            workers.discard(worker_id)
+            if workers:
+                return
+            del self.user_workers[user_id]
+        # The user's cluster-wide state changed
+        self._broadcast(encode_frame({"op": "status", "user_id": user_id, "online": online}))
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker_id = None
+        try:
+            hello = json.loads(await reader.readline())
+            worker_id = str(hello["worker"])
+            if worker_id in self.workers:
+                # A restarted worker reusing its id; the old connection is gone
+                self._drop_worker(worker_id)
+            self.workers[worker_id] = writer
+            self._write(worker_id, encode_frame({"op": "snapshot", "online": list(self.user_workers)}))
+            for user_id in hello.get("users", ()):
+                self.set_status(worker_id, user_id, True)
+            logger.info("Worker %s connected to the hub", worker_id)
+
+            while line := await reader.readline():
+                frame = json.loads(line)
+                op = frame["op"]
+                self.frames_routed += 1
+                if op == "status":
+                    self.set_status(worker_id, frame["user_id"], frame["online"])
+                elif op == "deliver":
+                    for target in self.user_workers.get(frame["user_id"], ()):
+                        if target != worker_id:
+                            self._write(target, line)
+                elif op == "deliver_many":
+                    self._deliver_many(worker_id, frame)
+                elif op == "publish":
+                    self._broadcast(line, exclude=worker_id)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Worker %s connection failed: %s", worker_id, e)
+        finally:
+            if worker_id is not None and self.workers.get(worker_id) is writer:
+                self._drop_worker(worker_id)
+                logger.info("Worker %s left the hub", worker_id)
+            writer.close()
+
+    def _deliver_many(self, sender: str, frame: dict):
+        # {worker_id: [user_id]}, so each worker gets a single frame
+        targets: Dict[str, list] = {}
+        for user_id in frame["user_ids"]:
+            for target in self.user_workers.get(user_id, ()):
+                if target != sender:
+                    targets.setdefault(target, []).append(user_id)
+        for target, user_ids in targets.items():
+            self._write(
+                target,
+                encode_frame({"op": "deliver_many", "user_ids": user_ids, "text": frame["text"]}),
+            )
+
+    def _drop_worker(self, worker_id: str):
+        self.workers.pop(worker_id, None)
+        for user_id in [uid for uid, workers in self.user_workers.items() if worker_id in workers]:
+            self.set_status(worker_id, user_id, False)
+
+
+def _serve_worker(config: uvicorn.Config, sockets):
+    # Logging is configured per process, like uvicorn's own worker processes
+    config.configure_logging()
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def _spawn_worker(config: uvicorn.Config, sockets, worker_id: str):
+    # Spawned children inherit the environment at start(), which is how the
+    # worker learns its id before app.config is imported
+    os.environ["CLUSTER_WORKER_ID"] = worker_id
+    process = spawn.Process(target=_serve_worker, args=(config, sockets), daemon=False)
+    process.start()
+    return process
+
+
+async def run(args):
+    socket_path = settings.CLUSTER_SOCKET_PATH or os.path.join(
+        tempfile.mkdtemp(prefix="chat-cluster-"), "hub.sock"
+    )
+    os.environ["CLUSTER_SOCKET_PATH"] = socket_path
+
+    hub = ClusterHub()
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(
+        hub.handle_worker, socket_path, limit=MAX_FRAME_BYTES
+    )
+
+    config = uvicorn.Config(
+        args.app, host=args.host, port=args.port, log_level=args.log_level, workers=args.workers
+    )
+    sockets = [config.bind_socket()]
+    # asyncio only disables Nagle on accepted sockets when the listener was
+    # created with proto=IPPROTO_TCP, which bind_socket() does not do; small
+    # responses would otherwise wait ~40 ms for delayed ACKs. Accepted sockets
+    # inherit the option from the listener.
+    for sock in sockets:
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    workers = {str(i): _spawn_worker(config, sockets, str(i)) for i in range(args.workers)}
+    logger.info("Started %s workers on %s:%s", args.workers, args.host, args.port)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    while not stopping.is_set():
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            pass
+        if stopping.is_set():
+            break
+        for worker_id, process in list(workers.items()):
+            if not process.is_alive():
+                logger.warning(
+                    "Worker %s exited with code %s; restarting", worker_id, process.exitcode
+                )
+                workers[worker_id] = await asyncio.to_thread(
+                    _spawn_worker, config, sockets, worker_id
+                )
+
+    logger.info("Shutting down workers")
+    for process in workers.values():
+        process.terminate()
+    for worker_id, process in workers.items():
+        await asyncio.to_thread(process.join, 10)
+        if process.is_alive():
+            logger.warning("Worker %s did not shut down in time; killing it", worker_id)
+            process.kill()
+    server.close()
+    await server.wait_closed()
+    os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the app with several worker processes")
+    parser.add_argument("--app", default="app.main:app", help="ASGI app import string")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.WEB_CONCURRENCY)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
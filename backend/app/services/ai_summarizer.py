@@ -1,3 +1,4 @@
+import time
 from datetime import datetime
 from typing import Dict, List
 
@@ -6,6 +7,7 @@ from langchain_core.output_parsers import StrOutputParser
 
 from ..config import settings
 from ..logger import init_logger
+from ..metrics import llm_request_duration, llm_tokens
 from .prompts import CHAT_SUMMARIZATION_TEMPLATE
 
 logger = init_logger(__name__)
@@ -25,12 +27,14 @@ class AIChatSummarizer:
 
             self.prompt_template = CHAT_SUMMARIZATION_TEMPLATE
 
-            # Create the summarization chain
-            self.summarizer_chain = self.prompt_template | self.llm | StrOutputParser()
+            # Create the summarization chain; the output is parsed separately so the
+            # response's token usage metadata is still available
+            self.summarizer_chain = self.prompt_template | self.llm
+            self.output_parser = StrOutputParser()
 
             logger.info("AI Chat Summarizer initialized")
         except Exception as e:
-            logger.error(f"Failed to initialize AI Chat Summarizer: {str(e)}")
+            logger.error("Failed to initialize AI Chat Summarizer: %s", e)
             raise
 
     def format_messages_for_summary(self, messages: List[Dict]) -> str:
@@ -105,12 +109,21 @@ class AIChatSummarizer:
                 }
 
             actual_count = len(messages)
-            logger.info(f"Generating summary for {actual_count} messages")
+            logger.info("Generating summary for %s messages", actual_count)
 
             # Generate summary using the chain
-            summary = await self.summarizer_chain.ainvoke(
+            started = time.perf_counter()
+            response = await self.summarizer_chain.ainvoke(
                 {"conversation": formatted_conversation, "message_count": actual_count}
             )
+            llm_request_duration.observe(time.perf_counter() - started)
+
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                llm_tokens.labels("input").inc(usage.get("input_tokens", 0))
+                llm_tokens.labels("output").inc(usage.get("output_tokens", 0))
+
+            summary = self.output_parser.invoke(response)
 
             if not summary or not summary.strip():
                 return {
@@ -128,7 +141,7 @@ class AIChatSummarizer:
                 "model_used": settings.GEMINI_MODEL_NAME,
             }
         except Exception as e:
-            logger.error(f"Failed to summarize conversation: {str(e)}")
+            logger.error("Failed to summarize conversation: %s", e)
             return {
                 "success": False,
                 "error": f"Failed to generate summary: {str(e)}",
@@ -0,0 +1,303 @@
+"""
+Attachment storage and streaming uploads.
+
+Uploads are parsed from the request body as it arrives: the file part is
+hashed and written to a staging file chunk by chunk, so memory use does not
+depend on the file size. The finished file is handed to the attachment store
+under its SHA-256, and a store that already holds that hash keeps its copy,
+so identical files are stored once.
+
+The store is pluggable through ATTACHMENT_STORE: "local" (files under
+ATTACHMENT_DIR) or "package.module:ClassName" for any AttachmentStore
+subclass, such as an object store client.
+"""
+
+import hashlib
+import importlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, List, Optional
+
+import anyio
+from python_multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy import exists, or_, select
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import autocommit_engine
+from ..metrics import attachment_uploads
+from ..models.attachment import Attachment
+from ..models.direct_message import DirectMessage
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+UPLOAD_FIELD = "file"
+
+
+class AttachmentStore(ABC):
+    """Content-addressed blob storage; keys are SHA-256 hex digests"""
+
+    @abstractmethod
+    def put(self, key: str, source_path: str) -> bool:
+        """
+        Store the file at `source_path` under `key`, consuming the file.
+        Returns False if the key was already stored; the source is then
+        discarded.
+        """
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Open a stored object for reading"""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Path of the stored object on the local filesystem, if it has one"""
+        return None
+
+    def staging_dir(self) -> str:
+        """Directory for in-progress uploads"""
+        return tempfile.gettempdir()
+
+
+class LocalFileStore(AttachmentStore):
+    """
+    Objects stored as files under `root`, sharded by the first bytes of the
+    hash. Uploads are staged under the same root, so storing one is a rename.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, key: str, source_path: str) -> bool:
+        path = self._path(key)
+        if os.path.exists(path):
+            os.unlink(source_path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        return True
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+    def staging_dir(self) -> str:
+        path = os.path.join(self.root, "staging")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+
+def create_store(name: str) -> AttachmentStore:
+    if name == "local":
+        return LocalFileStore(settings.ATTACHMENT_DIR)
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+attachment_store = create_store(settings.ATTACHMENT_STORE)
+
+
+class InvalidUpload(Exception):
+    """The request is not a multipart upload with a file part"""
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+@dataclass
+class ReceivedFile:
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    path: str
+
+
+class _FilePartReceiver:
+    """
+    Callbacks for python-multipart's push parser. Data of the file part is
+    buffered per network chunk and flushed to the staging file (and the hash)
+    between chunks, off the event loop.
+    """
+
+    def __init__(self, staging_path: str, max_bytes: int):
+        self.staging_path = staging_path
+        self.max_bytes = max_bytes
+        self.file: Optional[BinaryIO] = None
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.filename: Optional[str] = None
+        self.content_type = DEFAULT_CONTENT_TYPE
+        self.pending: List[bytes] = []
+        self.done = False
+
+        self._headers: Dict[str, str] = {}
+        self._field = b""
+        self._value = b""
+        self._in_file = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._field.decode("latin-1").lower()] = self._value.decode("latin-1")
+        self._field = self._value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get("content-disposition"))
+        # Only the first file part is kept; other fields are ignored
+        self._in_file = (
+            not self.done
+            and options.get(b"name") == UPLOAD_FIELD.encode()
+            and b"filename" in options
+        )
+        if self._in_file:
+            self.filename = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+            self.content_type = self._headers.get("content-type") or DEFAULT_CONTENT_TYPE
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.size += end - start
+            if self.size > self.max_bytes:
+                raise UploadTooLarge()
+            self.pending.append(data[start:end])
+
+    def on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self.done = True
+
+    def flush(self):
+        if self.file is None:
+            self.file = open(self.staging_path, "wb")
+        data = b"".join(self.pending)
+        self.pending = []
+        self.hasher.update(data)
+        self.file.write(data)
+
+
+async def receive_upload(
+    content_type: Optional[str], body: AsyncIterator[bytes], max_bytes: int
+) -> ReceivedFile:
+    """
+    Stream the `file` part of a multipart/form-data body into a staging file.
+
+    Raises InvalidUpload when there is no file part and UploadTooLarge as soon
+    as the file exceeds `max_bytes`; the staging file is removed in both cases.
+    """
+    mime_type, options = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if mime_type != b"multipart/form-data" or not boundary:
+        raise InvalidUpload("Expected a multipart/form-data body")
+
+    fd, staging_path = tempfile.mkstemp(dir=attachment_store.staging_dir())
+    os.close(fd)
+    receiver = _FilePartReceiver(staging_path, max_bytes)
+    parser = MultipartParser(boundary, receiver.callbacks())
+    try:
+        async for chunk in body:
+            parser.write(chunk)
+            if receiver.pending:
+                await anyio.to_thread.run_sync(receiver.flush)
+        parser.finalize()
+        if not receiver.done:
+            raise InvalidUpload(f"Missing '{UPLOAD_FIELD}' file part")
+        if receiver.file is None:
+            # Empty file
+            await anyio.to_thread.run_sync(receiver.flush)
+    except BaseException:
+        if receiver.file is not None:
+            receiver.file.close()
+        os.unlink(staging_path)
+        raise
+    receiver.file.close()
+
+    return ReceivedFile(
+        filename=receiver.filename or "file",
+        content_type=receiver.content_type,
+        size=receiver.size,
+        sha256=receiver.hasher.hexdigest(),
+        path=staging_path,
+    )
+
+
+def store_attachment(db: Session, uploader_id: int, received: ReceivedFile) -> Attachment:
+    """Move a received file into the store and record the upload"""
+    stored = attachment_store.put(received.sha256, received.path)
+    attachment_uploads.labels("stored" if stored else "deduplicated").inc()
+
+    attachment = Attachment(
+        uploader_id=uploader_id,
+        sha256=received.sha256,
+        size=received.size,
+        filename=received.filename[:255],
+        content_type=received.content_type[:255],
+    )
+    db.add(attachment)
+    db.commit()
+    db.refresh(attachment)
+    return attachment
+
+
+def owns_attachment(user_id: int, attachment_id: int) -> bool:
+    with autocommit_engine.connect() as conn:
+        return conn.execute(
+            select(
+                exists().where(Attachment.id == attachment_id, Attachment.uploader_id == user_id)
+            )
+        ).scalar()
+
+
+def accessible_attachment(db: Session, user_id: int, attachment_id: int) -> Optional[Attachment]:
+    """
+    An attachment the user uploaded or received: it is readable by its
+    uploader and by both sides of any direct message referencing it.
+    """
+    shared = exists().where(
+        DirectMessage.attachment_id == Attachment.id,
+        or_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == user_id),
+    )
+    return db.execute(
+        select(Attachment).where(
+            Attachment.id == attachment_id,
+            or_(Attachment.uploader_id == user_id, shared),
+        )
+    ).scalar_one_or_none()
+
+
+def attachments_by_id(db: Session, messages: List[dict]) -> Dict[int, Attachment]:
+    """The attachments referenced by a page of messages, in one query (none if unused)"""
+    ids = {m["attachment_id"] for m in messages if m.get("attachment_id") is not None}
+    if not ids:
+        return {}
+    return {a.id: a for a in db.query(Attachment).filter(Attachment.id.in_(ids)).all()}
+
+
+def iter_object(key: str, chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """Read a stored object in chunks, for stores without local paths"""
+    with attachment_store.open(key) as source:
+        while chunk := source.read(chunk_size):
+            yield chunk
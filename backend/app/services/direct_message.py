@@ -0,0 +1,440 @@
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import (
+    Integer,
+    LargeBinary,
+    Text,
+    and_,
+    exists,
+    func,
+    insert,
+    literal,
+    literal_column,
+    or_,
+    select,
+    true,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from ..cluster import cluster_client
+from ..database import SessionLocal, autocommit_engine, engine, read_router
+from ..models.attachment import Attachment
+from ..models.direct_message import CHANGE_XID, DirectMessage, MessageBody, ReadCursor
+from ..models.user import User
+from ..schemas.user import UserResponse
+from .message_cache import recent_message_cache, with_read_flags
+from .message_content import decompress, split_content
+from .partitions import partition_id_ranges
+
+T = TypeVar("T")
+
+# Columns of a stored message as returned by the service functions; `is_read`
+# is added from the read cursors. `content` is a preview when `content_bytes`
+# is set (see services/message_content.py)
+MESSAGE_COLUMNS = [
+    "id",
+    "content",
+    "content_bytes",
+    "created_at",
+    "sender_id",
+    "receiver_id",
+    "attachment_id",
+]
+
+
+def insert_direct_message(
+    sender_id: int, receiver_id: int, content: str, attachment_id: Optional[int] = None
+) -> Optional[dict]:
+    """
+    Store a direct message in a single round-trip.
+
+    The receiver check is folded into an INSERT ... SELECT ... RETURNING, so no
+    row is written and None is returned when the receiver does not exist, or
+    when `attachment_id` is given and is not an attachment the sender uploaded. The
+    statement runs in autocommit mode, so there is no separate BEGIN/COMMIT and
+    no refresh SELECT afterwards. The message is also appended to the recent
+    message cache when its conversation is cached, on every worker.
+
+    The same statement creates the receiver's read cursor for the sender if
+    the conversation has none yet, so unread counts only ever need to look at
+    the read_cursors rows of the receiver. Content over MESSAGE_INLINE_MAX_BYTES
+    is stored compressed in message_bodies, also in the same statement, and the
+    message row and the returned message carry only a preview.
+    """
+    inline, body, size = split_content(content)
+    source = select(
+        literal(inline, Text),
+        literal(size, Integer),
+        literal(sender_id, Integer),
+        User.id,
+        literal(attachment_id, Integer),
+    ).where(User.id == receiver_id)
+    if attachment_id is not None:
+        source = source.where(
+            exists().where(Attachment.id == attachment_id, Attachment.uploader_id == sender_id)
+        )
+    stored = (
+        insert(DirectMessage)
+        .from_select(
+            ["content", "content_bytes", "sender_id", "receiver_id", "attachment_id"], source
+        )
+        .returning(*(getattr(DirectMessage, column) for column in MESSAGE_COLUMNS))
+        .cte("stored")
+    )
+    cursor = (
+        pg_insert(ReadCursor)
+        .from_select(
+            ["user_id", "peer_id", "last_read_message_id"],
+            select(stored.c.receiver_id, stored.c.sender_id, literal(0, Integer)),
+        )
+        .on_conflict_do_nothing()
+        .cte("cursor")
+    )
+    stmt = select(stored).add_cte(cursor)
+    if body is not None:
+        stmt = stmt.add_cte(
+            insert(MessageBody)
+            .from_select(["message_id", "data"], select(stored.c.id, literal(body, LargeBinary)))
+            .cte("body")
+        )
+
+    with autocommit_engine.connect() as conn:
+        row = conn.execute(stmt).first()
+
+    if row is None:
+        return None
+    message = dict(row._mapping)
+    _apply_stored_message(dict(message))
+    cluster_client.publish("message_stored", message_payload(message))
+    # A message is always unread when it is stored
+    return {**message, "is_read": False}
+
+
+def mark_read_up_to(reader_id: int, message_id: int, bounded: bool = True) -> Optional[dict]:
+    """
+    Mark a message and everything before it from the same sender as read.
+
+    This is a single upsert of the reader's cursor for that sender, done in
+    autocommit mode; no message row is written. The cursor only moves
+    forward. Returns the read event, or None when nothing moved: the message
+    does not exist (within the created_at bound when `bounded`, see
+    `message_id_is`), is not addressed to the reader, or was already read.
+    """
+    source = select(DirectMessage.receiver_id, DirectMessage.sender_id, DirectMessage.id).where(
+        message_id_is(message_id, bounded), DirectMessage.receiver_id == reader_id
+    )
+    stmt = pg_insert(ReadCursor).from_select(
+        ["user_id", "peer_id", "last_read_message_id"], source
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ReadCursor.user_id, ReadCursor.peer_id],
+        set_={
+            "last_read_message_id": stmt.excluded.last_read_message_id,
+            "change_xid": literal_column(CHANGE_XID),
+        },
+        where=ReadCursor.last_read_message_id < stmt.excluded.last_read_message_id,
+    ).returning(ReadCursor.user_id, ReadCursor.peer_id, ReadCursor.last_read_message_id)
+
+    with autocommit_engine.connect() as conn:
+        row = conn.execute(stmt).first()
+    if row is None:
+        return None
+
+    event = {
+        "reader_id": row.user_id,
+        "peer_id": row.peer_id,
+        "last_read_message_id": row.last_read_message_id,
+    }
+    _apply_message_read(event)
+    cluster_client.publish("message_read", event)
+    return event
+
+
+def _apply_stored_message(message: dict):
+    # Both sides may fetch the conversation right away; keep them on the primary
+    read_router.record_write(message["sender_id"], message["receiver_id"])
+    recent_message_cache.append(message)
+
+
+def _apply_message_read(event: dict):
+    read_router.record_write(event["reader_id"])
+    recent_message_cache.mark_read(
+        event["reader_id"], event["peer_id"], event["last_read_message_id"]
+    )
+
+
+def _on_remote_message_stored(frame: dict):
+    message = frame["data"]
+    _apply_stored_message({**message, "created_at": datetime.fromisoformat(message["created_at"])})
+
+
+def _on_remote_message_read(frame: dict):
+    _apply_message_read(frame["data"])
+
+
+# Keep caches and read-your-writes state in step with writes made on other workers
+cluster_client.on("message_stored", _on_remote_message_stored)
+cluster_client.on("message_read", _on_remote_message_read)
+
+
+def conversation_filter(user_id: int, other_user_id: int):
+    """WHERE clause matching the messages exchanged between two users"""
+    return or_(
+        and_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == other_user_id),
+        and_(DirectMessage.sender_id == other_user_id, DirectMessage.receiver_id == user_id),
+    )
+
+
+def message_id_is(message_id: int, bounded: bool = True) -> ColumnElement:
+    """
+    WHERE clause matching a message by id. When `bounded`, it is also bounded
+    by created_at so Postgres only scans the partitions the id was in when
+    the id ranges were loaded; a miss must then be retried without the bound
+    (see `find_by_message_id`).
+    """
+    condition = DirectMessage.id == message_id
+    lower_bound = partition_id_ranges.lower_bound(message_id) if bounded else None
+    if lower_bound is not None:
+        condition = and_(condition, DirectMessage.created_at >= lower_bound)
+    return condition
+
+
+def find_by_message_id(
+    lookup: Callable[[ColumnElement], Optional[T]], message_id: int
+) -> Optional[T]:
+    """
+    Run `lookup` with a bounded message_id_is clause, and again without the
+    bound when it finds nothing, since a message imported into an ended month
+    after the id ranges were loaded is outside its bound
+    """
+    result = lookup(message_id_is(message_id))
+    if result is None and partition_id_ranges.lower_bound(message_id) is not None:
+        partition_id_ranges.unbounded_retries += 1
+        result = lookup(message_id_is(message_id, bounded=False))
+    return result
+
+
+def find_message(db: Session, message_id: int) -> Optional[DirectMessage]:
+    """A message by id, None if there is no such message"""
+    return find_by_message_id(
+        lambda condition: db.query(DirectMessage).filter(condition).first(), message_id
+    )
+
+
+def unread_count(db: Session, user_id: int) -> int:
+    """
+    Count the messages received after the user's read cursors.
+
+    Every conversation with a message to the user has a cursor, so this is one
+    index range count on (receiver_id, sender_id, id) per conversation, and
+    its cost grows with the number of unread messages rather than with the
+    history.
+    """
+    unread = (
+        select(func.count().label("count"))
+        .where(
+            DirectMessage.receiver_id == ReadCursor.user_id,
+            DirectMessage.sender_id == ReadCursor.peer_id,
+            DirectMessage.id > ReadCursor.last_read_message_id,
+        )
+        .lateral("unread")
+    )
+    return db.execute(
+        select(func.coalesce(func.sum(unread.c.count), 0))
+        .select_from(ReadCursor)
+        .join(unread, true())
+        .where(ReadCursor.user_id == user_id)
+    ).scalar_one()
+
+
+def read_cursors(
+    db: Session, user_id: int, other_user_id: Optional[int] = None
+) -> Dict[Tuple[int, int], int]:
+    """
+    Read cursors of the user's conversations, in both directions, keyed by
+    (reader_id, peer_id); only those with `other_user_id` when given.
+    """
+    if other_user_id is None:
+        condition = or_(ReadCursor.user_id == user_id, ReadCursor.peer_id == user_id)
+    else:
+        condition = or_(
+            and_(ReadCursor.user_id == user_id, ReadCursor.peer_id == other_user_id),
+            and_(ReadCursor.user_id == other_user_id, ReadCursor.peer_id == user_id),
+        )
+    rows = db.execute(
+        select(ReadCursor.user_id, ReadCursor.peer_id, ReadCursor.last_read_message_id).where(
+            condition
+        )
+    )
+    return {(row.user_id, row.peer_id): row.last_read_message_id for row in rows}
+
+
+def add_read_flags(messages: List[dict], cursors: Dict[Tuple[int, int], int]) -> List[dict]:
+    """Set `is_read` on messages from any conversations, given read_cursors()"""
+    for message in messages:
+        cursor = cursors.get((message["receiver_id"], message["sender_id"]), 0)
+        message["is_read"] = message["id"] <= cursor
+    return messages
+
+
+def latest_messages(
+    db: Session, user_id: int, other_user_id: int, limit: int
+) -> Tuple[List[dict], Dict[int, UserResponse]]:
+    """
+    Return the newest `limit` messages of a conversation (oldest first) and its
+    participants keyed by id.
+
+    Served from the recent message cache when possible; otherwise read from the
+    database, fetching at least a full cache window so that the next call hits.
+    The cache is only filled from the primary: when `db` is on a replica, a
+    miss is read from the primary instead.
+    """
+    cached = recent_message_cache.latest(user_id, other_user_id, limit)
+    if cached is not None:
+        return cached
+
+    if recent_message_cache.capacity > 0 and db.get_bind() is not engine:
+        with SessionLocal() as primary:
+            return _load_latest_messages(primary, user_id, other_user_id, limit)
+    return _load_latest_messages(db, user_id, other_user_id, limit)
+
+
+def _load_latest_messages(
+    db: Session, user_id: int, other_user_id: int, limit: int
+) -> Tuple[List[dict], Dict[int, UserResponse]]:
+    fetch = max(limit, recent_message_cache.capacity)
+    rows = db.execute(
+        select(*(getattr(DirectMessage, column) for column in MESSAGE_COLUMNS))
+        .where(conversation_filter(user_id, other_user_id))
+        .order_by(DirectMessage.created_at.desc(), DirectMessage.id.desc())
+        .limit(fetch)
+    ).mappings()
+    messages = [dict(row) for row in rows]
+    messages.reverse()
+
+    users = db.query(User).filter(User.id.in_({user_id, other_user_id})).all()
+    participants = {user.id: UserResponse.model_validate(user) for user in users}
+    cursors = {
+        reader_id: last_read
+        for (reader_id, _), last_read in read_cursors(db, user_id, other_user_id).items()
+    }
+
+    if other_user_id in participants:
+        recent_message_cache.fill(
+            user_id,
+            other_user_id,
+            messages,
+            complete=len(messages) < fetch,
+            participants=participants,
+            cursors=cursors,
+        )
+    return with_read_flags(messages[-limit:], cursors), participants
+
+
+def message_payload(message: dict) -> dict:
+    """Convert a stored message into the JSON shape sent over WebSockets"""
+    return {
+        **message,
+        "created_at": message["created_at"].isoformat(),
+        "truncated": message["content_bytes"] is not None,
+    }
+
+
+def full_content(db: Session, user_id: int, message_id: int) -> Optional[str]:
+    """
+    The full content of a message the user sent or received, decompressed from
+    message_bodies when it was stored out of line; None if there is no such
+    message.
+    """
+    row = find_by_message_id(
+        lambda condition: db.execute(
+            select(DirectMessage.content, MessageBody.data)
+            .outerjoin(MessageBody, MessageBody.message_id == DirectMessage.id)
+            .where(
+                condition,
+                or_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == user_id),
+            )
+        ).first(),
+        message_id,
+    )
+    if row is None:
+        return None
+    return decompress(row.data) if row.data is not None else row.content
+
+
+def full_contents(db: Session, messages: List[dict]) -> List[dict]:
+    """
+    Copies of messages already read for the user with the full content in place
+    of truncated previews, fetched from message_bodies in one query
+    """
+    truncated = [message["id"] for message in messages if message["content_bytes"] is not None]
+    if not truncated:
+        return messages
+    bodies = dict(
+        db.execute(
+            select(MessageBody.message_id, MessageBody.data).where(
+                MessageBody.message_id.in_(truncated)
+            )
+        ).all()
+    )
+    return [
+        {**message, "content": decompress(bodies[message["id"]])}
+        if message["id"] in bodies
+        else message
+        for message in messages
+    ]
+
+
+EXPORT_COLUMNS = ["id", "created_at", "sender_id", "receiver_id", "content"]
+
+
+def iter_conversation_batches(
+    user_id: int,
+    other_user_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = 1000,
+) -> Iterator[List[dict]]:
+    """
+    Stream a conversation in chronological batches through a server-side cursor.
+
+    Only `batch_size` rows are held in memory at a time, and plain column rows are
+    fetched instead of ORM objects. The session is owned by the generator, so it
+    stays open for as long as the response is being streamed. It is a read
+    session, served by a replica when one is available. Exported messages
+    carry their full content, including content stored in message_bodies.
+    """
+    stmt = (
+        select(
+            *(getattr(DirectMessage, column) for column in EXPORT_COLUMNS),
+            MessageBody.data.label("body"),
+        )
+        .outerjoin(MessageBody, MessageBody.message_id == DirectMessage.id)
+        .where(conversation_filter(user_id, other_user_id))
+        .order_by(DirectMessage.created_at, DirectMessage.id)
+        .execution_options(yield_per=batch_size)
+    )
+    # Time bounds let Postgres prune partitions outside the range
+    if since is not None:
+        stmt = stmt.where(DirectMessage.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(DirectMessage.created_at < until)
+
+    db = read_router.open_session(user_id)
+    try:
+        for partition in db.execute(stmt).mappings().partitions():
+            yield [_with_full_content(row) for row in partition]
+    finally:
+        db.close()
+
+
+def _with_full_content(row: RowMapping) -> dict:
+    message = dict(row)
+    body = message.pop("body")
+    if body is not None:
+        message["content"] = decompress(body)
+    return message
@@ -0,0 +1,239 @@
+from collections import OrderedDict
+from typing import FrozenSet, Iterable, List, Optional
+
+from sqlalchemy import Integer, func, insert, literal, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..cluster import cluster_client
+from ..config import settings
+from ..database import autocommit_engine, read_router
+from ..models.group import Group, GroupMember, GroupMessage
+from ..models.user import User
+
+GROUP_MESSAGE_COLUMNS = ["id", "group_id", "sender_id", "content", "created_at"]
+
+
+class GroupMemberCache:
+    """
+    In-process LRU cache of group member ids.
+
+    Sending to a group needs its member list twice (the sender's membership
+    check and the fan-out), so for a cached group a send costs one INSERT and
+    no membership query. Entries are dropped on every membership change, on
+    this worker directly and on the others through a cluster event. Empty
+    results are not cached, so a group id probed before the group exists
+    cannot stick as empty.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.groups: OrderedDict[int, FrozenSet[int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, group_id: int) -> Optional[FrozenSet[int]]:
+        members = self.groups.get(group_id)
+        if members is None:
+            self.misses += 1
+            return None
+        self.groups.move_to_end(group_id)
+        self.hits += 1
+        return members
+
+    def put(self, group_id: int, members: FrozenSet[int]):
+        if self.capacity <= 0 or not members:
+            return
+        self.groups[group_id] = members
+        self.groups.move_to_end(group_id)
+        while len(self.groups) > self.capacity:
+            self.groups.popitem(last=False)
+
+    def invalidate(self, group_id: int):
+        self.groups.pop(group_id, None)
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "groups": len(self.groups),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+group_member_cache = GroupMemberCache(capacity=settings.GROUP_MEMBER_CACHE_SIZE)
+
+
+def group_members(group_id: int) -> FrozenSet[int]:
+    """Member ids of a group (empty if it does not exist), usually from the cache"""
+    members = group_member_cache.get(group_id)
+    if members is None:
+        with autocommit_engine.connect() as conn:
+            members = frozenset(
+                conn.execute(
+                    select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+                ).scalars()
+            )
+        group_member_cache.put(group_id, members)
+    return members
+
+
+def _members_changed(group_id: int):
+    group_member_cache.invalidate(group_id)
+    cluster_client.publish("group_members_changed", {"group_id": group_id})
+
+
+cluster_client.on(
+    "group_members_changed",
+    lambda frame: group_member_cache.invalidate(frame["data"]["group_id"]),
+)
+
+
+def _join_statement(group_id: int, user_ids: Iterable[int]):
+    # New members start with everything sent so far marked as read; unknown
+    # user ids are skipped by the join with users
+    latest = (
+        select(func.coalesce(func.max(GroupMessage.id), 0))
+        .where(GroupMessage.group_id == group_id)
+        .scalar_subquery()
+    )
+    return (
+        pg_insert(GroupMember)
+        .from_select(
+            ["group_id", "user_id", "last_read_message_id"],
+            select(literal(group_id, Integer), User.id, latest).where(
+                User.id.in_(list(user_ids))
+            ),
+        )
+        .on_conflict_do_nothing()
+    )
+
+
+def create_group(db: Session, creator_id: int, name: str, member_ids: Iterable[int]) -> Group:
+    """Create a group with the creator and the given users as members"""
+    group = Group(name=name, created_by=creator_id)
+    db.add(group)
+    db.flush()
+    db.execute(_join_statement(group.id, {creator_id, *member_ids}))
+    db.commit()
+    db.refresh(group)
+    return group
+
+
+def add_group_member(db: Session, group_id: int, user_id: int) -> bool:
+    """Add a user to a group; returns False if the user does not exist or is already in it"""
+    added = db.execute(_join_statement(group_id, [user_id])).rowcount
+    db.commit()
+    if added:
+        _members_changed(group_id)
+    return bool(added)
+
+
+def remove_group_member(db: Session, group_id: int, user_id: int) -> bool:
+    removed = (
+        db.query(GroupMember)
+        .filter(GroupMember.group_id == group_id, GroupMember.user_id == user_id)
+        .delete()
+    )
+    db.commit()
+    if removed:
+        _members_changed(group_id)
+    return bool(removed)
+
+
+def insert_group_message(group_id: int, sender_id: int, content: str) -> dict:
+    """
+    Store a group message once, in a single autocommit round-trip.
+
+    Membership is checked by the caller against group_members(), so there is
+    no per-member row and no extra query here.
+    """
+    stmt = (
+        insert(GroupMessage)
+        .values(group_id=group_id, sender_id=sender_id, content=content)
+        .returning(*(getattr(GroupMessage, column) for column in GROUP_MESSAGE_COLUMNS))
+    )
+    with autocommit_engine.connect() as conn:
+        row = conn.execute(stmt).one()
+    read_router.record_write(sender_id)
+    return dict(row._mapping)
+
+
+def group_message_payload(message: dict) -> dict:
+    """Convert a stored group message into the JSON shape sent over WebSockets"""
+    return {**message, "created_at": message["created_at"].isoformat()}
+
+
+def mark_group_read(db: Session, group_id: int, user_id: int, message_id: int):
+    """
+    Move a member's read cursor forward to `message_id`, capped at the group's
+    newest message.
+
+    One UPDATE of one membership row, whatever the number of messages read.
+    The row is left alone when the cursor would not move, so repeated receipts
+    for old messages write nothing.
+    """
+    latest = (
+        select(func.coalesce(func.max(GroupMessage.id), 0))
+        .where(GroupMessage.group_id == group_id)
+        .scalar_subquery()
+    )
+    target = func.least(message_id, latest)
+    db.execute(
+        update(GroupMember)
+        .where(
+            GroupMember.group_id == group_id,
+            GroupMember.user_id == user_id,
+            GroupMember.last_read_message_id < target,
+        )
+        .values(last_read_message_id=target)
+    )
+    db.commit()
+    read_router.record_write(user_id)
+
+
+def list_user_groups(db: Session, user_id: int) -> List[dict]:
+    """
+    The user's groups with member and unread counts.
+
+    Unread messages are those after the member's cursor not sent by the member,
+    counted as a range scan on (group_id, id).
+    """
+    rows = db.execute(
+        text(
+            """
+            SELECT g.id, g.name, g.created_by, g.created_at,
+                (SELECT count(*) FROM group_members m WHERE m.group_id = g.id) AS member_count,
+                (
+                    SELECT count(*) FROM group_messages gm
+                    WHERE gm.group_id = g.id
+                        AND gm.id > me.last_read_message_id
+                        AND gm.sender_id <> me.user_id
+                ) AS unread_count
+            FROM group_members me
+            JOIN groups g ON g.id = me.group_id
+            WHERE me.user_id = :user_id
+            ORDER BY g.id
+            """
+        ),
+        {"user_id": user_id},
+    ).mappings()
+    return [dict(row) for row in rows]
+
+
+def group_history(
+    db: Session, group_id: int, limit: int, before_id: Optional[int] = None
+) -> List[dict]:
+    """The newest `limit` messages before `before_id`, oldest first"""
+    stmt = (
+        select(*(getattr(GroupMessage, column) for column in GROUP_MESSAGE_COLUMNS))
+        .where(GroupMessage.group_id == group_id)
+        .order_by(GroupMessage.id.desc())
+        .limit(limit)
+    )
+    if before_id is not None:
+        stmt = stmt.where(GroupMessage.id < before_id)
+    messages = [dict(row) for row in db.execute(stmt).mappings()]
+    messages.reverse()
+    return messages
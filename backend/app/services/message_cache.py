@@ -0,0 +1,208 @@
+import sys
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..metrics import CallbackGauge, message_cache_requests, registry
+
+ConversationKey = Tuple[int, int]
+
+# Rough per-message overhead of the dict, its keys and the non-content values
+MESSAGE_OVERHEAD_BYTES = 400
+
+
+def conversation_key(user_id: int, other_user_id: int) -> ConversationKey:
+    return (min(user_id, other_user_id), max(user_id, other_user_id))
+
+
+def message_size(message: dict) -> int:
+    return MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message["content"])
+
+
+def with_read_flags(messages: List[dict], cursors: Dict[int, int]) -> List[dict]:
+    """Copies of the messages with `is_read` derived from {reader_id: last_read_message_id}"""
+    return [
+        {**message, "is_read": message["id"] <= cursors.get(message["receiver_id"], 0)}
+        for message in messages
+    ]
+
+
+class _Conversation:
+    __slots__ = ("messages", "participants", "cursors", "complete", "size")
+
+    def __init__(self, capacity: int, participants: dict, cursors: Dict[int, int]):
+        self.messages: deque = deque(maxlen=capacity)
+        # {user_id: UserResponse} for both sides of the conversation
+        self.participants = participants
+        # {reader_id: last_read_message_id} for both sides of the conversation
+        self.cursors = cursors
+        # True while `messages` holds the whole conversation, not just its tail
+        self.complete = True
+        self.size = 0
+
+
+class RecentMessageCache:
+    """
+    In-process ring buffer of the newest messages of active conversations.
+
+    A conversation enters the cache when its latest page is read from the
+    database (`fill`) and then stays current through `append`, which both the
+    REST and WebSocket send paths call after storing a message. Writes to
+    conversations that are not cached are ignored, so a buffer never has gaps.
+    Fills read from the primary, since a lagging replica would leave out
+    messages that were already appended here.
+    Fills and appends run on the event loop without awaiting in between, so a
+    write cannot slip between a fill's SELECT and its insertion here.
+
+    Each conversation keeps at most `capacity` messages; conversations are
+    evicted least recently used first when the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, capacity: int, max_bytes: int):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.conversations: OrderedDict[ConversationKey, _Conversation] = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = message_cache_requests.labels("hit")
+        self.misses = message_cache_requests.labels("miss")
+
+    def latest(
+        self, user_id: int, other_user_id: int, limit: int
+    ) -> Optional[Tuple[List[dict], dict]]:
+        """
+        Return the newest `limit` messages (oldest first, with read flags) and
+        the participants, or None when the cache cannot answer.
+        """
+        key = conversation_key(user_id, other_user_id)
+        entry = self.conversations.get(key)
+        if entry is None or (limit > len(entry.messages) and not entry.complete):
+            self.misses.inc()
+            return None
+
+        self.conversations.move_to_end(key)
+        self.hits.inc()
+        messages = list(entry.messages)
+        if limit < len(messages):
+            messages = messages[-limit:]
+        return with_read_flags(messages, entry.cursors), entry.participants
+
+    def fill(
+        self,
+        user_id: int,
+        other_user_id: int,
+        messages: List[dict],
+        complete: bool,
+        participants: dict,
+        cursors: Dict[int, int],
+    ):
+        """
+        Cache the tail of a conversation read from the database.
+
+        `messages` are oldest first; `complete` says whether they are the whole
+        conversation (the query returned fewer rows than it asked for).
+        `cursors` are both participants' read cursors.
+        """
+        if self.capacity <= 0:
+            return
+        key = conversation_key(user_id, other_user_id)
+        self._remove(key)
+
+        entry = _Conversation(self.capacity, participants, dict(cursors))
+        entry.complete = complete and len(messages) <= self.capacity
+        # Kept in id order, which append relies on
+        for message in sorted(messages[-self.capacity:], key=lambda m: m["id"]):
+            entry.messages.append(message)
+            entry.size += message_size(message)
+        self.conversations[key] = entry
+        self.total_bytes += entry.size
+        self._evict()
+
+    def append(self, message: dict):
+        """
+        Add a newly stored message to its conversation, if cached, in id order.
+
+        Workers can commit messages out of id order, so a message may arrive
+        after one with a higher id; it is inserted in place rather than dropped.
+        A message a fill already loaded is skipped.
+        """
+        key = conversation_key(message["sender_id"], message["receiver_id"])
+        entry = self.conversations.get(key)
+        if entry is None:
+            return
+
+        messages = entry.messages
+        position = len(messages)
+        while position and messages[position - 1]["id"] > message["id"]:
+            position -= 1
+        if position and messages[position - 1]["id"] == message["id"]:
+            return
+        if position == 0 and messages:
+            # Older than everything cached: only kept while the whole
+            # conversation is, and while there is room for it
+            if not entry.complete:
+                return
+            if len(messages) == messages.maxlen:
+                entry.complete = False
+                return
+
+        if len(messages) == messages.maxlen:
+            dropped = messages.popleft()
+            position -= 1
+            entry.size -= message_size(dropped)
+            self.total_bytes -= message_size(dropped)
+            entry.complete = False
+        messages.insert(position, message)
+        entry.size += message_size(message)
+        self.total_bytes += message_size(message)
+        self.conversations.move_to_end(key)
+        self._evict()
+
+    def mark_read(self, reader_id: int, peer_id: int, last_read_message_id: int):
+        """Move a reader's cursor forward, if the conversation is cached"""
+        entry = self.conversations.get(conversation_key(reader_id, peer_id))
+        if entry is None:
+            return
+        if last_read_message_id > entry.cursors.get(reader_id, 0):
+            entry.cursors[reader_id] = last_read_message_id
+
+    def _remove(self, key: ConversationKey):
+        entry = self.conversations.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.conversations:
+            _, entry = self.conversations.popitem(last=False)
+            self.total_bytes -= entry.size
+
+    def get_stats(self) -> dict:
+        hits, misses = int(self.hits.value), int(self.misses.value)
+        return {
+            "conversations": len(self.conversations),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        }
+
+
+recent_message_cache = RecentMessageCache(
+    capacity=settings.MESSAGE_CACHE_SIZE,
+    max_bytes=settings.MESSAGE_CACHE_MAX_BYTES,
+)
+registry.register(
+    CallbackGauge(
+        "message_cache_bytes",
+        "Estimated size of the recent message cache",
+        lambda: recent_message_cache.total_bytes,
+    )
+)
+registry.register(
+    CallbackGauge(
+        "message_cache_conversations",
+        "Conversations held in the recent message cache",
+        lambda: len(recent_message_cache.conversations),
+    )
+)
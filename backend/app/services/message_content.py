@@ -0,0 +1,100 @@
+import zlib
+from typing import Optional, Tuple
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.engine import Connection
+
+from ..config import settings
+from ..logger import init_logger
+from ..models.direct_message import DirectMessage, MessageBody
+
+logger = init_logger(__name__)
+
+# UTF-8 needs at most 4 bytes per character, so shorter strings are never
+# measured
+MAX_UTF8_BYTES_PER_CHAR = 4
+
+
+def content_size(content: str, limit: int) -> Optional[int]:
+    """Size of the content in UTF-8 bytes if it exceeds `limit`, otherwise None"""
+    if len(content) * MAX_UTF8_BYTES_PER_CHAR <= limit:
+        return None
+    size = len(content.encode("utf-8"))
+    return size if size > limit else None
+
+
+def exceeds_size_limit(content: str) -> bool:
+    return content_size(content, settings.MESSAGE_MAX_BYTES) is not None
+
+
+def size_limit_error() -> str:
+    return f"Message content is limited to {settings.MESSAGE_MAX_BYTES} bytes"
+
+
+def split_content(content: str) -> Tuple[str, Optional[bytes], Optional[int]]:
+    """
+    Decide how a direct message's content is stored.
+
+    Returns (inline content, compressed body, full size in bytes). Content up to
+    MESSAGE_INLINE_MAX_BYTES is stored inline as is, with no body; larger
+    content is stored as a preview plus the compressed full text.
+    """
+    size = content_size(content, settings.MESSAGE_INLINE_MAX_BYTES)
+    if size is None:
+        return content, None, None
+    preview = content[: settings.MESSAGE_PREVIEW_CHARS]
+    return preview, zlib.compress(content.encode("utf-8")), size
+
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+# Executed once per row; created_at lets Postgres update a single partition
+OFFLOAD_UPDATE = (
+    update(DirectMessage.__table__)
+    .where(
+        DirectMessage.__table__.c.id == bindparam("m_id"),
+        DirectMessage.__table__.c.created_at == bindparam("m_created_at"),
+    )
+    .values(content=bindparam("content"), content_bytes=bindparam("size"))
+)
+
+
+def offload_large_messages(conn: Connection, after_id: int = 0, batch_size: int = 500) -> int:
+    """
+    Move the content of inline messages over MESSAGE_INLINE_MAX_BYTES with an
+    id above `after_id` to message_bodies, leaving a preview behind. Used for
+    rows written without going through insert_direct_message (older rows and
+    bulk imports). Returns the number of messages moved.
+    """
+    moved = 0
+    while True:
+        rows = conn.execute(
+            select(DirectMessage.id, DirectMessage.created_at, DirectMessage.content)
+            .where(
+                DirectMessage.id > after_id,
+                DirectMessage.content_bytes.is_(None),
+                func.octet_length(DirectMessage.content) > settings.MESSAGE_INLINE_MAX_BYTES,
+            )
+            .order_by(DirectMessage.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        bodies, previews = [], []
+        for row in rows:
+            preview, body, size = split_content(row.content)
+            bodies.append({"message_id": row.id, "data": body})
+            previews.append(
+                {"m_id": row.id, "m_created_at": row.created_at, "content": preview, "size": size}
+            )
+        conn.execute(MessageBody.__table__.insert(), bodies)
+        conn.execute(OFFLOAD_UPDATE, previews)
+        moved += len(rows)
+        after_id = rows[-1].id
+
+    if moved:
+        logger.info("Moved the content of %s large messages to message_bodies", moved)
+    return moved
@@ -0,0 +1,408 @@
+"""
+Monthly range partitions for the direct_messages table.
+
+Usage:
+    python -m app.services.partitions ensure
+    python -m app.services.partitions convert
+    python -m app.services.partitions archive --older-than-months 12 [--drop]
+"""
+
+import argparse
+import asyncio
+import gzip
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from ..config import settings
+from ..database import engine
+from ..logger import init_logger
+from ..models.attachment import Attachment  # noqa: F401 (resolves the attachments foreign key)
+from ..models.direct_message import DirectMessage, MessageBody
+from ..models.user import User  # noqa: F401 (resolves the users foreign keys)
+
+logger = init_logger(__name__)
+
+PARENT_TABLE = DirectMessage.__tablename__
+BODIES_TABLE = MessageBody.__tablename__
+# pg_advisory_xact_lock key serializing schema changes (migrations and partition
+# upkeep) across workers and deploy jobs
+SCHEMA_LOCK_ID = 0x636861747070
+# Columns added by migrations after the partitioned schema
+LATER_COLUMNS = ["content_bytes", "attachment_id", "change_xid"]
+PARTITION_NAME_RE = re.compile(rf"^{PARENT_TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    """Check whether direct_messages is a partitioned table"""
+    return bool(
+        conn.execute(
+            text(
+                """
+                SELECT 1 FROM pg_partitioned_table pt
+                JOIN pg_class c ON c.oid = pt.partrelid
+                WHERE c.relname = :table
+                """
+            ),
+            {"table": PARENT_TABLE},
+        ).scalar()
+    )
+
+
+def list_partitions(conn: Connection) -> List[Tuple[str, date]]:
+    """List attached monthly partitions as (name, month start), oldest first"""
+    rows = conn.execute(
+        text(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :table
+            """
+        ),
+        {"table": PARENT_TABLE},
+    )
+
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((name, date(int(match[1]), int(match[2]), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def ensure_partitions(conn: Connection, start: date, end: date) -> List[str]:
+    """Create the monthly partitions covering [start, end], returning the new ones"""
+    existing = {name for name, _ in list_partitions(conn)}
+    created = []
+
+    month = month_start(start)
+    while month <= end:
+        name = partition_name(month)
+        if name not in existing:
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+                    f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+                    f"TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+                )
+            )
+            created.append(name)
+        month = add_months(month, 1)
+
+    return created
+
+
+def ensure_upcoming_partitions(conn: Connection) -> List[str]:
+    """Create partitions from the current month to PARTITION_MONTHS_AHEAD"""
+    if not is_partitioned(conn):
+        logger.warning(
+            "%s is not partitioned; "
+            "run `python -m app.services.partitions convert`",
+            PARENT_TABLE,
+        )
+        return []
+
+    this_month = month_start(datetime.now(timezone.utc).date())
+    created = ensure_partitions(
+        conn, this_month, add_months(this_month, settings.PARTITION_MONTHS_AHEAD)
+    )
+    if created:
+        logger.info("Created partitions: %s", ", ".join(created))
+    return created
+
+
+def ensure_future_partitions(bind: Engine = engine) -> List[str]:
+    """Make sure partitions exist from the current month to PARTITION_MONTHS_AHEAD"""
+    with bind.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+        return ensure_upcoming_partitions(conn)
+
+
+class PartitionIdRanges:
+    """
+    Message id ranges of the closed monthly partitions, for turning lookups by
+    id into lookups Postgres can prune by created_at.
+
+    A partition is closed an hour after its month has ended; its (min id, max id) is
+    read from the primary key when the ranges are loaded. Ids come from one
+    sequence, so a message not in any closed range was in a partition that was
+    still open. Ranges may overlap (imported history has ids out of time
+    order), which only weakens the pruning.
+
+    A row written into a closed month after the ranges were loaded, by an
+    import, is outside its bound until the next reload, so a lookup that
+    misses under the bound must be retried without it. The ranges are loaded
+    by the partition maintenance task; until then there is no bound.
+    """
+
+    def __init__(self):
+        # (month start, min id, max id) of the closed partitions, oldest first
+        self._ranges: List[Tuple[datetime, int, int]] = []
+        # Start of the first month that was open; None when not loaded or
+        # direct_messages is not partitioned, which disables the bounds
+        self._open_from: Optional[datetime] = None
+        self._loaded = False
+        self.unbounded_retries = 0
+
+    def load(self, bind: Engine = engine):
+        with bind.connect() as conn:
+            ranges = []
+            open_from = None
+            if is_partitioned(conn):
+                # Give inserts in flight when the month ended time to commit
+                settled = datetime.now(timezone.utc) - timedelta(hours=1)
+                this_month = month_start(settled.date())
+                for name, month in list_partitions(conn):
+                    if month >= this_month:
+                        break
+                    low, high = conn.execute(text(f"SELECT MIN(id), MAX(id) FROM {name}")).one()
+                    if low is not None:
+                        ranges.append((_as_datetime(month), low, high))
+                open_from = _as_datetime(this_month)
+        self._ranges, self._open_from = ranges, open_from
+        self._loaded = True
+
+    def lower_bound(self, message_id: int) -> Optional[datetime]:
+        """Earliest created_at the message with this id had when the ranges were loaded"""
+        for month, low, high in self._ranges:
+            if low <= message_id <= high:
+                return month
+        return self._open_from
+
+    def covers(self, message_id: int, created_at: datetime) -> bool:
+        """Whether a message is inside the created_at bound its id gets"""
+        lower_bound = self.lower_bound(message_id)
+        return lower_bound is None or created_at >= lower_bound
+
+    def get_stats(self) -> dict:
+        return {
+            "closed_partitions": len(self._ranges),
+            "loaded": self._loaded,
+            "unbounded_retries": self.unbounded_retries,
+        }
+
+
+def _as_datetime(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+partition_id_ranges = PartitionIdRanges()
+
+
+async def run_partition_maintenance():
+    """Background loop keeping future partitions created and the id ranges current"""
+    # Lookups by id are not bounded until the ranges are loaded
+    try:
+        await asyncio.to_thread(partition_id_ranges.load)
+    except Exception as e:
+        logger.error("Loading the partition id ranges failed: %s", e)
+    while True:
+        await asyncio.sleep(settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(ensure_future_partitions)
+            await asyncio.to_thread(partition_id_ranges.load)
+        except Exception as e:
+            logger.error("Partition maintenance failed: %s", e)
+
+
+def convert_to_partitioned(bind: Engine = engine):
+    """
+    Convert an existing unpartitioned direct_messages table in place.
+    Runs in a single transaction, so the table is locked while rows are copied.
+    """
+    with bind.begin() as conn:
+        if is_partitioned(conn):
+            logger.info("%s is already partitioned", PARENT_TABLE)
+            return
+
+        legacy = f"{PARENT_TABLE}_legacy"
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {legacy}"))
+        conn.execute(
+            text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {PARENT_TABLE}_pkey TO {legacy}_pkey")
+        )
+        for index in DirectMessage.__table__.indexes:
+            conn.execute(
+                text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_legacy")
+            )
+
+        DirectMessage.__table__.create(conn)
+
+        oldest = conn.execute(text(f"SELECT MIN(created_at) FROM {legacy}")).scalar()
+        this_month = month_start(datetime.now(timezone.utc).date())
+        ensure_partitions(
+            conn,
+            month_start(oldest.astimezone(timezone.utc).date()) if oldest else this_month,
+            add_months(this_month, settings.PARTITION_MONTHS_AHEAD),
+        )
+
+        # Tables migrated before conversion may already have the newer columns
+        legacy_columns = set(
+            conn.execute(
+                text("SELECT column_name FROM information_schema.columns WHERE table_name = :table"),
+                {"table": legacy},
+            ).scalars()
+        )
+        optional = [column for column in LATER_COLUMNS if column in legacy_columns]
+        columns = ", ".join(["id", "content", "sender_id", "receiver_id", *optional])
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO {PARENT_TABLE} ({columns}, created_at)
+                SELECT {columns}, COALESCE(created_at, now())
+                FROM {legacy}
+                """
+            )
+        )
+        conn.execute(
+            text(
+                f"""
+                SELECT setval(
+                    pg_get_serial_sequence('{PARENT_TABLE}', 'id'),
+                    COALESCE((SELECT MAX(id) FROM {PARENT_TABLE}), 0) + 1,
+                    false
+                )
+                """
+            )
+        )
+        conn.execute(text(f"DROP TABLE {legacy}"))
+
+    logger.info("Converted %s to a partitioned table", PARENT_TABLE)
+
+
+def list_detached_partitions(conn: Connection) -> List[Tuple[str, date]]:
+    """List monthly partition tables that are no longer attached, oldest first"""
+    rows = conn.execute(
+        text(
+            """
+            SELECT c.relname FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind = 'r' AND n.nspname = current_schema()
+              AND c.relname LIKE :prefix
+              AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)
+            """
+        ),
+        {"prefix": f"{PARENT_TABLE}_p%"},
+    )
+
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((name, date(int(match[1]), int(match[2]), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _export(cursor, query: str, path: str):
+    """COPY a query to a gzip file, which only appears once the export is complete"""
+    partial = f"{path}.partial"
+    try:
+        with gzip.open(partial, "wb") as archive_file:
+            cursor.copy_expert(f"COPY {query} TO STDOUT WITH (FORMAT csv, HEADER)", archive_file)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def archive_partitions(
+    older_than_months: int,
+    output_dir: str = settings.ARCHIVE_DIR,
+    drop: bool = False,
+    bind: Engine = engine,
+) -> List[str]:
+    """
+    Export partitions whose month ended more than `older_than_months` ago to
+    gzip-compressed CSV files in `output_dir`, with the message_bodies rows
+    of their messages in a second `.bodies.csv.gz` file, and detach them.
+    With drop=True the detached tables and their bodies are deleted too.
+
+    Each partition is exported and detached in one transaction that blocks
+    writes to it, so a failed export leaves it attached and no partial file
+    behind. Partitions detached by earlier runs are exported if their archive
+    file is missing, and dropped with drop=True.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cutoff = add_months(month_start(datetime.now(timezone.utc).date()), -older_than_months)
+
+    with bind.connect() as conn:
+        attached = [name for name, month in list_partitions(conn) if add_months(month, 1) <= cutoff]
+        detached = [
+            name for name, month in list_detached_partitions(conn) if add_months(month, 1) <= cutoff
+        ]
+
+    archived = []
+    for name in detached + attached:
+        path = os.path.join(output_dir, f"{name}.csv.gz")
+        bodies_path = os.path.join(output_dir, f"{name}.bodies.csv.gz")
+        bodies = f"(SELECT b.* FROM {BODIES_TABLE} b JOIN {name} m ON m.id = b.message_id)"
+        raw_conn = bind.raw_connection()
+        try:
+            with raw_conn.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {name} IN SHARE MODE")
+                if name in attached or not (os.path.exists(path) and os.path.exists(bodies_path)):
+                    _export(cursor, name, path)
+                    _export(cursor, bodies, bodies_path)
+                if name in attached:
+                    cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+                if drop:
+                    cursor.execute(
+                        f"DELETE FROM {BODIES_TABLE} b USING {name} m WHERE m.id = b.message_id"
+                    )
+                    cursor.execute(f"DROP TABLE {name}")
+            raw_conn.commit()
+        except BaseException:
+            raw_conn.rollback()
+            raise
+        finally:
+            raw_conn.close()
+
+        archived.append(path)
+        logger.info("Archived partition %s to %s", name, path)
+
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage direct_messages partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("ensure", help="Create partitions for upcoming months")
+    subparsers.add_parser("convert", help="Convert an unpartitioned table in place")
+
+    archive_parser = subparsers.add_parser("archive", help="Export and detach old partitions")
+    archive_parser.add_argument("--older-than-months", type=int, required=True)
+    archive_parser.add_argument("--output-dir", default=settings.ARCHIVE_DIR)
+    archive_parser.add_argument(
+        "--drop", action="store_true", help="Drop partitions after exporting them"
+    )
+
+    args = parser.parse_args()
+    if args.command == "ensure":
+        ensure_future_partitions()
+    elif args.command == "convert":
+        convert_to_partitioned()
+    elif args.command == "archive":
+        archive_partitions(args.older_than_months, args.output_dir, args.drop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from ..config import settings
+
+
+class TokenBucketLimiter:
+    """
+    In-process token bucket rate limiter.
+
+    Each key (usually a user id) gets a bucket holding up to `burst` tokens that
+    refills at `rate` tokens per second. Checks are O(1) and memory is bounded by
+    `max_keys`: the least recently used bucket is dropped when the limit is hit.
+    An evicted key simply starts again with a full bucket, which is what it would
+    have refilled to anyway after being idle.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # {key: [tokens, last_refill_time]}
+        self.buckets: OrderedDict[Hashable, list] = OrderedDict()
+
+        self.allowed = 0
+        self.throttled = 0
+
+    def try_acquire(self, key: Hashable) -> float:
+        """
+        Consume one token for the key.
+
+        Returns 0.0 if the call is allowed, otherwise the number of seconds
+        until a token becomes available.
+        """
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self.buckets.popitem(last=False)
+            bucket = [float(self.burst), now]
+            self.buckets[key] = bucket
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            self.allowed += 1
+            return 0.0
+
+        self.throttled += 1
+        return (1.0 - bucket[0]) / self.rate
+
+    def get_stats(self) -> dict:
+        """Get limiter counters"""
+        return {
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "tracked_keys": len(self.buckets),
+        }
+
+
+# Shared limiter for message sends, applied per user across sockets and REST
+message_rate_limiter = TokenBucketLimiter(
+    rate=settings.RATE_LIMIT_MESSAGES_PER_SECOND,
+    burst=settings.RATE_LIMIT_BURST,
+    max_keys=settings.RATE_LIMIT_MAX_TRACKED_USERS,
+)
@@ -0,0 +1,221 @@
+"""
+Delta sync: everything about a user's direct messages that changed since a
+change token, in one call.
+
+Writes record the id of their transaction in `change_xid`: messages when they
+are stored, read cursors whenever they move. A token is the xmin of the
+snapshot a sync read from. Every transaction with a lower id had finished
+before that snapshot was taken, so the sync saw its writes; every write it
+could not see has an id of at least the token. The next sync returns the rows
+with `change_xid >= token`, so nothing is missed even though transactions
+commit out of id order. A change can be returned twice, so clients apply
+changes by id.
+
+A lagging replica can hand back an older token than it was given; the changes
+it has not replayed yet come with a later sync.
+"""
+
+from typing import Collection, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, literal_column, or_, select, true, union, union_all
+from sqlalchemy.orm import Session, aliased
+
+from ..models.direct_message import DirectMessage, ReadCursor
+from ..models.user import User
+from .attachments import attachments_by_id
+from .direct_message import MESSAGE_COLUMNS, add_read_flags
+
+SNAPSHOT_XMIN = "pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+
+class InvalidSyncToken(Exception):
+    pass
+
+
+def parse_token(token: str) -> int:
+    if not token.isdigit():
+        raise InvalidSyncToken(token)
+    return int(token)
+
+
+def current_token(db: Session) -> int:
+    """The token for changes not visible to the statements that follow"""
+    return db.execute(select(literal_column(SNAPSHOT_XMIN))).scalar_one()
+
+
+def changed_messages(
+    db: Session, user_id: int, since: int, limit: int
+) -> Tuple[List[dict], bool]:
+    """
+    The newest `limit` messages sent or received since the token (oldest
+    first), from the partial change_xid indexes, and whether there were more.
+    """
+    rows = db.execute(
+        select(*(getattr(DirectMessage, column) for column in MESSAGE_COLUMNS))
+        .where(
+            or_(DirectMessage.receiver_id == user_id, DirectMessage.sender_id == user_id),
+            DirectMessage.change_xid >= since,
+        )
+        .order_by(DirectMessage.created_at.desc(), DirectMessage.id.desc())
+        .limit(limit + 1)
+    ).mappings()
+    messages = [dict(row) for row in rows]
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return messages, has_more
+
+
+def _conversation_peers(user_id: int, since: Optional[int], peer_ids: Collection[int]):
+    """
+    The user's conversation partners, from the read cursors (every conversation
+    has one from its first message); with `since`, only those whose cursors
+    moved since the token or that are in `peer_ids`.
+    """
+    as_reader = select(ReadCursor.peer_id.label("peer_id")).where(ReadCursor.user_id == user_id)
+    as_peer = select(ReadCursor.user_id.label("peer_id")).where(ReadCursor.peer_id == user_id)
+    if since is not None:
+        as_reader = as_reader.where(
+            or_(ReadCursor.change_xid >= since, ReadCursor.peer_id.in_(peer_ids))
+        )
+        as_peer = as_peer.where(
+            or_(ReadCursor.change_xid >= since, ReadCursor.user_id.in_(peer_ids))
+        )
+    return union(as_reader, as_peer).subquery("peers")
+
+
+def conversation_summaries(
+    db: Session, user_id: int, since: Optional[int] = None, peer_ids: Collection[int] = ()
+) -> List[dict]:
+    """
+    One entry per conversation, newest last message first: the last message,
+    the unread count and both read cursors. All conversations, or with `since`
+    those changed since the token (see _conversation_peers).
+
+    A single statement: per conversation, the last message is the newer of two
+    index probes on (sender_id, receiver_id, created_at), and the unread count
+    is a range count past the user's cursor, as in unread_count().
+    """
+    peer = _conversation_peers(user_id, since, peer_ids).c.peer_id
+    mine = aliased(ReadCursor)
+    theirs = aliased(ReadCursor)
+
+    def newest(sender_id, receiver_id):
+        return (
+            select(*(getattr(DirectMessage, column) for column in MESSAGE_COLUMNS))
+            .where(DirectMessage.sender_id == sender_id, DirectMessage.receiver_id == receiver_id)
+            .order_by(DirectMessage.created_at.desc(), DirectMessage.id.desc())
+            .limit(1)
+        )
+
+    last = (
+        union_all(newest(user_id, peer), newest(peer, user_id))
+        .order_by(literal_column("created_at").desc(), literal_column("id").desc())
+        .limit(1)
+        .lateral("last")
+    )
+    last_read = func.coalesce(mine.last_read_message_id, 0)
+    unread = (
+        select(func.count().label("count"))
+        .where(
+            DirectMessage.receiver_id == user_id,
+            DirectMessage.sender_id == peer,
+            DirectMessage.id > last_read,
+        )
+        .lateral("unread")
+    )
+    rows = db.execute(
+        select(
+            peer.label("user_id"),
+            last_read.label("last_read_message_id"),
+            func.coalesce(theirs.last_read_message_id, 0).label("peer_last_read_message_id"),
+            unread.c.count.label("unread_count"),
+            *last.c,
+        )
+        .select_from(peer.table)
+        .outerjoin(mine, and_(mine.user_id == user_id, mine.peer_id == peer))
+        .outerjoin(theirs, and_(theirs.user_id == peer, theirs.peer_id == user_id))
+        .outerjoin(last, true())
+        .join(unread, true())
+        .order_by(last.c.created_at.desc().nulls_last(), last.c.id.desc())
+    ).mappings()
+
+    summaries = []
+    for row in rows:
+        message = None
+        if row["id"] is not None:
+            message = {column: row[column] for column in MESSAGE_COLUMNS}
+            cursor = (
+                row["peer_last_read_message_id"]
+                if message["sender_id"] == user_id
+                else row["last_read_message_id"]
+            )
+            message["is_read"] = message["id"] <= cursor
+        summaries.append(
+            {
+                "user_id": row["user_id"],
+                "last_message": message,
+                "unread_count": row["unread_count"],
+                "last_read_message_id": row["last_read_message_id"],
+                "peer_last_read_message_id": row["peer_last_read_message_id"],
+            }
+        )
+    return summaries
+
+
+def sync(db: Session, user_id: int, since: Optional[int], max_messages: int) -> dict:
+    """
+    Everything changed for the user since the token, or a full snapshot of the
+    conversation list without one.
+
+    A delta holds the messages stored since the token, and a summary of every
+    conversation with new messages or moved read cursors, which also gives
+    the conversation order. When more than `max_messages` messages changed,
+    only the newest are returned (`has_more_messages`), and the summaries
+    cover all conversations so the client can tell which ones to refetch.
+    The total unread count is only given when all conversations are. The
+    number of queries does not depend on the number of conversations.
+    """
+    token = current_token(db)
+
+    messages: List[dict] = []
+    has_more = False
+    if since is None:
+        conversations = conversation_summaries(db, user_id)
+    else:
+        messages, has_more = changed_messages(db, user_id, since, max_messages)
+        if has_more:
+            conversations = conversation_summaries(db, user_id)
+        else:
+            peer_ids = {
+                m["sender_id"] if m["receiver_id"] == user_id else m["receiver_id"]
+                for m in messages
+            }
+            conversations = conversation_summaries(db, user_id, since, peer_ids)
+
+    cursors: Dict[Tuple[int, int], int] = {}
+    for conversation in conversations:
+        cursors[(user_id, conversation["user_id"])] = conversation["last_read_message_id"]
+        cursors[(conversation["user_id"], user_id)] = conversation["peer_last_read_message_id"]
+    add_read_flags(messages, cursors)
+
+    peers = {conversation["user_id"] for conversation in conversations}
+    users = db.query(User).filter(User.id.in_(peers)).all() if peers else []
+    last_messages = [c["last_message"] for c in conversations if c["last_message"] is not None]
+
+    return {
+        "token": str(token),
+        "full": since is None,
+        "conversations": conversations,
+        "messages": messages,
+        "has_more_messages": has_more,
+        # Deltas carry the counts of the changed conversations only; a total
+        # would have to count every conversation again
+        "unread_count": (
+            sum(conversation["unread_count"] for conversation in conversations)
+            if since is None or has_more
+            else None
+        ),
+        "users": {user.id: user for user in users},
+        "attachments": attachments_by_id(db, messages + last_messages),
+    }
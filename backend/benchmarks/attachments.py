@@ -0,0 +1,147 @@
+"""
+Attachment upload/download benchmark.
+
+Usage (from backend/):
+    python -m benchmarks.attachments --file-mb 200 --downloads 20 --range-requests 200
+
+Uploads a random --file-mb file as a streamed multipart body, uploads it again
+(a deduplicated upload), then downloads it --downloads times and fetches
+--range-requests random 64 KiB ranges. Reports throughput, latencies and the
+peak RSS of the server's worker processes, which should stay flat however
+large the file is, since uploads are streamed to disk.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+import httpx
+
+from .harness import ScenarioResult, ServerProcess, load_users
+from .run import build_parser, prepare, write_report
+
+RANGE_BYTES = 64 * 1024
+
+
+def worker_peak_rss_mb(pid: int) -> float:
+    """Largest peak RSS among the launcher's child processes (Linux only)"""
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as source:
+            children.extend(int(child) for child in source.read().split())
+    peaks = [0]
+    for child in children:
+        try:
+            with open(f"/proc/{child}/status") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        peaks.append(int(line.split()[1]))
+        except FileNotFoundError:
+            continue
+    return round(max(peaks) / 1024, 1)
+
+
+def write_random_file(size: int) -> str:
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    with os.fdopen(fd, "wb") as target:
+        remaining = size
+        while remaining:
+            chunk = os.urandom(min(remaining, 1024 * 1024))
+            target.write(chunk)
+            remaining -= len(chunk)
+    return path
+
+
+async def upload(client: httpx.AsyncClient, path: str, headers: dict) -> tuple:
+    started = time.perf_counter()
+    with open(path, "rb") as source:
+        response = await client.post(
+            "/attachments/", files={"file": (os.path.basename(path), source)}, headers=headers
+        )
+    response.raise_for_status()
+    return response.json(), time.perf_counter() - started
+
+
+async def run_attachments(server: ServerProcess, token: str, path: str, args) -> dict:
+    size = os.path.getsize(path)
+    headers = {"Authorization": f"Bearer {token}"}
+    rss_before = worker_peak_rss_mb(server.process.pid)
+
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=600) as client:
+        attachment, first = await upload(client, path, headers)
+        rss_after_upload = worker_peak_rss_mb(server.process.pid)
+        _, second = await upload(client, path, headers)
+        url = f"/attachments/{attachment['id']}/content"
+
+        downloads = ScenarioResult("download_full")
+        digest_ok = True
+        started = time.perf_counter()
+        for _ in range(args.downloads):
+            request_started = time.perf_counter()
+            hasher = hashlib.sha256()
+            async with client.stream("GET", url, headers=headers) as response:
+                async for chunk in response.aiter_bytes():
+                    hasher.update(chunk)
+            downloads.latencies.append(time.perf_counter() - request_started)
+            digest_ok = digest_ok and hasher.hexdigest() == attachment["sha256"]
+        downloads.elapsed = time.perf_counter() - started
+
+        ranges = ScenarioResult("download_range_64k")
+        rng = random.Random(1)
+        started = time.perf_counter()
+        for _ in range(args.range_requests):
+            start = rng.randrange(0, max(1, size - RANGE_BYTES))
+            request_started = time.perf_counter()
+            response = await client.get(
+                url, headers={**headers, "Range": f"bytes={start}-{start + RANGE_BYTES - 1}"}
+            )
+            if response.status_code != 206:
+                ranges.errors += 1
+                continue
+            ranges.latencies.append(time.perf_counter() - request_started)
+        ranges.elapsed = time.perf_counter() - started
+
+    mb = size / (1024 * 1024)
+    download_seconds: List[float] = downloads.latencies
+    return {
+        "file_mb": round(mb, 1),
+        "upload_mb_per_s": round(mb / first, 1),
+        "dedup_upload_mb_per_s": round(mb / second, 1),
+        "download_mb_per_s": round(mb / (sum(download_seconds) / len(download_seconds)), 1)
+        if download_seconds
+        else None,
+        "downloads_match_hash": digest_ok,
+        "worker_peak_rss_mb": {"before": rss_before, "after_upload": rss_after_upload},
+        downloads.name: downloads.summary(),
+        ranges.name: ranges.summary(),
+    }
+
+
+def main():
+    parser = build_parser("Attachment upload/download benchmark")
+    parser.add_argument("--file-mb", type=int, default=200)
+    parser.add_argument("--downloads", type=int, default=20)
+    parser.add_argument("--range-requests", type=int, default=200)
+    args = parser.parse_args()
+    env = {**prepare(args), "ATTACHMENT_MAX_BYTES": str((args.file_mb + 1) * 1024 * 1024)}
+
+    user = load_users(1)[0]
+    path = write_random_file(args.file_mb * 1024 * 1024)
+    try:
+        with ServerProcess(args.port, env, workers=args.workers) as server:
+            results = asyncio.run(run_attachments(server, user.token, path, args))
+    finally:
+        os.unlink(path)
+
+    out = write_report(args, results, suffix="-attachments")
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
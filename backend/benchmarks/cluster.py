@@ -0,0 +1,122 @@
+"""
+Multi-worker mode: cross-worker delivery check and throughput comparison.
+
+Usage (from backend/):
+    python -m benchmarks.cluster --workers 4 --ws-clients 400
+
+First starts the app with --workers processes and checks that WebSocket
+messages reach receivers whose sockets landed on a different worker than the
+sender's. Then runs the regular load-test scenarios once with a single worker
+and once with --workers, and prints both side by side. Exits non-zero if the
+delivery check fails.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from typing import Dict, List
+
+import websockets
+
+from .harness import BenchUser, ServerProcess, load_users
+from .run import build_parser, prepare, run_benchmarks, write_report
+
+
+def worker_occupancy(server: ServerProcess, attempts: int = 200) -> Dict[str, int]:
+    """Local socket count per worker, sampled over fresh HTTP connections"""
+    seen: Dict[str, int] = {}
+    for _ in range(attempts):
+        stats = server.worker_stats()
+        seen[stats["worker_id"]] = stats["local_users"]
+        if len(seen) >= server.workers:
+            break
+    return seen
+
+
+async def check_cross_worker_delivery(
+    server: ServerProcess, users: List[BenchUser], timeout: float = 10.0
+) -> dict:
+    """
+    Connect one sender and many receivers, then have the sender message every
+    receiver. The kernel spreads the connections over the workers, so with
+    several workers holding sockets some receivers are on another worker than
+    the sender, and every one of them must still get its message.
+    """
+    sender, receivers = users[0], users[1:]
+    sockets = {
+        user.id: await websockets.connect(f"{server.ws_url}/direct-messages/ws/?token={user.token}")
+        for user in users
+    }
+    occupancy = worker_occupancy(server)
+
+    async def receive(user: BenchUser, content: str) -> bool:
+        async for raw in sockets[user.id]:
+            frame = json.loads(raw)
+            if frame.get("type") == "new_message" and frame["data"]["content"] == content:
+                return True
+        return False
+
+    run_id = int(time.time())
+    waiters = [
+        asyncio.create_task(receive(user, f"cluster check {run_id}:{user.id}"))
+        for user in receivers
+    ]
+    for user in receivers:
+        await sockets[sender.id].send(
+            json.dumps({"receiver_id": user.id, "content": f"cluster check {run_id}:{user.id}"})
+        )
+    done, pending = await asyncio.wait(waiters, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    delivered = sum(1 for task in done if task.result())
+
+    await asyncio.gather(*(socket.close() for socket in sockets.values()), return_exceptions=True)
+    workers_with_sockets = sum(1 for count in occupancy.values() if count)
+    return {
+        "sockets_per_worker": occupancy,
+        "receivers": len(receivers),
+        "delivered": delivered,
+        "ok": delivered == len(receivers) and workers_with_sockets > 1,
+    }
+
+
+def main():
+    parser = build_parser("Multi-worker delivery check and throughput comparison")
+    parser.add_argument("--check-clients", type=int, default=40)
+    args = parser.parse_args()
+    if args.workers < 2:
+        parser.error("--workers must be at least 2")
+    env = prepare(args)
+
+    with ServerProcess(args.port, env, workers=args.workers) as server:
+        check = asyncio.run(
+            check_cross_worker_delivery(server, load_users(args.check_clients))
+        )
+    print(json.dumps({"cross_worker_delivery": check}, indent=2))
+
+    results = {}
+    for workers in (1, args.workers):
+        with ServerProcess(args.port, env, workers=workers) as server:
+            scenario_results = asyncio.run(run_benchmarks(args, server))
+        results[f"workers_{workers}"] = {
+            name: result.summary() for name, result in scenario_results.items()
+        }
+
+    print(f"\n{'scenario':<22}{'metric':<18}{'1 worker':>12}{f'{args.workers} workers':>14}")
+    single, multi = results["workers_1"], results[f"workers_{args.workers}"]
+    for scenario in single:
+        for metric in ("throughput_per_s", "p95_ms", "errors"):
+            print(
+                f"{scenario:<22}{metric:<18}"
+                f"{str(single[scenario][metric]):>12}{str(multi[scenario].get(metric)):>14}"
+            )
+
+    path = write_report(args, {"cross_worker_delivery": check, **results}, suffix="-cluster")
+    print(f"Results written to {path}")
+    if not check["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
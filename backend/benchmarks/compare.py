@@ -0,0 +1,59 @@
+"""
+Compare two benchmark result files.
+
+Usage (from backend/):
+    python -m benchmarks.compare base.json head.json [--threshold 10]
+
+Exits with status 1 if any p95 latency regressed by more than the threshold (%).
+"""
+
+import argparse
+import json
+import sys
+
+METRICS = ["throughput_per_s", "p50_ms", "p95_ms", "p99_ms", "errors"]
+
+
+def load(path: str) -> dict:
+    with open(path) as source:
+        return json.load(source)
+
+
+def change(base, head):
+    if base in (None, 0) or head is None:
+        return None
+    return (head - base) / base * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark results")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+
+    base, head = load(args.base), load(args.head)
+    print(f"{base['revision']} -> {head['revision']}")
+
+    regressions = []
+    for scenario in sorted(set(base["results"]) | set(head["results"])):
+        base_result = base["results"].get(scenario, {})
+        head_result = head["results"].get(scenario, {})
+        print(f"\n{scenario}")
+        for metric in METRICS:
+            before, after = base_result.get(metric), head_result.get(metric)
+            delta = change(before, after)
+            delta_str = f"{delta:+.1f}%" if delta is not None else "n/a"
+            print(f"  {metric:<18} {str(before):>12} {str(after):>12} {delta_str:>9}")
+
+        delta = change(base_result.get("p95_ms"), head_result.get("p95_ms"))
+        if delta is not None and delta > args.threshold:
+            regressions.append(f"{scenario}: p95 {delta:+.1f}%")
+
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
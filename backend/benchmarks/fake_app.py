@@ -0,0 +1,18 @@
+"""
+ASGI entry point used by the benchmarks: the real app with the LLM replaced by a
+fake chat model, so /ai/summarize can be load tested without network calls.
+"""
+
+import os
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.main import app  # noqa: F401
+from app.services.ai_summarizer import ai_chat_summarizer
+
+fake_llm = FakeListChatModel(
+    responses=["The users discussed plans for the week and agreed on next steps."],
+    sleep=float(os.getenv("BENCH_FAKE_LLM_LATENCY", "0.05")),
+)
+ai_chat_summarizer.llm = fake_llm
+ai_chat_summarizer.summarizer_chain = ai_chat_summarizer.prompt_template | fake_llm
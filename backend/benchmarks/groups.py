@@ -0,0 +1,132 @@
+"""
+Group fan-out benchmark.
+
+Usage (from backend/):
+    python -m benchmarks.groups --group-size 1000 --online 500 --group-messages 50
+
+Creates a group of --group-size seeded users, connects --online of them over
+WebSockets and has one member send --group-messages messages through the REST
+endpoint. Reports the database statements per send (from the X-DB-Query-Count
+header, including the token's user lookup), the latency from a send to each
+member receiving it, and the latency until the last online member has it.
+"""
+
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+import httpx
+import websockets
+
+from .harness import BenchUser, ScenarioResult, ServerProcess, load_users
+from .run import build_parser, prepare, write_report
+
+
+async def run_group_fanout(
+    server: ServerProcess,
+    users: List[BenchUser],
+    online: int,
+    messages: int,
+    timeout: float,
+) -> dict:
+    sender, members = users[0], users[1:]
+    headers = {"Authorization": f"Bearer {sender.token}"}
+    per_member = ScenarioResult("group_send_to_member")
+    to_last = ScenarioResult("group_send_to_last_member")
+    statements: List[int] = []
+
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=30) as client:
+        response = await client.post(
+            "/groups/",
+            json={"name": "fan-out bench", "member_ids": [user.id for user in members]},
+            headers=headers,
+        )
+        response.raise_for_status()
+        group_id = response.json()["id"]
+
+        sockets = [
+            await websockets.connect(f"{server.ws_url}/direct-messages/ws/?token={user.token}")
+            for user in members[:online]
+        ]
+        sent_at: Dict[str, float] = {}
+        pending: Dict[str, int] = {}
+        done: Dict[str, asyncio.Event] = {}
+
+        async def reader(socket):
+            async for raw in socket:
+                frame = json.loads(raw)
+                if frame.get("type") == "ping":
+                    await socket.send(json.dumps({"type": "pong"}))
+                elif frame.get("type") == "group_message":
+                    content = frame["data"]["content"]
+                    if content in sent_at:
+                        per_member.latencies.append(time.perf_counter() - sent_at[content])
+                        pending[content] -= 1
+                        if not pending[content]:
+                            done[content].set()
+
+        readers = [asyncio.create_task(reader(socket)) for socket in sockets]
+        started = time.perf_counter()
+        for i in range(messages):
+            content = f"group bench {group_id}:{i}"
+            pending[content] = len(sockets)
+            done[content] = asyncio.Event()
+            sent_at[content] = time.perf_counter()
+            response = await client.post(
+                f"/groups/{group_id}/messages", json={"content": content}, headers=headers
+            )
+            if response.status_code != 201:
+                to_last.errors += 1
+                continue
+            if "x-db-query-count" in response.headers:
+                statements.append(int(response.headers["x-db-query-count"]))
+            try:
+                await asyncio.wait_for(done[content].wait(), timeout=timeout)
+                to_last.latencies.append(time.perf_counter() - sent_at[content])
+            except asyncio.TimeoutError:
+                to_last.errors += 1
+        per_member.elapsed = to_last.elapsed = time.perf_counter() - started
+        per_member.errors = sum(pending.values())
+
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*(socket.close() for socket in sockets), return_exceptions=True)
+
+    return {
+        "statements_per_send": {
+            "first": statements[0] if statements else None,
+            "max_after_first": max(statements[1:], default=None),
+        },
+        per_member.name: per_member.summary(),
+        to_last.name: to_last.summary(),
+    }
+
+
+def main():
+    parser = build_parser("Group message fan-out benchmark")
+    parser.add_argument("--group-size", type=int, default=1000)
+    parser.add_argument("--online", type=int, default=500)
+    parser.add_argument("--group-messages", type=int, default=50)
+    args = parser.parse_args()
+    env = {**prepare(args), "DB_PROFILE_HEADERS": "true"}
+
+    users = load_users(args.group_size)
+    with ServerProcess(args.port, env, workers=args.workers) as server:
+        results = asyncio.run(
+            run_group_fanout(
+                server,
+                users,
+                online=min(args.online, args.group_size - 1),
+                messages=args.group_messages,
+                timeout=args.timeout,
+            )
+        )
+
+    path = write_report(args, results, suffix="-groups")
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
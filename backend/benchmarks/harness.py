@@ -0,0 +1,228 @@
+"""Server lifecycle, fixtures and statistics shared by the benchmark scenarios."""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import text
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class BenchUser:
+    id: int
+    username: str
+    token: str
+
+
+@dataclass
+class ScenarioResult:
+    """Latency samples (seconds) and error count for one scenario"""
+
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.latencies)
+        return {
+            "count": len(ordered),
+            "errors": self.errors,
+            "elapsed_s": round(self.elapsed, 3),
+            "throughput_per_s": round(len(ordered) / self.elapsed, 2) if self.elapsed else 0.0,
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None,
+            "p50_ms": percentile(ordered, 50),
+            "p95_ms": percentile(ordered, 95),
+            "p99_ms": percentile(ordered, 99),
+            "max_ms": round(ordered[-1] * 1000, 3) if ordered else None,
+        }
+
+
+def percentile(ordered: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted samples, in milliseconds"""
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return round(ordered[rank] * 1000, 3)
+
+
+def git_revision() -> str:
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR)
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return "unknown"
+
+
+def start_postgres_with_compose(timeout: float = 60.0):
+    """Start the postgres service from docker-compose.yml and wait until it accepts connections"""
+    compose = ["docker", "compose"] if shutil.which("docker") else ["docker-compose"]
+    subprocess.run([*compose, "up", "-d", "postgres"], cwd=BACKEND_DIR, check=True)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ready = subprocess.run(
+            [*compose, "exec", "-T", "postgres", "pg_isready", "-U", "postgres"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+        )
+        if ready.returncode == 0:
+            return
+        time.sleep(1)
+    raise RuntimeError("Postgres did not become ready in time")
+
+
+def migrate_database(env: Dict[str, str]):
+    """Apply schema migrations with the app.migrations CLI"""
+    subprocess.run(
+        [sys.executable, "-m", "app.migrations", "upgrade"], cwd=BACKEND_DIR, env=env, check=True
+    )
+
+
+def seed_database(users: int, conversations: int, messages: int, env: Dict[str, str]):
+    """Bulk load data with the app.seed CLI"""
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "app.seed",
+            "generate",
+            "--users",
+            str(users),
+            "--conversations",
+            str(conversations),
+            "--messages",
+            str(messages),
+            "--seed",
+            "1",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        check=True,
+    )
+
+
+class ServerProcess:
+    """Runs benchmarks.fake_app through the app.serve launcher in a separate process"""
+
+    def __init__(self, port: int, env: Dict[str, str], workers: int = 1):
+        self.port = port
+        self.env = env
+        self.workers = workers
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "app.serve",
+                "--app",
+                "benchmarks.fake_app:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(self.port),
+                "--workers",
+                str(self.workers),
+                "--log-level",
+                "warning",
+            ],
+            cwd=BACKEND_DIR,
+            env=self.env,
+        )
+        self.wait_until_ready()
+        return self
+
+    def wait_until_ready(self, timeout: float = 60.0):
+        """Wait until every worker answers and has joined the cluster hub"""
+        deadline = time.monotonic() + timeout
+        joined = set()
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("Server exited during startup")
+            try:
+                cluster = self.worker_stats()
+                if cluster["enabled"]:
+                    joined.add(cluster["worker_id"])
+                if len(joined) >= self.workers:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("Server did not become ready in time")
+
+    def worker_stats(self) -> dict:
+        """Cluster stats of whichever worker accepts a fresh connection"""
+        return httpx.get(f"{self.base_url}/health/stats", timeout=1).json()["cluster"]
+
+    def __exit__(self, *exc_info):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def load_users(count: int) -> List[BenchUser]:
+    """Most recently seeded users, with freshly minted access tokens"""
+    from app.auth.jwt import create_access_token
+    from app.database import engine
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT id, username FROM users WHERE auth_provider = 'seed' "
+                "ORDER BY id DESC LIMIT :limit"
+            ),
+            {"limit": count},
+        ).all()
+
+    if len(rows) < count:
+        raise RuntimeError(f"Need {count} seeded users, found {len(rows)}; seed more data")
+    return [BenchUser(row.id, row.username, create_access_token({"sub": row.username})) for row in rows]
+
+
+def load_hot_pairs(count: int) -> List[Tuple[BenchUser, int]]:
+    """The busiest conversations as (user with token, other user id)"""
+    from app.auth.jwt import create_access_token
+    from app.database import engine
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                """
+                SELECT m.sender_id, u.username, m.receiver_id, COUNT(*) AS messages
+                FROM direct_messages m JOIN users u ON u.id = m.sender_id
+                WHERE u.auth_provider = 'seed'
+                GROUP BY m.sender_id, u.username, m.receiver_id
+                ORDER BY messages DESC
+                LIMIT :limit
+                """
+            ),
+            {"limit": count},
+        ).all()
+
+    return [
+        (BenchUser(row.sender_id, row.username, create_access_token({"sub": row.username})), row.receiver_id)
+        for row in rows
+    ]
@@ -0,0 +1,152 @@
+"""
+Large message benchmark: history pages with large content inline vs offloaded.
+
+Usage (from backend/):
+    python -m benchmarks.large_messages --history-messages 200 --large-ratio 0.1 --large-bytes 65536
+
+Runs the app twice: once with MESSAGE_INLINE_MAX_BYTES raised to
+MESSAGE_MAX_BYTES, so every message is stored inline as before, and once with
+the configured threshold, so large messages keep only a preview inline. Each
+run fills a fresh conversation between two seeded users with
+--history-messages messages, --large-ratio of them --large-bytes of log-like
+text, then fetches 50-message history pages from the database and from the
+recent message cache. Reports response sizes and latencies for both runs.
+"""
+
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+
+import httpx
+from sqlalchemy import text
+
+from .harness import BenchUser, ScenarioResult, ServerProcess, load_users
+from .run import build_parser, prepare, write_report
+
+PAGE_SIZE = 50
+
+
+def existing_messages(user: BenchUser, other: BenchUser) -> int:
+    from app.database import engine
+
+    with engine.connect() as conn:
+        return conn.execute(
+            text(
+                "SELECT count(*) FROM direct_messages WHERE "
+                "(sender_id = :a AND receiver_id = :b) OR (sender_id = :b AND receiver_id = :a)"
+            ),
+            {"a": user.id, "b": other.id},
+        ).scalar()
+
+
+def log_text(rng: random.Random, size: int) -> str:
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(
+            f"2024-05-01T12:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z "
+            f"worker-{rng.randint(1, 16)} request {rng.getrandbits(64):016x} took {rng.randint(1, 900)}ms"
+        )
+    return "\n".join(lines)[:size]
+
+
+async def fetch_pages(
+    client: httpx.AsyncClient, name: str, requests: int, params: dict, headers: dict
+) -> dict:
+    result = ScenarioResult(name)
+    sizes: List[int] = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        response = await client.get("/direct-messages/", params=params, headers=headers)
+        if response.status_code != 200:
+            result.errors += 1
+            continue
+        result.latencies.append(time.perf_counter() - request_started)
+        sizes.append(len(response.content))
+    result.elapsed = time.perf_counter() - started
+    return {
+        **result.summary(),
+        "mean_response_bytes": round(sum(sizes) / len(sizes)) if sizes else None,
+    }
+
+
+async def run_large_messages(
+    server: ServerProcess, sender: BenchUser, receiver: BenchUser, args
+) -> dict:
+    rng = random.Random(args.seed_value)
+    headers = {"Authorization": f"Bearer {sender.token}"}
+    skip = existing_messages(sender, receiver)
+    large = 0
+
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=30) as client:
+        for i in range(args.history_messages):
+            if rng.random() < args.large_ratio:
+                content = log_text(rng, args.large_bytes)
+                large += 1
+            else:
+                content = f"message {i}: " + "x" * rng.randint(10, 120)
+            response = await client.post(
+                "/direct-messages/", json={"receiver_id": receiver.id, "content": content}, headers=headers
+            )
+            response.raise_for_status()
+
+        # Oldest-first pages of the messages sent above, straight from the database
+        database = await fetch_pages(
+            client,
+            "history_page_database",
+            args.requests,
+            {"other_user_id": receiver.id, "limit": PAGE_SIZE, "skip": skip},
+            headers,
+        )
+        # The newest page, served by the recent message cache after the first call
+        cached = await fetch_pages(
+            client,
+            "history_page_cached",
+            args.requests,
+            {"other_user_id": receiver.id, "limit": PAGE_SIZE, "latest": "true"},
+            headers,
+        )
+        stats = await client.get("/health/stats")
+
+    return {
+        "large_messages": large,
+        "history_page_database": database,
+        "history_page_cached": cached,
+        "message_cache": stats.json().get("message_cache") if stats.status_code == 200 else None,
+    }
+
+
+def main():
+    parser = build_parser("Large message offload benchmark")
+    parser.add_argument("--history-messages", type=int, default=200)
+    parser.add_argument("--large-ratio", type=float, default=0.1)
+    parser.add_argument("--large-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--seed-value", type=int, default=1, help="Random seed for the content")
+    parser.set_defaults(requests=200)
+    args = parser.parse_args()
+    env = prepare(args)
+
+    from app.config import settings
+
+    # Four recent seeded users: one fresh conversation per run
+    users = load_users(4)
+    runs: Dict[str, dict] = {
+        "inline": {"MESSAGE_INLINE_MAX_BYTES": str(settings.MESSAGE_MAX_BYTES)},
+        "offloaded": {},
+    }
+    results = {}
+    for i, (name, overrides) in enumerate(runs.items()):
+        with ServerProcess(args.port, {**env, **overrides}, workers=args.workers) as server:
+            results[name] = asyncio.run(
+                run_large_messages(server, users[2 * i], users[2 * i + 1], args)
+            )
+
+    path = write_report(args, results, suffix="-large-messages")
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Per-request cost of the OAuth session middleware, measured in process.
+
+Usage (from backend/):
+    python -m benchmarks.middleware --requests 20000 --rounds 10
+
+Calls a trivial Starlette endpoint directly through ASGI, with no network or
+server in between, wrapped three ways: without a session middleware, with
+Starlette's SessionMiddleware on every request (as before), and with
+OAuthSessionMiddleware. Each is timed for a request without cookies and for a
+request carrying a session cookie that holds a pending OAuth state, as a
+browser that started a login sends it. Reports latencies and the overhead
+over the bare endpoint per request.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from base64 import b64encode
+
+import itsdangerous
+from starlette.applications import Starlette
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.auth.oauth import OAuthSessionMiddleware
+
+from .harness import ScenarioResult
+from .run import write_report
+
+SECRET_KEY = "benchmark-secret"
+
+
+def session_cookie(name: str) -> bytes:
+    """A signed cookie like the one authlib leaves while a login is pending"""
+    data = {
+        "_state_google_abcdefghijklmnopqrstuvwxyz012345": {
+            "data": {
+                "redirect_uri": "http://localhost:8000/auth/google/callback",
+                "nonce": "n0nc3n0nc3n0nc3n0nc3",
+                "url": "https://accounts.google.com/o/oauth2/v2/auth?response_type=code",
+            },
+            "exp": time.time() + 3600,
+        }
+    }
+    value = b64encode(json.dumps(data).encode())
+    signed = itsdangerous.TimestampSigner(SECRET_KEY).sign(value)
+    return name.encode() + b"=" + signed
+
+
+def endpoint_app() -> Starlette:
+    async def ping(request):
+        return PlainTextResponse("ok")
+
+    return Starlette(routes=[Route("/users/me", ping)])
+
+
+def configurations() -> dict:
+    return {
+        "none": endpoint_app(),
+        "global_session": SessionMiddleware(endpoint_app(), secret_key=SECRET_KEY),
+        "oauth_routes_only": OAuthSessionMiddleware(endpoint_app(), secret_key=SECRET_KEY),
+    }
+
+
+async def call(app, headers: list) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/users/me",
+        "raw_path": b"/users/me",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(app, headers: list, requests: int, result: ScenarioResult):
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        if await call(app, headers) != 200:
+            result.errors += 1
+        result.latencies.append(time.perf_counter() - request_started)
+    result.elapsed += time.perf_counter() - started
+
+
+async def run_middleware(args) -> dict:
+    requests = {
+        "no_cookie": [(b"host", b"localhost:8000")],
+        # SessionMiddleware's default cookie name, which the old setup used
+        "with_cookie": [(b"host", b"localhost:8000"), (b"cookie", session_cookie("session"))],
+    }
+    apps = configurations()
+    results = {
+        (config_name, request_name): ScenarioResult(f"{config_name}_{request_name}")
+        for request_name in requests
+        for config_name in apps
+    }
+    # Warm up, then alternate the configurations in rounds so drift in the
+    # machine's speed affects them all alike
+    for config_name, request_name in results:
+        await measure(apps[config_name], requests[request_name], 200, ScenarioResult("warmup"))
+    per_round = max(1, args.requests // args.rounds)
+    for _ in range(args.rounds):
+        for (config_name, request_name), result in results.items():
+            await measure(apps[config_name], requests[request_name], per_round, result)
+
+    summaries = {}
+    for (config_name, request_name), result in results.items():
+        baseline = results[("none", request_name)]
+        summary = result.summary()
+        summary["mean_us"] = round(result.elapsed / len(result.latencies) * 1e6, 2)
+        summary["overhead_us"] = round(
+            (result.elapsed / len(result.latencies) - baseline.elapsed / len(baseline.latencies))
+            * 1e6,
+            2,
+        )
+        summaries[result.name] = summary
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OAuth session middleware overhead benchmark")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per configuration")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results"))
+    args = parser.parse_args()
+
+    results = asyncio.run(run_middleware(args))
+    path = write_report(args, results, suffix="-middleware")
+    print(
+        json.dumps(
+            {name: {k: r[k] for k in ("mean_us", "overhead_us")} for name, r in results.items()},
+            indent=2,
+        )
+    )
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
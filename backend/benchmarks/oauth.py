@@ -0,0 +1,149 @@
+"""
+Google login spike benchmark, against the stub provider in oauth_stub.py.
+
+Usage (from backend/):
+    python -m benchmarks.oauth --logins 200 --concurrency 20 --handshake-ms 20
+
+Starts the stub provider and the app pointed at it, then runs --logins
+complete login flows (GET /auth/login/google, the provider's authorization
+redirect, GET /auth/google/callback), --concurrency at a time, each as a
+new user. Reports callback and whole-flow latencies, and what the app asked of
+the provider: requests per endpoint and TCP connections, per login.
+--handshake-ms makes every new connection to the provider that much slower,
+standing in for TLS.
+"""
+
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+import httpx
+
+from .harness import ScenarioResult, ServerProcess
+from .run import build_parser, prepare, write_report
+
+
+def start_stub(port: int, handshake_ms: float) -> subprocess.Popen:
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.oauth_stub",
+            "--port",
+            str(port),
+            "--handshake-ms",
+            str(handshake_ms),
+        ]
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats").raise_for_status()
+            return stub
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    stub.terminate()
+    raise RuntimeError("OAuth stub did not start")
+
+
+async def login(
+    server: ServerProcess,
+    transport: httpx.AsyncHTTPTransport,
+    provider: httpx.AsyncClient,
+    flows: ScenarioResult,
+    callbacks: ScenarioResult,
+):
+    # Own cookie jar per login, like separate browsers. The shared transport
+    # spares the benchmark an SSL context per client; the client is not
+    # closed, since closing it would close the transport.
+    browser = httpx.AsyncClient(base_url=server.base_url, transport=transport, timeout=60)
+    started = time.perf_counter()
+    try:
+        redirect = await browser.get("/auth/login/google")
+        authorized = await provider.get(redirect.headers["location"])
+        callback_started = time.perf_counter()
+        done = await browser.get(authorized.headers["location"])
+        if "token=" not in done.headers.get("location", ""):
+            raise RuntimeError(done.text)
+    except Exception:
+        flows.errors += 1
+        return
+    finished = time.perf_counter()
+    callbacks.latencies.append(finished - callback_started)
+    flows.latencies.append(finished - started)
+
+
+async def run_logins(server: ServerProcess, stub_url: str, args) -> dict:
+    flows = ScenarioResult("login_flow")
+    callbacks = ScenarioResult("google_callback")
+    before = httpx.get(f"{stub_url}/stats").json()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    transport = httpx.AsyncHTTPTransport()
+    async with transport, httpx.AsyncClient(transport=transport, timeout=60) as provider:
+
+        async def limited():
+            async with semaphore:
+                await login(server, transport, provider, flows, callbacks)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited() for _ in range(args.logins)))
+        flows.elapsed = callbacks.elapsed = time.perf_counter() - started
+
+    after = httpx.get(f"{stub_url}/stats").json()
+    # The benchmark's own authorization requests are not the app's doing
+    requests = {
+        path: count - before["requests"].get(path, 0)
+        for path, count in after["requests"].items()
+        if path != "/authorize"
+    }
+    logins = max(1, len(flows.latencies))
+    return {
+        "startup_provider_requests": before["requests"],
+        flows.name: flows.summary(),
+        callbacks.name: callbacks.summary(),
+        "provider_requests_per_login": {
+            path: round(count / logins, 3) for path, count in requests.items()
+        },
+        # Includes the benchmark's own connections for the authorization step
+        "provider_connections_per_login": round(
+            (after["connections"] - before["connections"]) / logins, 3
+        ),
+    }
+
+
+def main():
+    parser = build_parser("Google login spike benchmark against a stub provider")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    parser.set_defaults(concurrency=20)
+    args = parser.parse_args()
+    env = prepare(args)
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    env.update(
+        GOOGLE_CLIENT_ID="stub-client",
+        GOOGLE_CLIENT_SECRET="stub-secret",
+        GOOGLE_DISCOVERY_URL=f"{stub_url}/.well-known/openid-configuration",
+        GOOGLE_REDIRECT_URI=f"http://127.0.0.1:{args.port}/auth/google/callback",
+    )
+    stub = start_stub(args.stub_port, args.handshake_ms)
+    try:
+        with ServerProcess(args.port, env, workers=args.workers) as server:
+            # Let the startup prefetch finish
+            time.sleep(1)
+            results = asyncio.run(run_logins(server, stub_url, args))
+    finally:
+        stub.terminate()
+
+    path = write_report(args, results, suffix="-oauth")
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
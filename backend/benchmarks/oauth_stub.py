@@ -0,0 +1,151 @@
+"""
+Stub OpenID Connect provider, for running the Google login flow offline.
+
+Usage (from backend/):
+    python -m benchmarks.oauth_stub --port 9100 [--handshake-ms 20]
+
+Point the app at it with
+    GOOGLE_DISCOVERY_URL=http://127.0.0.1:9100/.well-known/openid-configuration
+
+It serves a discovery document, a JWKS with a freshly generated RSA key, an
+authorization endpoint that immediately redirects back with a code, and a
+token endpoint that returns an ID token signed with that key. Each code logs
+in a new user unless the authorization request carries `stub_user=<n>`.
+
+GET /stats reports requests per endpoint and the number of TCP connections
+seen. --handshake-ms delays the first request of every connection, standing in
+for the TLS handshake of a real provider.
+"""
+
+import argparse
+import asyncio
+import itertools
+import secrets
+import time
+from collections import Counter
+from typing import Dict, Set, Tuple
+from urllib.parse import urlencode
+
+import uvicorn
+from authlib.jose import JsonWebKey, jwt
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, RedirectResponse
+from starlette.routing import Route
+
+KEY_ID = "stub-key-1"
+
+
+class StubProvider:
+    def __init__(self, issuer: str, handshake_ms: float = 0.0):
+        self.issuer = issuer
+        self.handshake_seconds = handshake_ms / 1000
+        self.key = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": KEY_ID})
+        # code -> authorization request parameters
+        self.codes: Dict[str, dict] = {}
+        self.requests: Counter = Counter()
+        self.connections: Set[Tuple[str, int]] = set()
+        self._users = itertools.count(1)
+
+    async def track(self, request: Request):
+        self.requests[request.url.path] += 1
+        client = (request.client.host, request.client.port)
+        if client not in self.connections:
+            self.connections.add(client)
+            if self.handshake_seconds:
+                await asyncio.sleep(self.handshake_seconds)
+
+    async def discovery(self, request: Request):
+        await self.track(request)
+        return JSONResponse(
+            {
+                "issuer": self.issuer,
+                "authorization_endpoint": f"{self.issuer}/authorize",
+                "token_endpoint": f"{self.issuer}/token",
+                "userinfo_endpoint": f"{self.issuer}/userinfo",
+                "jwks_uri": f"{self.issuer}/jwks",
+                "response_types_supported": ["code"],
+                "subject_types_supported": ["public"],
+                "id_token_signing_alg_values_supported": ["RS256"],
+            },
+            headers={"Cache-Control": "public, max-age=3600"},
+        )
+
+    async def jwks(self, request: Request):
+        await self.track(request)
+        return JSONResponse({"keys": [self.key.as_dict(is_private=False)]})
+
+    async def authorize(self, request: Request):
+        await self.track(request)
+        params = request.query_params
+        code = secrets.token_urlsafe(16)
+        self.codes[code] = {
+            "client_id": params.get("client_id"),
+            "nonce": params.get("nonce"),
+            "user": params.get("stub_user") or str(next(self._users)),
+        }
+        query = urlencode({"code": code, "state": params.get("state", "")})
+        return RedirectResponse(f"{params['redirect_uri']}?{query}", status_code=302)
+
+    async def token(self, request: Request):
+        await self.track(request)
+        form = await request.form()
+        grant = self.codes.pop(form.get("code"), None)
+        if grant is None:
+            return JSONResponse({"error": "invalid_grant"}, status_code=400)
+
+        now = int(time.time())
+        user = grant["user"]
+        claims = {
+            "iss": self.issuer,
+            "aud": grant["client_id"],
+            "sub": f"stub-{user}",
+            "email": f"stub-user-{user}@example.com",
+            "email_verified": True,
+            "name": f"Stub User {user}",
+            "iat": now,
+            "exp": now + 3600,
+        }
+        if grant["nonce"]:
+            claims["nonce"] = grant["nonce"]
+        id_token = jwt.encode({"alg": "RS256", "kid": KEY_ID}, claims, self.key).decode()
+        return JSONResponse(
+            {
+                "access_token": secrets.token_urlsafe(24),
+                "token_type": "Bearer",
+                "expires_in": 3600,
+                "scope": "openid email profile",
+                "id_token": id_token,
+            }
+        )
+
+    async def stats(self, request: Request):
+        return JSONResponse(
+            {"connections": len(self.connections), "requests": dict(self.requests)}
+        )
+
+    def app(self) -> Starlette:
+        return Starlette(
+            routes=[
+                Route("/.well-known/openid-configuration", self.discovery),
+                Route("/jwks", self.jwks),
+                Route("/authorize", self.authorize),
+                Route("/token", self.token, methods=["POST"]),
+                Route("/stats", self.stats),
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenID Connect provider")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--handshake-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    provider = StubProvider(f"http://{args.host}:{args.port}", args.handshake_ms)
+    uvicorn.run(provider.app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Read receipt write amplification: per-message is_read flags vs read cursors.
+
+Usage (from backend/):
+    python -m benchmarks.read_receipts --conversations 200 --messages-per-conversation 100
+
+Loads the same messages into two layouts in a scratch schema: the old one,
+where a message row carries is_read and a receipt UPDATEs it, and the current
+one, where a receipt moves a read_cursors row. Then applies the same receipts
+to both, in autocommit mode like the app does:
+
+* per_message: half of the conversations are read one receipt per message,
+  as a client does while the conversation is open.
+* conversation: the other half are marked read with one receipt each, as a
+  client does when opening a conversation with unread messages.
+
+Reports WAL bytes, rows written (and how many of the updates were HOT, i.e.
+wrote no index entries) and on-disk growth of the tables and their indexes.
+The scratch schema is dropped afterwards.
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.database import engine
+
+from .run import write_report
+
+SCHEMA = "bench_read_receipts"
+
+SETUP = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+
+CREATE TABLE {SCHEMA}.flag_messages (
+    id SERIAL PRIMARY KEY,
+    content TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    is_read BOOLEAN DEFAULT false,
+    sender_id INTEGER,
+    receiver_id INTEGER
+);
+CREATE INDEX ON {SCHEMA}.flag_messages (sender_id, receiver_id, created_at);
+CREATE INDEX ON {SCHEMA}.flag_messages (receiver_id, created_at);
+
+CREATE TABLE {SCHEMA}.cursor_messages (
+    id SERIAL PRIMARY KEY,
+    content TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    sender_id INTEGER,
+    receiver_id INTEGER
+);
+CREATE INDEX ON {SCHEMA}.cursor_messages (sender_id, receiver_id, created_at);
+CREATE INDEX ON {SCHEMA}.cursor_messages (receiver_id, created_at);
+CREATE INDEX ON {SCHEMA}.cursor_messages (receiver_id, sender_id, id);
+
+CREATE TABLE {SCHEMA}.read_cursors (
+    user_id INTEGER,
+    peer_id INTEGER,
+    last_read_message_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, peer_id)
+);
+CREATE INDEX ON {SCHEMA}.read_cursors (peer_id);
+"""
+
+FLAG_RECEIPT = text(
+    f"UPDATE {SCHEMA}.flag_messages SET is_read = true "
+    "WHERE id = :message_id AND receiver_id = :reader_id"
+)
+FLAG_CONVERSATION_READ = text(
+    f"UPDATE {SCHEMA}.flag_messages SET is_read = true "
+    "WHERE receiver_id = :reader_id AND sender_id = :peer_id AND NOT is_read"
+)
+# Same statement as services.direct_message.mark_read_up_to
+CURSOR_RECEIPT = text(
+    f"""
+    INSERT INTO {SCHEMA}.read_cursors (user_id, peer_id, last_read_message_id)
+    SELECT receiver_id, sender_id, id FROM {SCHEMA}.cursor_messages
+    WHERE id = :message_id AND receiver_id = :reader_id
+    ON CONFLICT (user_id, peer_id) DO UPDATE
+    SET last_read_message_id = EXCLUDED.last_read_message_id
+    WHERE {SCHEMA}.read_cursors.last_read_message_id < EXCLUDED.last_read_message_id
+    """
+)
+
+
+def load_messages(conn: Connection, conversations: int, per_conversation: int, seed: int):
+    """Insert the same interleaved messages into both layouts, plus zero cursors"""
+    rng = random.Random(seed)
+    pairs = [(2 * i + 1, 2 * i + 2) for i in range(conversations)]
+    rows = []
+    for _ in range(conversations * per_conversation):
+        a, b = rng.choice(pairs)
+        sender, receiver = (a, b) if rng.random() < 0.5 else (b, a)
+        rows.append({"content": "x" * rng.randint(10, 120), "sender_id": sender, "receiver_id": receiver})
+
+    for table in ("flag_messages", "cursor_messages"):
+        conn.execute(
+            text(
+                f"INSERT INTO {SCHEMA}.{table} (content, sender_id, receiver_id) "
+                "VALUES (:content, :sender_id, :receiver_id)"
+            ),
+            rows,
+        )
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO {SCHEMA}.read_cursors
+            SELECT receiver_id, sender_id, 0 FROM {SCHEMA}.cursor_messages
+            GROUP BY receiver_id, sender_id
+            """
+        )
+    )
+    conn.execute(text(f"ANALYZE {SCHEMA}.flag_messages"))
+    conn.execute(text(f"ANALYZE {SCHEMA}.cursor_messages"))
+    conn.execute(text(f"ANALYZE {SCHEMA}.read_cursors"))
+    return pairs
+
+
+def relation_bytes(conn: Connection, tables: List[str]) -> int:
+    return sum(
+        conn.execute(text("SELECT pg_total_relation_size(:name)"), {"name": f"{SCHEMA}.{t}"}).scalar()
+        for t in tables
+    )
+
+
+def write_counters(conn: Connection, tables: List[str]) -> Dict[str, int]:
+    conn.execute(text("SELECT pg_stat_force_next_flush()"))
+    row = conn.execute(
+        text(
+            """
+            SELECT COALESCE(SUM(n_tup_ins), 0) AS inserted,
+                COALESCE(SUM(n_tup_upd), 0) AS updated,
+                COALESCE(SUM(n_tup_hot_upd), 0) AS hot_updated
+            FROM pg_stat_user_tables
+            WHERE schemaname = :schema AND relname = ANY(:tables)
+            """
+        ),
+        {"schema": SCHEMA, "tables": tables},
+    ).one()
+    return dict(row._mapping)
+
+
+def measure(
+    conn: Connection, tables: List[str], receipts: List[dict], apply: Callable[[dict], None]
+) -> dict:
+    size_before = relation_bytes(conn, tables)
+    counters_before = write_counters(conn, tables)
+    wal_before = conn.execute(text("SELECT pg_current_wal_insert_lsn()")).scalar()
+
+    started = time.perf_counter()
+    for receipt in receipts:
+        apply(receipt)
+    elapsed = time.perf_counter() - started
+
+    wal_bytes = conn.execute(
+        text("SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), :before)"),
+        {"before": wal_before},
+    ).scalar()
+    counters_after = write_counters(conn, tables)
+    writes = {key: int(counters_after[key] - counters_before[key]) for key in counters_after}
+    return {
+        "receipts": len(receipts),
+        "elapsed_s": round(elapsed, 3),
+        "wal_bytes": int(wal_bytes),
+        "wal_bytes_per_receipt": round(float(wal_bytes) / len(receipts), 1) if receipts else 0.0,
+        "rows_inserted": writes["inserted"],
+        "rows_updated": writes["updated"],
+        "hot_updates": writes["hot_updated"],
+        "growth_bytes": relation_bytes(conn, tables) - size_before,
+    }
+
+
+def run(conn: Connection, pairs) -> dict:
+    half = len(pairs) // 2
+    per_message_pairs, conversation_pairs = set(pairs[:half]), pairs[half:]
+
+    # Every message of the first half, in order, receipted by its receiver
+    per_message = [
+        {"message_id": row.id, "reader_id": row.receiver_id}
+        for row in conn.execute(
+            text(
+                f"SELECT id, sender_id, receiver_id FROM {SCHEMA}.cursor_messages ORDER BY id"
+            )
+        )
+        if (min(row.sender_id, row.receiver_id), max(row.sender_id, row.receiver_id))
+        in per_message_pairs
+    ]
+    # One receipt per direction of the second half, for its newest message
+    newest = {
+        (row.receiver_id, row.sender_id): row.id
+        for row in conn.execute(
+            text(
+                f"SELECT receiver_id, sender_id, MAX(id) AS id FROM {SCHEMA}.cursor_messages "
+                "GROUP BY receiver_id, sender_id"
+            )
+        )
+    }
+    conversation = [
+        {"reader_id": reader, "peer_id": peer, "message_id": newest[(reader, peer)]}
+        for a, b in conversation_pairs
+        for reader, peer in ((a, b), (b, a))
+        if (reader, peer) in newest
+    ]
+
+    flag_tables, cursor_tables = ["flag_messages"], ["cursor_messages", "read_cursors"]
+    return {
+        "per_message": {
+            "is_read_flags": measure(
+                conn, flag_tables, per_message, lambda r: conn.execute(FLAG_RECEIPT, r)
+            ),
+            "read_cursors": measure(
+                conn, cursor_tables, per_message, lambda r: conn.execute(CURSOR_RECEIPT, r)
+            ),
+        },
+        "conversation": {
+            "is_read_flags": measure(
+                conn, flag_tables, conversation, lambda r: conn.execute(FLAG_CONVERSATION_READ, r)
+            ),
+            "read_cursors": measure(
+                conn, cursor_tables, conversation, lambda r: conn.execute(CURSOR_RECEIPT, r)
+            ),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read receipt write amplification")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages-per-conversation", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results"))
+    args = parser.parse_args()
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        try:
+            conn.execute(text(SETUP))
+            pairs = load_messages(
+                conn, args.conversations, args.messages_per_conversation, args.seed
+            )
+            results = run(conn, pairs)
+        finally:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+    print(f"{'workload':<14}{'layout':<16}{'WAL B/receipt':>15}{'rows upd':>10}{'HOT':>8}{'growth B':>12}")
+    for workload, layouts in results.items():
+        for layout, result in layouts.items():
+            print(
+                f"{workload:<14}{layout:<16}{result['wal_bytes_per_receipt']:>15}"
+                f"{result['rows_updated']:>10}{result['hot_updates']:>8}{result['growth_bytes']:>12}"
+            )
+
+    path = write_report(args, results, suffix="-read-receipts")
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
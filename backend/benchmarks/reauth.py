@@ -0,0 +1,150 @@
+"""
+Token renewal storm: reconnecting with a new token vs renewing it in band.
+
+Usage (from backend/):
+    python -m benchmarks.reauth --clients 500 --concurrency 100
+
+Starts a login session for each of --clients seeded users and connects them
+over WebSockets. Then every client renews its access token at once, twice:
+each gets a new access token from POST /auth/refresh (timed on its own), then
+hands it to the server either by reconnecting with it, which is what clients
+had to do, or with a `reauth` frame on the open socket. Reports the latency of
+that socket step and the app's database statements per renewal for each way
+(from /metrics, so refreshes and socket steps are counted separately).
+"""
+
+import asyncio
+import json
+import re
+import time
+from typing import List
+
+import httpx
+import websockets
+
+from .harness import BenchUser, ScenarioResult, ServerProcess, load_users
+from .run import build_parser, prepare, write_report
+
+STATEMENTS = re.compile(r"^db_query_duration_seconds_count\{[^}]*\} (\S+)$", re.MULTILINE)
+
+
+def start_sessions(users: List[BenchUser]) -> List[str]:
+    """A refresh token for each user, from a new login session"""
+    import app.models.direct_message  # noqa: F401 (configures the User mapper)
+    from app.auth.sessions import start_session
+    from app.database import get_new_db_session
+
+    db = get_new_db_session()
+    try:
+        # start_session only needs the id and username
+        return [start_session(db, user)["refresh_token"] for user in users]
+    finally:
+        db.close()
+
+
+async def statements(client: httpx.AsyncClient) -> float:
+    response = await client.get("/metrics")
+    return sum(float(count) for count in STATEMENTS.findall(response.text))
+
+
+async def refresh(client: httpx.AsyncClient, refresh_tokens: List[str], i: int) -> str:
+    response = await client.post("/auth/refresh", json={"refresh_token": refresh_tokens[i]})
+    response.raise_for_status()
+    tokens = response.json()
+    refresh_tokens[i] = tokens["refresh_token"]
+    return tokens["access_token"]
+
+
+async def connect(server: ServerProcess, token: str):
+    return await websockets.connect(f"{server.ws_url}/direct-messages/ws/?token={token}")
+
+
+async def reconnect(server: ServerProcess, sockets: list, i: int, token: str):
+    await sockets[i].close()
+    sockets[i] = await connect(server, token)
+
+
+async def reauth(server: ServerProcess, sockets: list, i: int, token: str):
+    await sockets[i].send(json.dumps({"type": "reauth", "token": token}))
+    while True:
+        frame = json.loads(await sockets[i].recv())
+        if frame.get("type") == "reauth_ok":
+            return
+        if frame.get("type") == "reauth_failed":
+            raise RuntimeError(frame["error"])
+
+
+async def timed_storm(name: str, concurrency: int, count: int, step, client) -> dict:
+    """Run step(i) for every client, `concurrency` at a time"""
+    result = ScenarioResult(name)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await step(i)
+            except Exception:
+                result.errors += 1
+                return
+            result.latencies.append(time.perf_counter() - started)
+
+    before = await statements(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    result.elapsed = time.perf_counter() - started
+    after = await statements(client)
+    return {
+        **result.summary(),
+        "statements_per_renewal": round((after - before) / max(1, len(result.latencies)), 2),
+    }
+
+
+async def run_reauth(server: ServerProcess, users: List[BenchUser], args) -> dict:
+    refresh_tokens = start_sessions(users)
+    results = {"clients": len(users)}
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=60) as client:
+        sockets = [
+            await connect(server, await refresh(client, refresh_tokens, i))
+            for i in range(len(users))
+        ]
+        try:
+            for name, hand_over in (("reconnect", reconnect), ("reauth", reauth)):
+                tokens: List[str] = [""] * len(users)
+
+                async def get_token(i: int):
+                    tokens[i] = await refresh(client, refresh_tokens, i)
+
+                results[f"{name}_refresh"] = await timed_storm(
+                    f"{name}_refresh", args.concurrency, len(users), get_token, client
+                )
+                results[f"{name}_socket"] = await timed_storm(
+                    f"{name}_socket",
+                    args.concurrency,
+                    len(users),
+                    lambda i: hand_over(server, sockets, i, tokens[i]),
+                    client,
+                )
+        finally:
+            await asyncio.gather(*(socket.close() for socket in sockets), return_exceptions=True)
+    return results
+
+
+def main():
+    parser = build_parser("Token renewal storm: reconnect vs in-band reauth")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.set_defaults(concurrency=100)
+    args = parser.parse_args()
+    env = prepare(args)
+
+    users = load_users(args.clients)
+    with ServerProcess(args.port, env, workers=args.workers) as server:
+        results = asyncio.run(run_reauth(server, users, args))
+
+    path = write_report(args, results, suffix="-reauth")
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
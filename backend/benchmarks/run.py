@@ -0,0 +1,273 @@
+"""
+End-to-end load test for the chat backend.
+
+Usage (from backend/):
+    python -m benchmarks.run --seed --ws-clients 1000 --output benchmarks/results
+
+The server runs in its own process against the database configured in the
+environment (.env); use --compose to start the docker-compose postgres service.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+import websockets
+
+from .harness import (
+    BenchUser,
+    ScenarioResult,
+    ServerProcess,
+    git_revision,
+    load_hot_pairs,
+    load_users,
+    migrate_database,
+    seed_database,
+    start_postgres_with_compose,
+)
+
+
+async def run_ws_delivery(
+    server: ServerProcess,
+    users: List[BenchUser],
+    messages_per_client: int,
+    send_interval: float,
+    pollers: int,
+    timeout: float,
+) -> Dict[str, ScenarioResult]:
+    """
+    Pair up WebSocket clients and measure send-to-deliver latency: the time from a
+    sender writing a frame to the receiver reading the matching new_message frame.
+    REST pollers hit /unread-count in the background to add realistic load.
+    """
+    delivery = ScenarioResult("ws_send_to_deliver")
+    polling = ScenarioResult("rest_unread_poll")
+    sent_at: Dict[str, float] = {}
+    expected = (len(users) // 2) * 2 * messages_per_client
+    all_delivered = asyncio.Event()
+
+    async def reader(socket):
+        async for raw in socket:
+            frame = json.loads(raw)
+            if frame.get("type") == "ping":
+                await socket.send(json.dumps({"type": "pong"}))
+            elif frame.get("type") == "new_message":
+                started = sent_at.pop(frame["data"]["content"], None)
+                if started is not None:
+                    delivery.latencies.append(time.perf_counter() - started)
+                    if len(delivery.latencies) >= expected:
+                        all_delivered.set()
+            elif "error" in frame:
+                delivery.errors += 1
+
+    async def sender(socket, user: BenchUser, partner: BenchUser):
+        for i in range(messages_per_client):
+            content = f"bench {user.id}:{i}"
+            sent_at[content] = time.perf_counter()
+            await socket.send(json.dumps({"receiver_id": partner.id, "content": content}))
+            await asyncio.sleep(send_interval)
+
+    async def poller(client: httpx.AsyncClient, user: BenchUser, stop: asyncio.Event):
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                response = await client.get(
+                    "/direct-messages/unread-count",
+                    headers={"Authorization": f"Bearer {user.token}"},
+                )
+                response.raise_for_status()
+                polling.latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                polling.errors += 1
+            await asyncio.sleep(0.5)
+
+    sockets = []
+    for user in users:
+        sockets.append(await websockets.connect(f"{server.ws_url}/direct-messages/ws/?token={user.token}"))
+
+    readers = [asyncio.create_task(reader(socket)) for socket in sockets]
+    stop_polling = asyncio.Event()
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=30) as client:
+        poller_tasks = [
+            asyncio.create_task(poller(client, user, stop_polling))
+            for user in itertools.islice(itertools.cycle(users), pollers)
+        ]
+
+        started = time.perf_counter()
+        senders = []
+        for i in range(0, len(users) - 1, 2):
+            a, b = users[i], users[i + 1]
+            senders.append(sender(sockets[i], a, b))
+            senders.append(sender(sockets[i + 1], b, a))
+        await asyncio.gather(*senders)
+        try:
+            await asyncio.wait_for(all_delivered.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        delivery.elapsed = polling.elapsed = time.perf_counter() - started
+        delivery.errors += len(sent_at)
+
+        stop_polling.set()
+        await asyncio.gather(*poller_tasks)
+
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*(socket.close() for socket in sockets), return_exceptions=True)
+    return {delivery.name: delivery, polling.name: polling}
+
+
+async def run_http_scenario(
+    name: str,
+    server: ServerProcess,
+    requests: int,
+    concurrency: int,
+    make_request: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]],
+) -> ScenarioResult:
+    """Issue `requests` calls with `concurrency` workers and record their latency"""
+    result = ScenarioResult(name)
+    counter = itertools.count()
+
+    async def worker(client: httpx.AsyncClient):
+        while (i := next(counter)) < requests:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                response.raise_for_status()
+                result.latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                result.errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=60, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        result.elapsed = time.perf_counter() - started
+    return result
+
+
+async def run_benchmarks(args, server: ServerProcess) -> Dict[str, ScenarioResult]:
+    results: Dict[str, ScenarioResult] = {}
+    users = load_users(args.ws_clients)
+    pairs = load_hot_pairs(max(args.concurrency, 10))
+
+    def auth(user: BenchUser) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {user.token}"}
+
+    results.update(
+        await run_ws_delivery(
+            server,
+            users,
+            args.messages_per_client,
+            args.send_interval,
+            args.pollers,
+            args.timeout,
+        )
+    )
+
+    http_scenarios = {
+        "history_fetch": lambda client, i: client.get(
+            "/direct-messages/",
+            params={"other_user_id": pairs[i % len(pairs)][1], "limit": 50, "latest": "true"},
+            headers=auth(pairs[i % len(pairs)][0]),
+        ),
+        "conversations": lambda client, i: client.get(
+            "/direct-messages/conversations", headers=auth(pairs[i % len(pairs)][0])
+        ),
+        "user_search": lambda client, i: client.get(
+            "/users/search/",
+            params={"query": f"seed user {i % 100}", "limit": 10},
+            headers=auth(pairs[i % len(pairs)][0]),
+        ),
+        "summarize": lambda client, i: client.post(
+            "/ai/summarize",
+            json={"other_user_id": pairs[i % len(pairs)][1], "message_count": 20},
+            headers=auth(pairs[i % len(pairs)][0]),
+        ),
+    }
+    for name, make_request in http_scenarios.items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = await run_http_scenario(
+            name, server, args.requests, args.concurrency, make_request
+        )
+
+    return results
+
+
+def build_parser(description: str = "Chat backend load test") -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--compose", action="store_true", help="Start postgres via docker-compose")
+    parser.add_argument("--seed", action="store_true", help="Seed data before running")
+    parser.add_argument("--seed-users", type=int, default=5000)
+    parser.add_argument("--seed-conversations", type=int, default=20000)
+    parser.add_argument("--seed-messages", type=int, default=500000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--messages-per-client", type=int, default=10)
+    parser.add_argument("--send-interval", type=float, default=0.1)
+    parser.add_argument("--pollers", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--only", nargs="*", help="Only run these HTTP scenarios")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results"))
+    return parser
+
+
+def prepare(args) -> Dict[str, str]:
+    """Start/migrate/seed the database as requested and return the server environment"""
+    env = {
+        **os.environ,
+        # The limiter would otherwise throttle the simulated clients
+        "RATE_LIMIT_MESSAGES_PER_SECOND": os.getenv("RATE_LIMIT_MESSAGES_PER_SECOND", "100000"),
+        "RATE_LIMIT_BURST": os.getenv("RATE_LIMIT_BURST", "100000"),
+    }
+
+    if args.compose:
+        start_postgres_with_compose()
+    migrate_database(env)
+    if args.seed:
+        seed_database(args.seed_users, args.seed_conversations, args.seed_messages, env)
+    return env
+
+
+def write_report(args, results: dict, suffix: str = "") -> str:
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(
+        args.output, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{revision}{suffix}.json"
+    )
+    with open(path, "w") as output:
+        json.dump(report, output, indent=2)
+    return path
+
+
+def main():
+    args = build_parser().parse_args()
+    env = prepare(args)
+
+    with ServerProcess(args.port, env, workers=args.workers) as server:
+        results = asyncio.run(run_benchmarks(args, server))
+
+    summaries = {name: result.summary() for name, result in results.items()}
+    path = write_report(args, summaries)
+    print(json.dumps(summaries, indent=2))
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
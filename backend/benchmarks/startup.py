@@ -0,0 +1,104 @@
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import app.main.
+
+Usage (from backend/):
+    python -m benchmarks.startup --runs 20
+
+Each run imports the app in a new process and times the stages separately:
+settings and engine setup, OAuth client registration, AI summarizer
+construction and the rest of app.main. The run also records whether the import
+opened any database connection, which it should not. Results use the same
+format as benchmarks.run, so benchmarks.compare works on them.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from .harness import BACKEND_DIR, ScenarioResult, git_revision
+
+# Runs in the child process; prints one JSON object with stage timings (seconds)
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app.database
+database = time.perf_counter()
+import app.auth.oauth
+oauth = time.perf_counter()
+import app.services.ai_summarizer
+summarizer = time.perf_counter()
+import app.main
+main = time.perf_counter()
+app.services.ai_summarizer.AIChatSummarizer()
+constructor = time.perf_counter() - main
+pool = app.database.engine.pool
+print(json.dumps({
+    "startup_config_and_database": database - started,
+    "startup_oauth_registration": oauth - database,
+    "startup_ai_summarizer": summarizer - oauth,
+    "startup_summarizer_constructor": constructor,
+    "startup_app_main_rest": main - summarizer,
+    "startup_import_total": main - started,
+    "db_connections": pool.checkedin() + pool.checkedout(),
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.main import-time benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results"))
+    args = parser.parse_args()
+
+    results = {}
+    process = ScenarioResult("startup_process_total")
+    db_connections = 0
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            process.errors += 1
+            sys.stderr.write(completed.stderr)
+            continue
+        process.latencies.append(time.perf_counter() - started)
+
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        db_connections = max(db_connections, timings.pop("db_connections"))
+        for name, seconds in timings.items():
+            results.setdefault(name, ScenarioResult(name)).latencies.append(seconds)
+    results[process.name] = process
+
+    for result in results.values():
+        result.elapsed = sum(result.latencies)
+
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {"runs": args.runs, "db_connections_at_import": db_connections},
+        "results": {name: result.summary() for name, result in results.items()},
+    }
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(
+        args.output, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{revision}-startup.json"
+    )
+    with open(path, "w") as output:
+        json.dump(report, output, indent=2)
+
+    print(json.dumps({name: result["p50_ms"] for name, result in report["results"].items()}, indent=2))
+    print(f"Database connections opened during import: {db_connections}")
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
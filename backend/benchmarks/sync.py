@@ -0,0 +1,126 @@
+"""
+Reconnect benchmark: rebuilding client state with the per-conversation
+endpoints vs one delta sync.
+
+Usage (from backend/):
+    python -m benchmarks.sync --conversations 50 --changed 5 --rounds 20
+
+Gives the most recent seeded user --conversations conversations with other
+seeded users, takes a sync token, then for each of --rounds rounds has
+--changed of the partners send a message and reconnects twice: once the old
+way (/direct-messages/conversations, /unread-count and the latest page of every
+conversation) and once with GET /sync?since=<token>. Reports requests, bytes
+and total latency per reconnect for both.
+"""
+
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+
+from .harness import BenchUser, ScenarioResult, ServerProcess, load_users
+from .run import build_parser, prepare, write_report
+
+
+async def send(client: httpx.AsyncClient, sender: BenchUser, receiver_id: int, content: str):
+    response = await client.post(
+        "/direct-messages/",
+        json={"receiver_id": receiver_id, "content": content},
+        headers={"Authorization": f"Bearer {sender.token}"},
+    )
+    response.raise_for_status()
+
+
+async def reconnect_per_endpoint(client: httpx.AsyncClient, headers: dict) -> tuple:
+    """The old reconnect: conversation list, unread count, then every conversation"""
+    requests, size = 2, 0
+    conversations = await client.get("/direct-messages/conversations", headers=headers)
+    unread = await client.get("/direct-messages/unread-count", headers=headers)
+    conversations.raise_for_status()
+    unread.raise_for_status()
+    size += len(conversations.content) + len(unread.content)
+    for user in conversations.json():
+        page = await client.get(
+            "/direct-messages/",
+            params={"other_user_id": user["id"], "latest": "true", "limit": 50},
+            headers=headers,
+        )
+        page.raise_for_status()
+        requests += 1
+        size += len(page.content)
+    return requests, size
+
+
+async def run_sync(server: ServerProcess, me: BenchUser, partners: List[BenchUser], args) -> dict:
+    headers = {"Authorization": f"Bearer {me.token}"}
+    old = ScenarioResult("reconnect_per_endpoint")
+    new = ScenarioResult("reconnect_sync")
+    old_requests = old_bytes = new_bytes = 0
+
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=60) as client:
+        for i, partner in enumerate(partners):
+            await send(client, partner, me.id, f"hello {i}")
+        response = await client.get("/sync", headers=headers)
+        response.raise_for_status()
+        token = response.json()["token"]
+        full_bytes = len(response.content)
+
+        for round_number in range(args.rounds):
+            for j in range(args.changed):
+                partner = partners[(round_number * args.changed + j) % len(partners)]
+                await send(client, partner, me.id, f"round {round_number}")
+
+            started = time.perf_counter()
+            requests, size = await reconnect_per_endpoint(client, headers)
+            old.latencies.append(time.perf_counter() - started)
+            old_requests += requests
+            old_bytes += size
+
+            started = time.perf_counter()
+            response = await client.get("/sync", params={"since": token}, headers=headers)
+            response.raise_for_status()
+            new.latencies.append(time.perf_counter() - started)
+            new_bytes += len(response.content)
+            token = response.json()["token"]
+
+    old.elapsed = sum(old.latencies)
+    new.elapsed = sum(new.latencies)
+    return {
+        "conversations": len(partners),
+        "changed_per_round": args.changed,
+        "full_sync_bytes": full_bytes,
+        old.name: {
+            **old.summary(),
+            "requests_per_reconnect": old_requests / args.rounds,
+            "bytes_per_reconnect": round(old_bytes / args.rounds),
+        },
+        new.name: {
+            **new.summary(),
+            "requests_per_reconnect": 1,
+            "bytes_per_reconnect": round(new_bytes / args.rounds),
+        },
+    }
+
+
+def main():
+    parser = build_parser("Reconnect benchmark: per-conversation endpoints vs delta sync")
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--changed", type=int, default=5, help="Conversations changed per round")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    env = prepare(args)
+
+    users = load_users(args.conversations + 1)
+    me, partners = users[0], users[1:]
+    with ServerProcess(args.port, env, workers=args.workers) as server:
+        results = asyncio.run(run_sync(server, me, partners, args))
+
+    path = write_report(args, results, suffix="-sync")
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
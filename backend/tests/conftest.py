@@ -0,0 +1,4 @@
+import os
+
+# Settings are read when app.config is first imported
+os.environ.setdefault("SECRET_KEY", "test-secret-key-that-is-at-least-32-characters")
@@ -0,0 +1,28 @@
+class FakeWebSocket:
+    """Stands in for a Starlette WebSocket, recording the frames sent to it"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(text)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+class FakeClock:
+    """Replaces a module's `time` for code that reads time.monotonic()"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
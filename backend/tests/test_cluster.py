@@ -0,0 +1,177 @@
+import asyncio
+import os
+import tempfile
+from typing import Optional
+
+from app.cluster import ClusterClient, encode_frame
+from app.routers.websocket_manager import ConnectionManager
+from app.serve import ClusterHub
+
+from .fakes import FakeWebSocket
+
+
+async def wait_until(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def start_cluster(socket_dir: str, worker_ids, hub: Optional[ClusterHub] = None):
+    """A hub on a Unix socket and a connected manager per worker id"""
+    path = os.path.join(socket_dir, "hub.sock")
+    hub = hub or ClusterHub()
+    server = await asyncio.start_unix_server(hub.handle_worker, path)
+    managers = {}
+    for worker_id in worker_ids:
+        client = ClusterClient()
+        manager = ConnectionManager()
+        manager.attach_cluster(client)
+        await client.start(path, worker_id)
+        managers[worker_id] = manager
+    await wait_until(lambda: len(hub.workers) == len(managers))
+    return hub, server, managers
+
+
+async def stop_cluster(server, managers):
+    for manager in managers.values():
+        await manager.cluster.stop()
+    server.close()
+    await server.wait_closed()
+
+
+def run_cluster_test(test):
+    async def main():
+        with tempfile.TemporaryDirectory() as socket_dir:
+            hub, server, managers = await start_cluster(socket_dir, ["a", "b"])
+            try:
+                await test(hub, managers["a"], managers["b"])
+            finally:
+                await stop_cluster(server, managers)
+
+    asyncio.run(main())
+
+
+def test_status_is_shared_across_workers():
+    async def test(hub, a, b):
+        await b.connect(7, FakeWebSocket())
+        await wait_until(lambda: 7 in a.cluster.online_users)
+        assert hub.user_workers == {7: {"b"}}
+        assert a.is_user_connected(7)
+
+        b.disconnect(7)
+        await wait_until(lambda: 7 not in a.cluster.online_users)
+        assert hub.user_workers == {}
+
+    run_cluster_test(test)
+
+
+def test_message_reaches_user_on_other_worker():
+    async def test(hub, a, b):
+        socket = FakeWebSocket()
+        await b.connect(7, socket)
+        await wait_until(lambda: 7 in a.cluster.online_users)
+
+        # Forwarded through the hub, so only reported as sent
+        assert await a.send_personal_message({"type": "new_message"}, 7) == "sent"
+        await wait_until(lambda: socket.sent)
+        assert socket.sent == ['{"type":"new_message"}']
+        # Delivered to the socket on the same worker
+        assert await b.send_personal_message({"type": "ping"}, 7) == "delivered"
+        assert await a.send_personal_message({"type": "ping"}, 8) is None
+
+    run_cluster_test(test)
+
+
+def test_group_frame_is_split_by_worker():
+    async def test(hub, a, b):
+        local, remote = FakeWebSocket(), FakeWebSocket()
+        await a.connect(1, local)
+        await b.connect(2, remote)
+        await wait_until(lambda: 2 in a.cluster.online_users)
+
+        assert await a.send_to_users({"type": "group_message"}, [1, 2, 3]) == 1
+        await wait_until(lambda: remote.sent)
+        assert local.sent == remote.sent == ['{"type":"group_message"}']
+
+    run_cluster_test(test)
+
+
+def test_publish_reaches_only_other_workers():
+    async def test(hub, a, b):
+        received = {"a": [], "b": []}
+        a.cluster.on("cache_event", lambda frame: received["a"].append(frame["data"]))
+        b.cluster.on("cache_event", lambda frame: received["b"].append(frame["data"]))
+
+        assert a.cluster.publish("cache_event", {"key": 1})
+        await wait_until(lambda: received["b"])
+        assert received == {"a": [], "b": [{"key": 1}]}
+
+    run_cluster_test(test)
+
+
+def test_worker_leaving_takes_its_users_offline():
+    async def test(hub, a, b):
+        await b.connect(7, FakeWebSocket())
+        await wait_until(lambda: 7 in a.cluster.online_users)
+
+        await b.cluster.stop()
+        await wait_until(lambda: 7 not in a.cluster.online_users)
+        assert "b" not in hub.workers
+
+    run_cluster_test(test)
+
+
+def test_slow_handler_does_not_block_later_frames():
+    async def test(hub, a, b):
+        release = asyncio.Event()
+        received = []
+
+        async def slow(frame):
+            await release.wait()
+            received.append("slow")
+
+        b.cluster.on("slow", slow)
+        b.cluster.on("fast", lambda frame: received.append("fast"))
+
+        a.cluster.publish("slow", {})
+        a.cluster.publish("fast", {})
+        await wait_until(lambda: received)
+        assert received == ["fast"]
+        assert b.cluster.get_stats()["pending_handlers"] == 1
+
+        release.set()
+        await wait_until(lambda: len(received) == 2)
+        assert b.cluster.get_stats()["pending_handlers"] == 0
+
+    run_cluster_test(test)
+
+
+def test_hub_disconnects_a_worker_that_stops_reading():
+    async def main():
+        with tempfile.TemporaryDirectory() as socket_dir:
+            hub = ClusterHub(max_buffer_bytes=256 * 1024)
+            hub, server, managers = await start_cluster(socket_dir, ["a"], hub)
+            a = managers["a"]
+            try:
+                # A worker that says hello and then never reads
+                _, writer = await asyncio.open_unix_connection(
+                    os.path.join(socket_dir, "hub.sock")
+                )
+                writer.write(encode_frame({"op": "hello", "worker": "stuck", "users": [9]}))
+                await wait_until(lambda: 9 in a.cluster.online_users)
+
+                payload = {"blob": "x" * 32768}
+                while "stuck" in hub.workers:
+                    assert a.cluster.publish("cache_event", payload)
+                    await asyncio.sleep(0)
+
+                assert hub.lagging_disconnects == 1
+                # Its users go offline, and the other workers are still served
+                await wait_until(lambda: 9 not in a.cluster.online_users)
+                assert list(hub.workers) == ["a"]
+                writer.close()
+            finally:
+                await stop_cluster(server, managers)
+
+    asyncio.run(main())
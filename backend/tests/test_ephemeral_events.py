@@ -0,0 +1,73 @@
+import asyncio
+
+from app.routers.ephemeral_events import EphemeralEventDispatcher
+
+
+class FakeManager:
+    def __init__(self, connected):
+        self.connected = set(connected)
+        self.sent = []
+
+    def is_user_connected(self, user_id: int) -> bool:
+        return user_id in self.connected
+
+    async def send_personal_message(self, message: dict, user_id: int):
+        self.sent.append((user_id, message))
+        return "delivered"
+
+
+def typing(manager: FakeManager, sender_id: int, receiver_id: int):
+    return [
+        message["data"]
+        for user_id, message in manager.sent
+        if user_id == receiver_id and message["data"]["sender_id"] == sender_id
+    ]
+
+
+def test_events_inside_a_window_are_coalesced_to_the_latest():
+    async def test():
+        manager = FakeManager(connected=[2])
+        dispatcher = EphemeralEventDispatcher(manager, debounce_seconds=0.05)
+
+        for n in range(5):
+            await dispatcher.publish(1, 2, "typing", {"n": n})
+        # The first event goes out at once
+        assert typing(manager, 1, 2) == [{"sender_id": 1, "n": 0}]
+
+        await asyncio.sleep(0.08)
+        assert typing(manager, 1, 2) == [{"sender_id": 1, "n": 0}, {"sender_id": 1, "n": 4}]
+        assert dispatcher.get_stats()["coalesced"] == 3
+
+        # The flush opened another window, which closes without anything to send
+        await asyncio.sleep(0.08)
+        assert dispatcher.windows == {}
+        assert len(manager.sent) == 2
+
+    asyncio.run(test())
+
+
+def test_windows_are_per_sender_receiver_and_type():
+    async def test():
+        manager = FakeManager(connected=[2, 3])
+        dispatcher = EphemeralEventDispatcher(manager, debounce_seconds=0.05)
+
+        await dispatcher.publish(1, 2, "typing", {})
+        await dispatcher.publish(1, 3, "typing", {})
+        await dispatcher.publish(4, 2, "typing", {})
+        await dispatcher.publish(1, 2, "recording", {})
+        assert len(manager.sent) == 4
+        assert dispatcher.get_stats()["delivered"] == 4
+
+    asyncio.run(test())
+
+
+def test_events_for_offline_users_are_dropped():
+    async def test():
+        manager = FakeManager(connected=[])
+        dispatcher = EphemeralEventDispatcher(manager, debounce_seconds=0.05)
+
+        await dispatcher.publish(1, 2, "typing", {})
+        assert manager.sent == []
+        assert dispatcher.windows == {}
+
+    asyncio.run(test())
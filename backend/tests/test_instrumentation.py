@@ -0,0 +1,10 @@
+from app.instrumentation import parameters_shape
+
+
+def test_parameters_shape_never_includes_values():
+    assert parameters_shape({"id": 5, "name": "secret"}) == {"id": "int", "name": "str"}
+    assert parameters_shape((5, "secret", None)) == ["int", "str", "NoneType"]
+    assert parameters_shape([{"id": 1}, {"id": 2}]) == "2 x {'id': 'int'}"
+    assert parameters_shape([(1, "a"), (2, "b")]) == "2 x ['int', 'str']"
+    assert parameters_shape([]) == []
+    assert parameters_shape(None) == "NoneType"
@@ -0,0 +1,32 @@
+import logging
+
+from app import logger as app_logger
+from app.logger import SamplingFilter
+
+
+def record(name: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, "message", None, None)
+
+
+def test_longest_matching_prefix_wins():
+    sampling = SamplingFilter({"app.routers": 0.5, "app.routers.websocket_manager": 0.1})
+
+    assert sampling.rate_for("app.routers.websocket_manager") == 0.1
+    assert sampling.rate_for("app.routers.groups") == 0.5
+    assert sampling.rate_for("app.routers") == 0.5
+    # A prefix only matches whole logger name segments
+    assert sampling.rate_for("app.routersx") == 1.0
+    assert sampling.rate_for("app.services") == 1.0
+
+
+def test_only_info_and_below_are_sampled(monkeypatch):
+    sampling = SamplingFilter({"app": 0.25})
+    monkeypatch.setattr(app_logger.random, "random", lambda: 0.5)
+
+    assert not sampling.filter(record("app.x", logging.INFO))
+    assert not sampling.filter(record("app.x", logging.DEBUG))
+    assert sampling.filter(record("app.x", logging.WARNING))
+    assert sampling.filter(record("other", logging.INFO))
+
+    monkeypatch.setattr(app_logger.random, "random", lambda: 0.1)
+    assert sampling.filter(record("app.x", logging.INFO))
@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+
+from app.services.message_cache import RecentMessageCache, message_size
+
+
+def message(message_id: int, sender_id: int = 1, receiver_id: int = 2, content: str = "hi"):
+    return {
+        "id": message_id,
+        "content": content,
+        "content_bytes": None,
+        "created_at": datetime(2026, 1, 1, tzinfo=timezone.utc),
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "attachment_id": None,
+    }
+
+
+def fill(cache: RecentMessageCache, messages, complete=True, cursors=None):
+    cache.fill(1, 2, messages, complete, {1: "alice", 2: "bob"}, cursors or {})
+
+
+def ids(result):
+    messages, _ = result
+    return [message["id"] for message in messages]
+
+
+def test_uncached_conversation_misses():
+    cache = RecentMessageCache(capacity=5, max_bytes=1 << 20)
+    assert cache.latest(1, 2, 5) is None
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_fill_serves_either_direction_with_read_flags():
+    cache = RecentMessageCache(capacity=5, max_bytes=1 << 20)
+    fill(cache, [message(1), message(2), message(3, sender_id=2, receiver_id=1)], cursors={2: 1})
+
+    messages, participants = cache.latest(2, 1, 2)
+    assert [(m["id"], m["is_read"]) for m in messages] == [(2, False), (3, False)]
+    assert participants == {1: "alice", 2: "bob"}
+    cache.mark_read(2, 1, 2)
+    assert [m["is_read"] for m in cache.latest(1, 2, 3)[0]] == [True, True, False]
+
+
+def test_incomplete_tail_only_answers_within_its_length():
+    cache = RecentMessageCache(capacity=2, max_bytes=1 << 20)
+    fill(cache, [message(1), message(2), message(3)])
+
+    assert ids(cache.latest(1, 2, 2)) == [2, 3]
+    assert cache.latest(1, 2, 3) is None
+
+
+def test_append_keeps_the_newest_capacity_messages():
+    cache = RecentMessageCache(capacity=2, max_bytes=1 << 20)
+    fill(cache, [message(1)])
+
+    cache.append(message(2, sender_id=2, receiver_id=1))
+    assert ids(cache.latest(1, 2, 5)) == [1, 2]
+    cache.append(message(3))
+    assert ids(cache.latest(1, 2, 2)) == [2, 3]
+    # Message 1 was dropped, so the cache no longer holds the whole conversation
+    assert cache.latest(1, 2, 3) is None
+
+
+def test_append_skips_messages_the_fill_already_loaded():
+    cache = RecentMessageCache(capacity=5, max_bytes=1 << 20)
+    fill(cache, [message(1), message(2)])
+
+    cache.append(message(2))
+    cache.append(message(1))
+    assert ids(cache.latest(1, 2, 5)) == [1, 2]
+    assert cache.total_bytes == 2 * message_size(message(1))
+
+
+def test_append_inserts_a_message_committed_out_of_id_order():
+    cache = RecentMessageCache(capacity=3, max_bytes=1 << 20)
+    fill(cache, [message(1), message(3)])
+
+    cache.append(message(2))
+    assert ids(cache.latest(1, 2, 5)) == [1, 2, 3]
+    cache.append(message(5))
+    cache.append(message(4))
+    assert ids(cache.latest(1, 2, 3)) == [3, 4, 5]
+    assert cache.total_bytes == 3 * message_size(message(1))
+
+
+def test_append_older_than_an_incomplete_tail_is_ignored():
+    cache = RecentMessageCache(capacity=2, max_bytes=1 << 20)
+    fill(cache, [message(3), message(4)], complete=False)
+
+    cache.append(message(2))
+    assert ids(cache.latest(1, 2, 2)) == [3, 4]
+
+    # Older than a full conversation: it no longer fits, so only the tail is held
+    fill(cache, [message(3), message(4)])
+    cache.append(message(2))
+    assert ids(cache.latest(1, 2, 2)) == [3, 4]
+    assert cache.latest(1, 2, 3) is None
+
+
+def test_append_to_uncached_conversation_is_ignored():
+    cache = RecentMessageCache(capacity=5, max_bytes=1 << 20)
+    cache.append(message(1))
+    assert cache.conversations == {}
+
+
+def test_least_recently_used_conversation_is_evicted_over_max_bytes():
+    size = message_size(message(1))
+    cache = RecentMessageCache(capacity=5, max_bytes=2 * size)
+    cache.fill(1, 2, [message(1)], True, {}, {})
+    cache.fill(3, 4, [message(2, 3, 4)], True, {}, {})
+    cache.latest(1, 2, 1)
+
+    cache.fill(5, 6, [message(3, 5, 6)], True, {}, {})
+    assert list(cache.conversations) == [(1, 2), (5, 6)]
+    assert cache.total_bytes == 2 * size
@@ -0,0 +1,29 @@
+from app.metrics import Counter, Histogram, MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 2.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_counter_labels():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("requests_total", "Requests", ["result"]))
+    counter.labels("hit").inc()
+    counter.labels("hit").inc(2)
+    counter.labels("miss").inc()
+
+    assert [line for line in registry.render().splitlines() if not line.startswith("#")] == [
+        'requests_total{result="hit"} 3',
+        'requests_total{result="miss"} 1',
+    ]
@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services.direct_message import find_by_message_id
+from app.services.partitions import PartitionIdRanges, partition_id_ranges
+
+MARCH = datetime(2026, 3, 1, tzinfo=timezone.utc)
+APRIL = datetime(2026, 4, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def ranges(monkeypatch):
+    # March (ids 1-100) is closed, April is open
+    monkeypatch.setattr(partition_id_ranges, "_ranges", [(MARCH, 1, 100)])
+    monkeypatch.setattr(partition_id_ranges, "_open_from", APRIL)
+    monkeypatch.setattr(partition_id_ranges, "unbounded_retries", 0)
+    return partition_id_ranges
+
+
+def test_unloaded_ranges_do_not_bound():
+    ranges = PartitionIdRanges()
+    assert ranges.lower_bound(5) is None
+    assert ranges.covers(5, MARCH)
+
+
+def test_ids_outside_the_closed_ranges_are_bounded_by_the_open_month(ranges):
+    assert ranges.lower_bound(50) == MARCH
+    assert ranges.lower_bound(500) == APRIL
+    # Imported into March after the ranges were loaded
+    assert not ranges.covers(500, MARCH)
+
+
+def test_missed_lookup_is_retried_without_the_bound(ranges):
+    conditions = []
+
+    def lookup(condition):
+        conditions.append(str(condition))
+        return None if len(conditions) == 1 else "row"
+
+    assert find_by_message_id(lookup, 500) == "row"
+    assert ["created_at" in condition for condition in conditions] == [True, False]
+    assert ranges.unbounded_retries == 1
+
+
+def test_found_lookup_is_not_retried(ranges):
+    conditions = []
+
+    def lookup(condition):
+        conditions.append(condition)
+        return "row"
+
+    assert find_by_message_id(lookup, 50) == "row"
+    assert len(conditions) == 1
+    assert ranges.unbounded_retries == 0
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+from app.cluster import ClusterClient
+from app.routers.presence_manager import PresenceService
+from app.routers.websocket_manager import ConnectionManager
+
+from .fakes import FakeWebSocket
+
+
+def presence_service(manager: ConnectionManager) -> PresenceService:
+    return PresenceService(manager, batch_interval=1.0, max_subscriptions=3)
+
+
+def test_subscribe_returns_snapshot_and_caps_targets():
+    async def test():
+        manager = ConnectionManager()
+        presence = presence_service(manager)
+        await manager.connect(2, FakeWebSocket())
+
+        snapshot = presence.subscribe(1, [1, 2, 3, 4, 5])
+        # The cap applies before the watcher itself is dropped
+        assert snapshot == {"online": [2], "offline": [3]}
+        assert presence.watchers == {2: {1}, 3: {1}}
+
+        presence.subscribe(1, [4])
+        assert presence.watchers == {4: {1}}
+
+    asyncio.run(test())
+
+
+def test_deltas_are_batched_per_watcher():
+    async def test():
+        manager = ConnectionManager()
+        presence = presence_service(manager)
+        watcher = FakeWebSocket()
+        await manager.connect(1, watcher)
+        presence.subscribe(1, [2, 3])
+
+        await manager.connect(2, FakeWebSocket())
+        await manager.connect(3, FakeWebSocket())
+        manager.disconnect(3)
+        await manager.connect(4, FakeWebSocket())
+        await presence.flush()
+
+        assert [json.loads(frame) for frame in watcher.sent] == [
+            {"type": "presence", "data": {"online": [2], "offline": [3]}}
+        ]
+        await presence.flush()
+        assert len(watcher.sent) == 1
+
+    asyncio.run(test())
+
+
+def test_local_disconnect_drops_subscriptions_while_online_elsewhere():
+    async def test():
+        manager = ConnectionManager()
+        cluster = ClusterClient()
+        manager.attach_cluster(cluster)
+        presence = presence_service(manager)
+        # Connected to the hub, which reports the user on another worker too
+        cluster._send = lambda frame: True
+        await manager.connect(1, FakeWebSocket())
+        cluster.online_users.add(1)
+        presence.subscribe(1, [2])
+
+        manager.disconnect(1)
+        assert manager.is_user_connected(1)
+        assert presence.subscriptions == {}
+        assert presence.watchers == {}
+
+    asyncio.run(test())
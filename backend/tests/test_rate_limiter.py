@@ -0,0 +1,52 @@
+import pytest
+
+from app.services import rate_limiter
+from app.services.rate_limiter import TokenBucketLimiter
+
+from .fakes import FakeClock
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def test_burst_then_throttled_until_refill(clock):
+    limiter = TokenBucketLimiter(rate=2.0, burst=3, max_keys=10)
+
+    assert [limiter.try_acquire("u") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.try_acquire("u") == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert limiter.try_acquire("u") == 0.0
+    assert limiter.get_stats() == {"allowed": 4, "throttled": 1, "tracked_keys": 1}
+
+
+def test_refill_is_capped_at_burst(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=2, max_keys=10)
+    limiter.try_acquire("u")
+
+    clock.now += 3600
+    assert [limiter.try_acquire("u") for _ in range(3)] == [0.0, 0.0, pytest.approx(1.0)]
+
+
+def test_keys_have_separate_buckets(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=1, max_keys=10)
+
+    assert limiter.try_acquire("a") == 0.0
+    assert limiter.try_acquire("a") > 0
+    assert limiter.try_acquire("b") == 0.0
+
+
+def test_least_recently_used_key_is_evicted(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=1, max_keys=2)
+    limiter.try_acquire("a")
+    limiter.try_acquire("b")
+    limiter.try_acquire("a")  # throttled, but now the most recently used
+
+    limiter.try_acquire("c")
+    assert list(limiter.buckets) == ["a", "c"]
+    # An evicted key starts again with a full bucket
+    assert limiter.try_acquire("b") == 0.0
@@ -0,0 +1,110 @@
+import uuid
+
+import pytest
+from jose import JWTError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.auth import denylist as denylist_module
+from app.auth import sessions
+from app.auth.denylist import SessionDenylist, session_denylist
+from app.auth.jwt import decode_access_token
+from app.database import get_new_db_session
+from app.models import direct_message  # noqa: F401 (configures the User mapper)
+from app.models.user import User
+
+from .fakes import FakeClock
+
+
+def test_denylist_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(denylist_module, "time", clock)
+    denylist = SessionDenylist(ttl_seconds=60)
+
+    denylist.revoke(1)
+    clock.now += 30
+    denylist.deny(2)
+    assert denylist.is_revoked(1) and denylist.is_revoked(2)
+    assert not denylist.is_revoked(3)
+    assert not denylist.is_revoked(None)
+
+    clock.now += 31
+    assert not denylist.is_revoked(1)
+    # Expired entries are pruned when the next one is added
+    denylist.deny(3)
+    assert list(denylist._revoked) == [2, 3]
+    assert denylist.get_stats() == {"revoked_sessions": 2, "revocations": 3}
+
+
+def test_malformed_refresh_tokens_are_rejected_without_a_query():
+    for token in ("", "abc", "12", "12.", "x.secret", "-1.secret"):
+        with pytest.raises(sessions.InvalidRefreshToken):
+            sessions.refresh_session(None, token)
+
+
+@pytest.fixture
+def db():
+    db = get_new_db_session()
+    try:
+        db.execute(text("SELECT 1 FROM refresh_tokens LIMIT 1"))
+    except DBAPIError:
+        db.close()
+        pytest.skip("needs a migrated database")
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def user(db):
+    name = f"session-test-{uuid.uuid4().hex[:8]}"
+    user = User(username=name, email=f"{name}@example.com", auth_provider="local")
+    db.add(user)
+    db.commit()
+    yield user
+    db.delete(user)
+    db.commit()
+
+
+def test_refresh_rotates_the_token(db, user):
+    tokens = sessions.start_session(db, user)
+    renewed = sessions.refresh_session(db, tokens["refresh_token"])
+
+    assert renewed["refresh_token"] != tokens["refresh_token"]
+    claims = decode_access_token(renewed["access_token"])
+    assert (claims["sub"], claims["uid"]) == (user.username, user.id)
+    assert sessions.refresh_session(db, renewed["refresh_token"])
+
+
+def test_replaying_the_replaced_token_revokes_the_session(db, user):
+    tokens = sessions.start_session(db, user)
+    renewed = sessions.refresh_session(db, tokens["refresh_token"])
+
+    with pytest.raises(sessions.RefreshTokenReused):
+        sessions.refresh_session(db, tokens["refresh_token"])
+    with pytest.raises(sessions.InvalidRefreshToken):
+        sessions.refresh_session(db, renewed["refresh_token"])
+    with pytest.raises(JWTError):
+        decode_access_token(renewed["access_token"])
+
+
+def test_unknown_secret_does_not_revoke_the_session(db, user):
+    tokens = sessions.start_session(db, user)
+    session_id = tokens["refresh_token"].split(".")[0]
+
+    for guess in ("guess", "another-guess"):
+        with pytest.raises(sessions.InvalidRefreshToken) as raised:
+            sessions.refresh_session(db, f"{session_id}.{guess}")
+        assert not isinstance(raised.value, sessions.RefreshTokenReused)
+    assert not session_denylist.is_revoked(int(session_id))
+    assert sessions.refresh_session(db, tokens["refresh_token"])
+
+
+def test_end_session_needs_the_current_token(db, user):
+    tokens = sessions.start_session(db, user)
+    renewed = sessions.refresh_session(db, tokens["refresh_token"])
+
+    with pytest.raises(sessions.InvalidRefreshToken):
+        sessions.end_session(db, tokens["refresh_token"])
+    sessions.end_session(db, renewed["refresh_token"])
+    with pytest.raises(JWTError):
+        decode_access_token(renewed["access_token"])
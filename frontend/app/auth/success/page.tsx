@@ -19,17 +19,17 @@ export default function AuthSuccess() {
         return;
       }
 
-      const token = searchParams.get('token');
+      const code = searchParams.get('code');
 
-      if (!token) {
-        setError('No authentication token found');
+      if (!code) {
+        setError('No login code found');
         return;
       }
 
       hasProcessedToken.current = true;
 
       try {
-        await handleOAuthSuccess(token);
+        await handleOAuthSuccess(code);
         // Redirect to dashboard immediately on success
         router.push('/dashboard');
       } catch (error) {
@@ -10,7 +10,11 @@ import { Input } from '@/components/ui/input';
 import { ScrollArea } from '@/components/ui/scroll-area';
 import { useAuth } from '@/contexts/AuthContext';
 import { useChat } from '@/contexts/ChatContext';
-import { getDirectMessages, sendDirectMessage } from '@/lib/api';
+import {
+  getDirectMessages,
+  getMessageContent,
+  sendDirectMessage,
+} from '@/lib/api';
 import { ChatUser, Message } from '@/lib/types';
 
 interface ChatInterfaceProps {
@@ -20,12 +24,19 @@ interface ChatInterfaceProps {
 
 export function ChatInterface({ userId, chatUser }: ChatInterfaceProps) {
   const { user, token } = useAuth();
-  const { addToRecentChats, wsConnected, sendMessage, subscribeToMessages } =
-    useChat();
+  const {
+    addToRecentChats,
+    wsConnected,
+    sendMessage,
+    typingUsers,
+    sendTyping,
+    subscribeToMessages,
+  } = useChat();
   const [messages, setMessages] = useState<Message[]>([]);
   const [newMessage, setNewMessage] = useState('');
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const [expandingIds, setExpandingIds] = useState<Set<number>>(new Set());
 
   const scrollAreaRef = useRef<HTMLDivElement>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
@@ -62,8 +73,8 @@ export function ChatInterface({ userId, chatUser }: ChatInterfaceProps) {
         setError(null);
 
         const data = await getDirectMessages(Number(userId), token);
-        console.log('Received messages:', data?.length || 0);
-        setMessages(data || []);
+        console.log('Received messages:', data?.messages?.length || 0);
+        setMessages(data?.messages || []);
       } catch (error) {
         console.error('Error fetching initial messages:', error);
         setError('Failed to load messages. Please try again.');
@@ -105,6 +116,11 @@ export function ChatInterface({ userId, chatUser }: ChatInterfaceProps) {
     return unsubscribe;
   }, [subscribeToMessages, userId, user]);
 
+  // Stop the typing indicator when leaving this chat
+  useEffect(() => {
+    return () => sendTyping(userId, false);
+  }, [sendTyping, userId]);
+
   // Scroll to bottom when messages change
   useEffect(() => {
     scrollToBottom();
@@ -140,6 +156,7 @@ export function ChatInterface({ userId, chatUser }: ChatInterfaceProps) {
     setMessages((prevMessages) => [...prevMessages, tempMessage]);
     const messageContent = newMessage;
     setNewMessage('');
+    sendTyping(userId, false);
 
     // Try to send via WebSocket first
     const sentViaWebSocket = await sendMessage(userId, messageContent);
@@ -179,6 +196,30 @@ export function ChatInterface({ userId, chatUser }: ChatInterfaceProps) {
     }
   };
 
+  // Replace a truncated preview with the full message text
+  const handleExpandMessage = async (messageId: number) => {
+    if (!token || expandingIds.has(messageId)) return;
+
+    setExpandingIds((prev) => new Set(prev).add(messageId));
+    try {
+      const { content } = await getMessageContent(messageId, token);
+      setMessages((prevMessages) =>
+        prevMessages.map((msg) =>
+          msg.id === messageId ? { ...msg, content, truncated: false } : msg,
+        ),
+      );
+    } catch (error) {
+      console.error('Error fetching full message:', error);
+      setError('Failed to load the full message. Please try again.');
+    } finally {
+      setExpandingIds((prev) => {
+        const next = new Set(prev);
+        next.delete(messageId);
+        return next;
+      });
+    }
+  };
+
   // Handle retry for failed messages
   const handleRetryMessage = (message: Message & { failed?: boolean }) => {
     if (!message.failed) return;
@@ -290,6 +331,18 @@ export function ChatInterface({ userId, chatUser }: ChatInterfaceProps) {
                       }
                     >
                       {message.content}
+                      {message.truncated && (
+                        <button
+                          type="button"
+                          className="block text-xs mt-1 underline"
+                          disabled={expandingIds.has(message.id)}
+                          onClick={() => handleExpandMessage(message.id)}
+                        >
+                          {expandingIds.has(message.id)
+                            ? 'Loading...'
+                            : 'Show full message'}
+                        </button>
+                      )}
                       {isFailed && (
                         <div className="text-xs mt-1">Click to retry</div>
                       )}
@@ -305,11 +358,19 @@ export function ChatInterface({ userId, chatUser }: ChatInterfaceProps) {
       </ScrollArea>
 
       <div className="border-t p-4">
+        {typingUsers.has(userId) && (
+          <p className="pb-2 text-xs text-muted-foreground">
+            {chatUser?.full_name || chatUser?.username || 'User'} is typing...
+          </p>
+        )}
         <form onSubmit={handleSendMessage} className="flex gap-2">
           <Input
             placeholder="Type your message..."
             value={newMessage}
-            onChange={(e) => setNewMessage(e.target.value)}
+            onChange={(e) => {
+              setNewMessage(e.target.value);
+              sendTyping(userId, e.target.value.trim() !== '');
+            }}
             className="flex-1"
           />
           <Button type="submit" size="icon" disabled={!newMessage.trim()}>
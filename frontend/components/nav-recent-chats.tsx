@@ -17,7 +17,7 @@ import { useChat } from '@/contexts/ChatContext';
 export function NavRecentChats() {
   const router = useRouter();
   const pathname = usePathname();
-  const { recentChats, isLoadingChats } = useChat();
+  const { recentChats, isLoadingChats, onlineUsers } = useChat();
 
   // Get current active chat user ID from URL
   const activeChatId = useMemo(() => {
@@ -90,6 +90,7 @@ export function NavRecentChats() {
           {recentChats.length > 0
             ? recentChats.map((user) => {
                 const isActive = activeChatId === user.id;
+                const isOnline = onlineUsers.has(user.id);
 
                 return (
                   <SidebarMenuItem key={user.id}>
@@ -111,6 +112,12 @@ export function NavRecentChats() {
                         )}
                       </Avatar>
                       <span>{user.full_name || user.username}</span>
+                      {isOnline && (
+                        <span
+                          className="ml-auto size-2 rounded-full bg-green-500"
+                          aria-label="Online"
+                        />
+                      )}
                     </SidebarMenuButton>
                   </SidebarMenuItem>
                 );
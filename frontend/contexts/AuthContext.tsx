@@ -5,6 +5,7 @@ import {
   useContext,
   useState,
   useEffect,
+  useRef,
   ReactNode,
 } from 'react';
 import { useRouter } from 'next/navigation';
@@ -28,7 +29,8 @@ interface AuthContextType {
     email: string,
     password: string,
   ) => Promise<void>;
-  handleOAuthSuccess: (token: string) => Promise<void>;
+  handleOAuthSuccess: (code: string) => Promise<void>;
+  refreshAccessToken: () => Promise<string | null>;
   logout: () => void;
   fetchUserProfile: () => Promise<void>;
 }
@@ -39,6 +41,7 @@ export function AuthProvider({ children }: { children: ReactNode }) {
   const [user, setUser] = useState<User | null>(null);
   const [token, setToken] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
+  const refreshPromiseRef = useRef<Promise<string | null> | null>(null);
   const router = useRouter();
 
   useEffect(() => {
@@ -52,6 +55,15 @@ export function AuthProvider({ children }: { children: ReactNode }) {
     }
   }, []);
 
+  const storeTokens = (data: {
+    access_token: string;
+    refresh_token: string;
+  }) => {
+    setToken(data.access_token);
+    localStorage.setItem('token', data.access_token);
+    localStorage.setItem('refreshToken', data.refresh_token);
+  };
+
   const fetchUserProfile = async (currentToken?: string) => {
     setIsLoading(true);
     const tokenToUse = currentToken || token;
@@ -114,9 +126,8 @@ export function AuthProvider({ children }: { children: ReactNode }) {
 
       const data = await response.json();
 
-      // Store token in state and localStorage
-      setToken(data.access_token);
-      localStorage.setItem('token', data.access_token);
+      // Store tokens in state and localStorage
+      storeTokens(data);
 
       // Fetch user profile with the new token
       await fetchUserProfile(data.access_token);
@@ -160,9 +171,8 @@ export function AuthProvider({ children }: { children: ReactNode }) {
 
       const data = await response.json();
 
-      // Store token in state and localStorage
-      setToken(data.access_token);
-      localStorage.setItem('token', data.access_token);
+      // Store tokens in state and localStorage
+      storeTokens(data);
 
       // Fetch user profile with the new token
       await fetchUserProfile(data.access_token);
@@ -177,36 +187,59 @@ export function AuthProvider({ children }: { children: ReactNode }) {
   };
 
   const logout = () => {
+    // End the session on the server, including its other access tokens
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (refreshToken) {
+      fetch(`${process.env.NEXT_PUBLIC_API_URL}/auth/logout`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken }),
+      }).catch((error) => console.error('Logout error:', error));
+    }
+
     // Clear user and token from state
     setUser(null);
     setToken(null);
 
-    // Remove token from localStorage
+    // Remove tokens from localStorage
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
 
     // Redirect to login page
     router.push('/auth/login');
   };
 
-  const handleOAuthSuccess = async (token: string) => {
-    // Prevent duplicate processing
-    if (token === localStorage.getItem('token') && user !== null) {
-      return;
-    }
-
+  const handleOAuthSuccess = async (code: string) => {
     setIsLoading(true);
 
     try {
+      // The callback hands over a one-time code rather than the tokens;
+      // it is redeemed like a refresh token
+      const tokenResponse = await fetch(
+        `${process.env.NEXT_PUBLIC_API_URL}/auth/refresh`,
+        {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({ refresh_token: code }),
+        },
+      );
+
+      if (!tokenResponse.ok) {
+        throw new Error('Login code is invalid or has expired');
+      }
+
       // Update state and localStorage
-      setToken(token);
-      localStorage.setItem('token', token);
+      const data = await tokenResponse.json();
+      storeTokens(data);
 
       // Fetch user profile once
       const response = await fetch(
         `${process.env.NEXT_PUBLIC_API_URL}/users/me`,
         {
           headers: {
-            Authorization: `Bearer ${token}`,
+            Authorization: `Bearer ${data.access_token}`,
           },
         },
       );
@@ -221,8 +254,9 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       return;
     } catch (error) {
       console.error('OAuth authentication error:', error);
-      // If something goes wrong, clear the token
+      // If something goes wrong, clear the tokens
       localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
       setToken(null);
       setUser(null);
       throw error;
@@ -231,6 +265,66 @@ export function AuthProvider({ children }: { children: ReactNode }) {
     }
   };
 
+  const refreshTokens = async (staleToken: string | null) => {
+    // Another tab may have refreshed while this one waited for the lock
+    const storedToken = localStorage.getItem('token');
+    if (storedToken && storedToken !== staleToken) {
+      setToken(storedToken);
+      return storedToken;
+    }
+
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (!refreshToken) {
+      return null;
+    }
+
+    try {
+      const response = await fetch(
+        `${process.env.NEXT_PUBLIC_API_URL}/auth/refresh`,
+        {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({ refresh_token: refreshToken }),
+        },
+      );
+
+      if (response.status === 401) {
+        // The session has ended or been revoked
+        logout();
+        return null;
+      }
+      if (!response.ok) {
+        throw new Error(`Token refresh failed: ${response.status}`);
+      }
+
+      const data = await response.json();
+      storeTokens(data);
+      return data.access_token as string;
+    } catch (error) {
+      console.error('Token refresh error:', error);
+      return null;
+    }
+  };
+
+  const refreshAccessToken = () => {
+    // Each refresh token works once, and reusing a replaced one ends the
+    // session, so refreshes run one at a time, across tabs too
+    if (!refreshPromiseRef.current) {
+      const staleToken = localStorage.getItem('token');
+      const refresh = () => refreshTokens(staleToken);
+      refreshPromiseRef.current = (
+        navigator.locks
+          ? navigator.locks.request('auth-token-refresh', refresh)
+          : refresh()
+      ).finally(() => {
+        refreshPromiseRef.current = null;
+      });
+    }
+    return refreshPromiseRef.current;
+  };
+
   const value = {
     user,
     token,
@@ -239,6 +333,7 @@ export function AuthProvider({ children }: { children: ReactNode }) {
     login,
     register,
     handleOAuthSuccess,
+    refreshAccessToken,
     logout,
     fetchUserProfile: () => fetchUserProfile(),
   };
@@ -6,6 +6,7 @@ import {
   useCallback,
   useContext,
   useEffect,
+  useMemo,
   useRef,
   useState,
 } from 'react';
@@ -21,16 +22,26 @@ interface ChatContextType {
   addToRecentChats: (user: ChatUser) => void;
   refreshRecentChats: () => Promise<void>;
   sendMessage: (receiverId: number, content: string) => Promise<boolean>;
+  onlineUsers: Set<number>;
+  typingUsers: Set<number>;
+  sendTyping: (receiverId: number, isTyping: boolean) => void;
   subscribeToMessages: (callback: (message: Message) => void) => () => void;
 }
 
+// Resend a typing indicator at most this often while the user keeps typing
+const TYPING_RESEND_MS = 3000;
+// Hide a peer's indicator when no refresh arrives within this time
+const TYPING_EXPIRE_MS = 6000;
+
 const ChatContext = createContext<ChatContextType | undefined>(undefined);
 
 export function ChatProvider({ children }: { children: ReactNode }) {
-  const { token, user } = useAuth();
+  const { token, user, refreshAccessToken } = useAuth();
   const [recentChats, setRecentChats] = useState<ChatUser[]>([]);
   const [isLoadingChats, setIsLoadingChats] = useState(true);
   const [wsConnected, setWsConnected] = useState(false);
+  const [onlineUsers, setOnlineUsers] = useState<Set<number>>(new Set());
+  const [typingUsers, setTypingUsers] = useState<Set<number>>(new Set());
 
   // WebSocket refs and state
   const websocketRef = useRef<WebSocket | null>(null);
@@ -40,6 +51,13 @@ export function ChatProvider({ children }: { children: ReactNode }) {
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null);
   const reconnectAttemptsRef = useRef(0);
   const maxReconnectAttempts = 5;
+  // receiver_id -> when the last typing frame was sent to them
+  const typingSentAtRef = useRef<Map<number, number>>(new Map());
+  // sender_id -> timer that hides their typing indicator
+  const typingTimeoutsRef = useRef<Map<number, NodeJS.Timeout>>(new Map());
+  // Latest access token; renewing it must not reopen the socket
+  const tokenRef = useRef(token);
+  tokenRef.current = token;
 
   const fetchRecentChats = async () => {
     if (!token) {
@@ -58,8 +76,30 @@ export function ChatProvider({ children }: { children: ReactNode }) {
     }
   };
 
+  const setUserTyping = useCallback((senderId: number, isTyping: boolean) => {
+    const timeouts = typingTimeoutsRef.current;
+    const timeout = timeouts.get(senderId);
+    if (timeout) clearTimeout(timeout);
+    timeouts.delete(senderId);
+
+    if (isTyping) {
+      timeouts.set(
+        senderId,
+        setTimeout(() => setUserTyping(senderId, false), TYPING_EXPIRE_MS),
+      );
+    }
+    setTypingUsers((prev) => {
+      if (prev.has(senderId) === isTyping) return prev;
+      const next = new Set(prev);
+      if (isTyping) next.add(senderId);
+      else next.delete(senderId);
+      return next;
+    });
+  }, []);
+
   // WebSocket connection management
   const connectWebSocket = useCallback(() => {
+    const token = tokenRef.current;
     if (!token || !user) return;
 
     // Don't create multiple connections
@@ -85,7 +125,30 @@ export function ChatProvider({ children }: { children: ReactNode }) {
       try {
         const data = JSON.parse(event.data);
 
-        if (data.type === 'new_message') {
+        if (data.type === 'ping') {
+          // Answer server heartbeats so the connection is not reaped
+          ws.send(JSON.stringify({ type: 'pong' }));
+        } else if (data.type === 'reauth_required') {
+          // The socket's token is about to expire: renew it in band
+          refreshAccessToken().then((newToken) => {
+            if (newToken && ws.readyState === WebSocket.OPEN) {
+              ws.send(JSON.stringify({ type: 'reauth', token: newToken }));
+            }
+          });
+        } else if (data.type === 'reauth_failed') {
+          console.error('WebSocket reauth failed:', data.error);
+        } else if (data.type === 'presence') {
+          // Both the subscription snapshot and later deltas
+          const { online = [], offline = [] } = data.data;
+          setOnlineUsers((prev) => {
+            const next = new Set(prev);
+            online.forEach((id: number) => next.add(id));
+            offline.forEach((id: number) => next.delete(id));
+            return next;
+          });
+        } else if (data.type === 'typing') {
+          setUserTyping(data.data.sender_id, data.data.is_typing);
+        } else if (data.type === 'new_message') {
           const receivedMessage: Message = {
             ...data.data,
             sender: data.data.sender || {
@@ -97,6 +160,9 @@ export function ChatProvider({ children }: { children: ReactNode }) {
             },
           };
 
+          // A message ends its sender's typing indicator
+          setUserTyping(receivedMessage.sender_id, false);
+
           // Notify all subscribers
           messageCallbacksRef.current.forEach((callback) => {
             callback(receivedMessage);
@@ -122,7 +188,7 @@ export function ChatProvider({ children }: { children: ReactNode }) {
       // Only attempt to reconnect if not manually closed and user is still authenticated
       if (
         event.code !== 1000 &&
-        token &&
+        tokenRef.current &&
         user &&
         reconnectAttemptsRef.current < maxReconnectAttempts
       ) {
@@ -146,7 +212,7 @@ export function ChatProvider({ children }: { children: ReactNode }) {
     };
 
     return ws;
-  }, [token, user]);
+  }, [user]);
 
   // Disconnect WebSocket
   const disconnectWebSocket = useCallback(() => {
@@ -162,6 +228,12 @@ export function ChatProvider({ children }: { children: ReactNode }) {
 
     setWsConnected(false);
     reconnectAttemptsRef.current = 0;
+
+    typingTimeoutsRef.current.forEach((timeout) => clearTimeout(timeout));
+    typingTimeoutsRef.current.clear();
+    typingSentAtRef.current.clear();
+    setTypingUsers(new Set());
+    setOnlineUsers(new Set());
   }, []);
 
   // Send message via WebSocket
@@ -191,6 +263,29 @@ export function ChatProvider({ children }: { children: ReactNode }) {
     [],
   );
 
+  // Send a typing indicator, throttled while the user keeps typing
+  const sendTyping = useCallback((receiverId: number, isTyping: boolean) => {
+    const ws = websocketRef.current;
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+
+    const sentAt = typingSentAtRef.current;
+    const now = Date.now();
+    if (isTyping) {
+      if (now - (sentAt.get(receiverId) ?? 0) < TYPING_RESEND_MS) return;
+      sentAt.set(receiverId, now);
+    } else {
+      // Nothing to stop unless a start was sent
+      if (!sentAt.delete(receiverId)) return;
+    }
+    ws.send(
+      JSON.stringify({
+        type: 'typing',
+        receiver_id: receiverId,
+        is_typing: isTyping,
+      }),
+    );
+  }, []);
+
   // Subscribe to new messages
   const subscribeToMessages = useCallback(
     (callback: (message: Message) => void) => {
@@ -221,9 +316,10 @@ export function ChatProvider({ children }: { children: ReactNode }) {
     };
   }, [wsConnected, token, user, connectWebSocket]);
 
-  // Connect WebSocket when user is authenticated
+  // Connect WebSocket when user is authenticated; a renewed token is sent
+  // over the open socket instead
   useEffect(() => {
-    if (token && user) {
+    if (tokenRef.current && user) {
       connectWebSocket();
     } else {
       disconnectWebSocket();
@@ -232,7 +328,30 @@ export function ChatProvider({ children }: { children: ReactNode }) {
     return () => {
       disconnectWebSocket();
     };
-  }, [token, user]);
+  }, [user]);
+
+  // Watch the presence of recent chat partners; the server replaces the
+  // previous subscription, so only resubscribe when the set of ids changes
+  const recentChatIds = useMemo(
+    () =>
+      recentChats
+        .map((chat) => chat.id)
+        .sort((a, b) => a - b)
+        .join(','),
+    [recentChats],
+  );
+
+  useEffect(() => {
+    const ws = websocketRef.current;
+    if (!wsConnected || !ws || ws.readyState !== WebSocket.OPEN) return;
+
+    ws.send(
+      JSON.stringify({
+        type: 'presence_subscribe',
+        user_ids: recentChatIds ? recentChatIds.split(',').map(Number) : [],
+      }),
+    );
+  }, [wsConnected, recentChatIds]);
 
   // Fetch recent chats when token changes
   useEffect(() => {
@@ -271,9 +390,12 @@ export function ChatProvider({ children }: { children: ReactNode }) {
         recentChats,
         isLoadingChats,
         wsConnected,
+        onlineUsers,
         addToRecentChats,
         refreshRecentChats,
         sendMessage,
+        typingUsers,
+        sendTyping,
         subscribeToMessages,
       }}
     >
@@ -1,3 +1,5 @@
+import { MessagePage } from '@/lib/types';
+
 // Determine the appropriate API URL
 const getApiBaseUrl = (): string => {
   return process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
@@ -70,8 +72,8 @@ export { getApiBaseUrl, getWsBaseUrl };
 
 // Helper functions for common API operations
 export const getDirectMessages = (otherUserId: number, token: string) => {
-  return apiFetch<any[]>(
-    `/direct-messages/?other_user_id=${otherUserId}`,
+  return apiFetch<MessagePage>(
+    `/direct-messages/?other_user_id=${otherUserId}&latest=true`,
     { method: 'GET' },
     token,
   );
@@ -92,6 +94,14 @@ export const sendDirectMessage = (
   );
 };
 
+export const getMessageContent = (messageId: number, token: string) => {
+  return apiFetch<{ id: number; content: string }>(
+    `/direct-messages/${messageId}/content`,
+    { method: 'GET' },
+    token,
+  );
+};
+
 export const markMessageAsRead = (messageId: number, token: string) => {
   return apiFetch<any>(
     `/direct-messages/${messageId}/read`,
@@ -15,8 +15,17 @@ export interface Message {
   sender_id: number;
   receiver_id: number;
   is_read: boolean;
+  // Set when `content` is only a preview; the full text is at
+  // GET /direct-messages/{id}/content
+  truncated?: boolean;
+  content_bytes?: number | null;
   sender?: ChatUser;
 }
+
+export interface MessagePage {
+  users: Record<number, ChatUser>;
+  messages: Message[];
+}
 export interface SearchUser {
   id: number;
   username: string;